@@ -0,0 +1,202 @@
+"""
+Bulk expert invitations
+
+Invites a cohort of experts from CSV (``email,expertise`` columns) or JSON
+(a list of ``{"email": ..., "expertise": ...}`` objects). Rows are handled
+in chunks of ``CHUNK_SIZE``. For each chunk:
+
+1. Every row is validated. The email is lower-cased, and ``expertise``
+   may be the choice key or its label.
+2. One query finds emails that already have an account, and one query
+   finds emails that already have an active invitation.
+3. Invitations for the remaining rows are created with one
+   ``bulk_create``, and their emails are queued in the outbox with one
+   insert.
+
+``invite_experts`` yields one ``InviteResult`` per input row as soon as
+its chunk is done, so the endpoint and the command can stream the report
+while the rest of the file is still being processed.
+"""
+import csv
+import io
+import json
+import uuid
+from datetime import timedelta
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from .models import ExpertInvitation, ExpertProfile, User
+from .outbox import enqueue_many
+
+CHUNK_SIZE = 1000
+INVITATION_TTL = timedelta(hours=24)
+REPORT_FIELDS = ['row', 'email', 'expertise', 'status', 'detail']
+
+EXPERTISE_KEYS = {key: key for key, _ in ExpertProfile.EXPERTISE_CHOICES}
+EXPERTISE_KEYS.update({label.lower(): key for key, label in ExpertProfile.EXPERTISE_CHOICES})
+
+
+class InviteRow(NamedTuple):
+    row: int
+    email: str
+    expertise: str
+
+
+class InviteResult(NamedTuple):
+    row: int
+    email: str
+    expertise: str
+    status: str  # invited, existing_user, already_invited, duplicate or invalid
+    detail: str = ''
+
+    def as_list(self) -> List:
+        return [self.row, self.email, self.expertise, self.status, self.detail]
+
+
+class InviteFileError(ValueError):
+    """The upload could not be read as invitation rows at all"""
+
+
+def parse_csv(fh: Iterable[str], default_expertise: Optional[str] = None) -> Iterator[InviteRow]:
+    """Rows of a CSV with an ``email`` column and, unless defaulted, an ``expertise`` column"""
+    reader = csv.DictReader(fh)
+    fields = {(name or '').strip().lower(): name for name in reader.fieldnames or []}
+    if 'email' not in fields:
+        raise InviteFileError('The CSV needs an "email" column')
+    if 'expertise' not in fields and not default_expertise:
+        raise InviteFileError('The CSV needs an "expertise" column or a default expertise')
+
+    def rows():
+        for line, record in enumerate(reader, start=2):
+            expertise = record.get(fields['expertise']) if 'expertise' in fields else None
+            yield InviteRow(line, (record.get(fields['email']) or '').strip(),
+                            (expertise or '').strip() or default_expertise or '')
+    return rows()
+
+
+def parse_json(data, default_expertise: Optional[str] = None) -> Iterator[InviteRow]:
+    """Rows of a list of ``{"email", "expertise"}`` objects (or a ``{"invitations": [...]}`` wrapper)"""
+    if isinstance(data, (bytes, str)):
+        try:
+            data = json.loads(data)
+        except ValueError as e:
+            raise InviteFileError(f'Invalid JSON: {e}') from e
+    if isinstance(data, dict):
+        data = data.get('invitations')
+    if not isinstance(data, list):
+        raise InviteFileError('Expected a list of invitations')
+
+    def rows():
+        for index, item in enumerate(data, start=1):
+            if not isinstance(item, dict):
+                yield InviteRow(index, str(item), '')
+                continue
+            yield InviteRow(index, str(item.get('email') or '').strip(),
+                            str(item.get('expertise') or '').strip() or default_expertise or '')
+    return rows()
+
+
+def parse_upload(content: bytes, content_type: str = '', default_expertise: Optional[str] = None) -> Iterator[InviteRow]:
+    """Parse an uploaded file, as JSON when it looks like JSON and as CSV otherwise"""
+    try:
+        text = content.decode('utf-8-sig')
+    except UnicodeDecodeError as e:
+        raise InviteFileError('The file must be UTF-8 text') from e
+    if 'json' in content_type or text.lstrip()[:1] in ('[', '{'):
+        return parse_json(text, default_expertise)
+    return parse_csv(io.StringIO(text, newline=''), default_expertise)
+
+
+def chunked(rows: Iterable[InviteRow], size: int) -> Iterator[List[InviteRow]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def existing_emails(emails: List[str]) -> Dict[str, str]:
+    """email -> reason for every email that already has an account or a live invitation"""
+    found = {}
+    users = User.objects.annotate(email_lower=Lower('email')).filter(email_lower__in=emails)
+    for email in users.values_list('email_lower', flat=True):
+        found[email] = 'existing_user'
+    invited = ExpertInvitation.objects.annotate(email_lower=Lower('email')).filter(
+        email_lower__in=emails, is_used=False, expires_at__gt=timezone.now()
+    )
+    for email in invited.values_list('email_lower', flat=True):
+        found.setdefault(email, 'already_invited')
+    return found
+
+
+def invite_experts(rows: Iterable[InviteRow], invited_by: User, chunk_size: int = CHUNK_SIZE) -> Iterator[InviteResult]:
+    """Create invitations and queue their emails; yields one result per input row"""
+    seen = set()
+    for chunk in chunked(rows, chunk_size):
+        results = {}
+        candidates = []
+        for row in chunk:
+            email = row.email.lower()
+            expertise = EXPERTISE_KEYS.get(row.expertise.lower())
+            try:
+                validate_email(email)
+            except ValidationError:
+                results[row.row] = InviteResult(row.row, row.email, row.expertise, 'invalid', 'Invalid email address')
+                continue
+            if expertise is None:
+                results[row.row] = InviteResult(row.row, email, row.expertise, 'invalid', 'Unknown expertise')
+                continue
+            if email in seen:
+                results[row.row] = InviteResult(row.row, email, expertise, 'duplicate', 'Repeated in this upload')
+                continue
+            seen.add(email)
+            candidates.append(InviteRow(row.row, email, expertise))
+
+        existing = existing_emails([row.email for row in candidates]) if candidates else {}
+        expires_at = timezone.now() + INVITATION_TTL
+        invitations = []
+        for row in candidates:
+            if row.email in existing:
+                results[row.row] = InviteResult(row.row, row.email, row.expertise, existing[row.email])
+            else:
+                invitations.append(ExpertInvitation(
+                    email=row.email, expertise=row.expertise, invited_by=invited_by,
+                    token=uuid.uuid4().hex, expires_at=expires_at,
+                ))
+                results[row.row] = InviteResult(row.row, row.email, row.expertise, 'invited')
+
+        if invitations:
+            with transaction.atomic():
+                ExpertInvitation.objects.bulk_create(invitations, batch_size=chunk_size)
+                enqueue_many('expert_invitation', [
+                    (invitation.email, {
+                        'expertise': invitation.get_expertise_display(),
+                        'invite_url': invitation.invite_url,
+                    })
+                    for invitation in invitations
+                ])
+
+        for row in chunk:
+            yield results[row.row]
+
+
+def report_lines(results: Iterable[InviteResult]) -> Iterator[str]:
+    """The results as CSV text, one line at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(REPORT_FIELDS)
+    for result in results:
+        writer.writerow(result.as_list())
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.getvalue():
+        yield buffer.getvalue()
@@ -1,5 +1,4 @@
 import os
-from django.core.mail import send_mail
 from django.core.signing import TimestampSigner, SignatureExpired, BadSignature
 from django.conf import settings
 
@@ -26,16 +25,10 @@ def verify_invite_token(token):
 
 
 def send_invite_email(email, role='expert'):
-    """Send an invite email with a signed token link."""
+    """Queue an invite email with a signed token link."""
+    from .outbox import enqueue
+
     token = generate_invite_token(email)
     invite_url = f"{SITE_URL}/invite/accept/?token={token}"
-    subject = f"You're invited to join as an {role.capitalize()}"
-    message = f"Hello,\n\nYou have been invited to join as an {role}. Please click the link below to accept the invite and register your account.\n\n{invite_url}\n\nThis link will expire in 24 hours.\n\nIf you did not expect this invite, you can ignore this email."
-    send_mail(
-        subject,
-        message,
-        settings.DEFAULT_FROM_EMAIL,
-        [email],
-        fail_silently=False,
-    )
+    enqueue('invite', email, {'role': role, 'invite_url': invite_url})
     return invite_url
@@ -0,0 +1,48 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from accounts.bulk_invites import InviteFileError, invite_experts, parse_upload, report_lines
+from accounts.models import User
+
+
+class Command(BaseCommand):
+    help = "Invite a cohort of experts from a CSV (email,expertise) or JSON file and queue their emails"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSON file of invitations')
+        parser.add_argument('--invited-by', required=True, help='Username or email of the inviting admin')
+        parser.add_argument('--expertise', help='Expertise for rows that do not name one')
+        parser.add_argument('--report', help='Write the per-row report to this CSV file (default: stdout)')
+
+    def handle(self, *args, **options):
+        inviter = User.objects.filter(
+            Q(username=options['invited_by']) | Q(email__iexact=options['invited_by'])
+        ).first()
+        if inviter is None:
+            raise CommandError(f"No user {options['invited_by']}")
+        with open(options['path'], 'rb') as fh:
+            content = fh.read()
+        try:
+            rows = parse_upload(content, 'json' if options['path'].endswith('.json') else '', options['expertise'])
+        except InviteFileError as e:
+            raise CommandError(str(e))
+
+        counts = {}
+
+        def counted(results):
+            for result in results:
+                counts[result.status] = counts.get(result.status, 0) + 1
+                yield result
+
+        report = open(options['report'], 'w', newline='', encoding='utf-8') if options['report'] else sys.stdout
+        try:
+            for line in report_lines(counted(invite_experts(rows, inviter))):
+                report.write(line)
+        finally:
+            if report is not sys.stdout:
+                report.close()
+        self.stderr.write(self.style.SUCCESS(
+            ', '.join(f'{status}: {count}' for status, count in sorted(counts.items())) or 'No rows'
+        ))
@@ -5,6 +5,7 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.core.validators import RegexValidator
 from django.utils import timezone
+from django.conf import settings
 
 
 class User(AbstractUser):
@@ -128,6 +129,10 @@ class ExpertInvitation(models.Model):
     def is_valid(self):
         return not self.is_used and not self.is_expired()
     
+    @property
+    def invite_url(self):
+        return f"{settings.SITE_URL}/invite/expert/accept?token={self.token}"
+    
     def __str__(self):
         return f"Invitation for {self.email} - {self.get_expertise_display()}"
 
@@ -174,6 +179,41 @@ class Notification(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'is_read', '-created_at'], name='notif_user_read_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.title}"
+
+class OutboundEmail(models.Model):
+    """
+    Email waiting in the outbox; API requests only insert these and a Celery
+    worker renders and sends them (see accounts.outbox)
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    
+    template = models.CharField(max_length=50)
+    to_email = models.EmailField()
+    context = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # When a pending email is next due, or when a claim by a worker lapses
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_due_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.user.username} - {self.title}"
\ No newline at end of file
+        return f"{self.template} to {self.to_email} ({self.status})"
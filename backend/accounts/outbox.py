@@ -0,0 +1,264 @@
+"""
+Email outbox
+
+Views never talk to SMTP. ``enqueue`` and ``enqueue_many`` insert
+``OutboundEmail`` rows, and a Celery worker delivers them after the
+transaction commits:
+
+- Each batch of due rows is claimed with ``SKIP LOCKED``, so workers never
+  send the same email twice.
+- Each template is compiled once per batch. Emails with the same template
+  and the same context share one rendering.
+- A whole batch goes over one SMTP connection. The connection is reopened
+  only if the server drops it.
+- Temporary failures are retried with exponential backoff, up to
+  ``EMAIL_OUTBOX_MAX_ATTEMPTS``. Permanent (5xx) SMTP errors and rendering
+  errors fail at once.
+
+A claimed row that its worker never finished (``status='sending'`` past
+its lease) is picked up again by the next run.
+"""
+import json
+import logging
+import random
+import smtplib
+import time
+from datetime import timedelta
+from html import unescape
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.template import Context, Template
+from django.template.loader import get_template
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+KICK_CACHE_KEY = 'outbox:kick'
+
+
+class EmailTemplate(NamedTuple):
+    """``subject`` is a template string; ``text`` and ``html`` are template names"""
+    subject: str
+    text: Optional[str] = None
+    html: Optional[str] = None
+
+
+EMAIL_TEMPLATES: Dict[str, EmailTemplate] = {}
+
+
+def register(name: str, subject: str, text: Optional[str] = None, html: Optional[str] = None):
+    """Make a template available to ``enqueue``; without ``text`` the plain part is the stripped HTML"""
+    if not text and not html:
+        raise ValueError('An email template needs a text or an HTML body')
+    EMAIL_TEMPLATES[name] = EmailTemplate(subject, text, html)
+
+
+register('expert_invitation', 'Invitation to Join Mai-Guru Platform', text='accounts/email/expert_invitation.txt')
+register('invite', "You're invited to join as an {{ role|capfirst }}", text='accounts/email/invite.txt')
+register('expert_invite', "You've been invited to join as an Expert", text='accounts/email/expert_invite.txt')
+
+
+class PermanentFailure(Exception):
+    """The email can never be delivered as it stands"""
+
+
+# ---------------------------------------------------------------------------
+# API side
+# ---------------------------------------------------------------------------
+
+def enqueue(template: str, to_email: str, context: Optional[Dict] = None) -> OutboundEmail:
+    """Queue one email; it is sent once the current transaction commits"""
+    if template not in EMAIL_TEMPLATES:
+        raise KeyError(f'Unknown email template {template!r}')
+    email = OutboundEmail.objects.create(template=template, to_email=to_email, context=context or {})
+    transaction.on_commit(kick)
+    return email
+
+
+def enqueue_many(template: str, messages: Iterable[Tuple[str, Dict]]) -> int:
+    """Queue ``(to_email, context)`` pairs with one insert per ``EMAIL_OUTBOX_BATCH_SIZE``"""
+    if template not in EMAIL_TEMPLATES:
+        raise KeyError(f'Unknown email template {template!r}')
+    rows = [OutboundEmail(template=template, to_email=to, context=context or {}) for to, context in messages]
+    OutboundEmail.objects.bulk_create(rows, batch_size=settings.EMAIL_OUTBOX_BATCH_SIZE)
+    if rows:
+        transaction.on_commit(kick)
+    return len(rows)
+
+
+def kick():
+    """Start a delivery run unless one was started in the last few seconds"""
+    from .tasks import deliver_outbox
+
+    if cache.add(KICK_CACHE_KEY, True, timeout=settings.EMAIL_OUTBOX_KICK_SECONDS):
+        try:
+            deliver_outbox.delay()
+        except Exception:
+            # The beat sweep will deliver it
+            logger.exception("Could not queue outbox delivery")
+
+
+# ---------------------------------------------------------------------------
+# Worker side
+# ---------------------------------------------------------------------------
+
+def claim(limit: int) -> List[OutboundEmail]:
+    """Lease up to ``limit`` due emails to this worker"""
+    now = timezone.now()
+    due = Q(status='pending') | Q(status='sending')
+    with transaction.atomic():
+        ids = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(due, next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        lease = now + timedelta(seconds=settings.EMAIL_OUTBOX_LEASE_SECONDS)
+        OutboundEmail.objects.filter(id__in=ids).update(status='sending', next_attempt_at=lease)
+    return list(OutboundEmail.objects.filter(id__in=ids))
+
+
+_subjects: Dict[str, Template] = {}
+
+
+class Renderer:
+    """Renders one batch, compiling each template and rendering each distinct context once"""
+
+    def __init__(self):
+        self._templates = {}
+        self._rendered = {}
+
+    def _template(self, name):
+        if name not in self._templates:
+            self._templates[name] = get_template(name)
+        return self._templates[name]
+
+    def render(self, email: OutboundEmail) -> Tuple[str, str, Optional[str]]:
+        spec = EMAIL_TEMPLATES.get(email.template)
+        if spec is None:
+            raise PermanentFailure(f'Unknown email template {email.template!r}')
+        key = (email.template, json.dumps(email.context, sort_keys=True, default=str))
+        if key not in self._rendered:
+            subject = _subjects.get(spec.subject)
+            if subject is None:
+                subject = _subjects[spec.subject] = Template(spec.subject)
+            html = self._template(spec.html).render(email.context) if spec.html else None
+            text = self._template(spec.text).render(email.context) if spec.text else unescape(strip_tags(html))
+            subject = ' '.join(subject.render(Context(email.context)).split())
+            self._rendered[key] = (subject, text, html)
+        return self._rendered[key]
+
+
+def build_message(email: OutboundEmail, renderer: Renderer, connection) -> EmailMultiAlternatives:
+    try:
+        subject, text, html = renderer.render(email)
+    except PermanentFailure:
+        raise
+    except Exception as e:
+        raise PermanentFailure(f'Rendering failed: {e}') from e
+    message = EmailMultiAlternatives(subject, text, settings.DEFAULT_FROM_EMAIL, [email.to_email],
+                                     connection=connection)
+    if html:
+        message.attach_alternative(html, 'text/html')
+    return message
+
+
+def retry_at(attempts: int):
+    """Exponential backoff with jitter, capped at ``EMAIL_OUTBOX_RETRY_BACKOFF_MAX``"""
+    delay = min(settings.EMAIL_OUTBOX_RETRY_BACKOFF * (2 ** (attempts - 1)), settings.EMAIL_OUTBOX_RETRY_BACKOFF_MAX)
+    return timezone.now() + timedelta(seconds=delay + random.uniform(0, delay / 4))
+
+
+def send_one(connection, message):
+    """Send over the open connection, reconnecting once if the server hung up"""
+    try:
+        sent = connection.send_messages([message])
+    except smtplib.SMTPServerDisconnected:
+        connection.close()
+        connection.open()
+        sent = connection.send_messages([message])
+    except smtplib.SMTPRecipientsRefused as e:
+        raise PermanentFailure(str(e)) from e
+    except smtplib.SMTPResponseException as e:
+        if e.smtp_code >= 500:
+            raise PermanentFailure(str(e)) from e
+        raise
+    if not sent:
+        raise smtplib.SMTPException('The connection did not send the message')
+
+
+def deliver_batch(limit: Optional[int] = None) -> Dict[str, int]:
+    """Send one claimed batch over a single connection; returns counts per outcome"""
+    emails = claim(limit or settings.EMAIL_OUTBOX_BATCH_SIZE)
+    counts = {'sent': 0, 'retry': 0, 'failed': 0}
+    if not emails:
+        return counts
+
+    renderer = Renderer()
+    connection = get_connection(fail_silently=False)
+    now = timezone.now()
+    try:
+        connection.open()
+    except Exception as e:
+        # Nothing was sent; hand the whole batch back for a later attempt
+        logger.warning("Could not connect to the mail server: %s", e)
+        for email in emails:
+            email.attempts += 1
+            mark_failure(email, str(e), permanent=False)
+            counts['failed' if email.status == 'failed' else 'retry'] += 1
+        OutboundEmail.objects.bulk_update(emails, ['status', 'attempts', 'next_attempt_at', 'last_error'])
+        return counts
+
+    try:
+        for email in emails:
+            email.attempts += 1
+            try:
+                send_one(connection, build_message(email, renderer, connection))
+            except PermanentFailure as e:
+                mark_failure(email, str(e), permanent=True)
+            except Exception as e:
+                mark_failure(email, str(e), permanent=False)
+            else:
+                email.status = 'sent'
+                email.sent_at = now
+                email.last_error = ''
+            counts[{'sent': 'sent', 'pending': 'retry', 'failed': 'failed'}[email.status]] += 1
+    finally:
+        connection.close()
+        OutboundEmail.objects.bulk_update(
+            emails, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'],
+        )
+    return counts
+
+
+def mark_failure(email: OutboundEmail, error: str, permanent: bool):
+    email.last_error = error[:2000]
+    if permanent or email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.status = 'failed'
+        logger.warning("Giving up on email %s to %s: %s", email.pk, email.to_email, error)
+    else:
+        email.status = 'pending'
+        email.next_attempt_at = retry_at(email.attempts)
+
+
+def deliver_due(time_budget: Optional[float] = None) -> Dict[str, int]:
+    """Deliver batches until nothing is due or ``time_budget`` seconds have passed"""
+    deadline = time.monotonic() + (time_budget or settings.EMAIL_OUTBOX_RUN_SECONDS)
+    totals = {'sent': 0, 'retry': 0, 'failed': 0}
+    while time.monotonic() < deadline:
+        counts = deliver_batch()
+        for outcome, count in counts.items():
+            totals[outcome] += count
+        if not any(counts.values()):
+            break
+    return totals
@@ -0,0 +1,19 @@
+"""
+Celery tasks for the accounts app
+"""
+import logging
+
+from celery import shared_task
+
+from .outbox import deliver_due
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name='accounts.tasks.deliver_outbox')
+def deliver_outbox():
+    """Send due outbox emails (see accounts.outbox); also run by beat as a sweep"""
+    counts = deliver_due()
+    if any(counts.values()):
+        logger.info("Outbox delivery: %s", counts)
+    return counts
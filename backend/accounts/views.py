@@ -8,13 +8,15 @@ from rest_framework.views import APIView
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth import get_user_model
-from django.core.mail import send_mail
-from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from datetime import timedelta
 import uuid
 
 from .models import User, ExpertInvitation, Notification
+from .outbox import enqueue
+from realtime import unread
+from .bulk_invites import InviteFileError, invite_experts, parse_json, parse_upload, report_lines
 from .serializers import (
     ClientRegistrationSerializer, ExpertRegistrationSerializer,
     UserSerializer, ClientProfileSerializer, ExpertProfileSerializer,
@@ -91,6 +93,14 @@ class ExpertRegistrationView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def send_invitation_email(invitation):
+    """Queue the invitation email; the outbox worker sends it"""
+    enqueue('expert_invitation', invitation.email, {
+        'expertise': invitation.get_expertise_display(),
+        'invite_url': invitation.invite_url,
+    })
+
+
 class ExpertInvitationViewSet(viewsets.ModelViewSet):
     """ViewSet for Expert Invitations"""
     queryset = ExpertInvitation.objects.all()
@@ -108,18 +118,7 @@ class ExpertInvitationViewSet(viewsets.ModelViewSet):
         expires = timezone.now() + timedelta(hours=24)
         instance = serializer.save(invited_by=self.request.user, token=token, expires_at=expires)
 
-        invite_url = f"{settings.SITE_URL}/invite/expert/accept?token={instance.token}"
-        send_mail(
-            subject='Invitation to Join Mai-Guru Platform',
-            message=(
-                f"You have been invited to join Mai-Guru as an expert in {instance.get_expertise_display()}.\n\n"
-                f"Click the link below to accept the invitation (expires in 24 hours):\n{invite_url}\n\n"
-                "Best regards,\nMai-Guru Team"
-            ),
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[instance.email],
-            fail_silently=False,
-        )
+        send_invitation_email(instance)
 
     @action(detail=True, methods=['post'])
     def resend(self, request, pk=None):
@@ -130,20 +129,34 @@ class ExpertInvitationViewSet(viewsets.ModelViewSet):
             instance.token = uuid.uuid4().hex
             instance.expires_at = timezone.now() + timedelta(hours=24)
             instance.save(update_fields=['token', 'expires_at'])
-        invite_url = f"{settings.SITE_URL}/invite/expert/accept?token={instance.token}"
-        send_mail(
-            subject='Invitation to Join Mai-Guru Platform',
-            message=(
-                f"You have been invited to join Mai-Guru as an expert in {instance.get_expertise_display()}.\n\n"
-                f"Click the link below to accept the invitation (expires in 24 hours):\n{invite_url}\n\n"
-                "Best regards,\nMai-Guru Team"
-            ),
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[instance.email],
-            fail_silently=False,
-        )
+        send_invitation_email(instance)
         return Response({'message': 'Invitation email sent'})
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Invite a cohort from a CSV or JSON upload (``file``), a JSON body or a
+        ``text/csv`` body; streams back a CSV report with one line per row
+        """
+        if not (hasattr(request.user, 'is_admin') and request.user.is_admin()):
+            return Response({'error': 'Only admins can bulk invite experts'}, status=status.HTTP_403_FORBIDDEN)
+        default_expertise = request.query_params.get('expertise')
+        try:
+            if request.content_type.startswith('text/csv'):
+                rows = parse_upload(request.body, 'text/csv', default_expertise)
+            elif 'file' in request.FILES:
+                upload = request.FILES['file']
+                rows = parse_upload(upload.read(), upload.content_type or '', default_expertise)
+            else:
+                rows = parse_json(request.data, request.data.get('expertise', default_expertise)
+                                  if isinstance(request.data, dict) else default_expertise)
+        except InviteFileError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(report_lines(invite_experts(rows, request.user)), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="invitations.csv"'
+        return response
+
 
 class ExpertInviteAcceptView(APIView):
     """Accept expert invite using token and set password"""
@@ -226,12 +239,17 @@ class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
     def mark_read(self, request, pk=None):
         """Mark notification as read"""
         notification = self.get_object()
-        notification.is_read = True
-        notification.save()
+        unread.mark_read(self.get_queryset().filter(pk=notification.pk), 'notifications', request.user.pk)
         return Response({'message': 'Notification marked as read'})
 
     @action(detail=False, methods=['post'])
     def mark_all_read(self, request):
         """Mark all notifications as read"""
-        Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
-        return Response({'message': 'All notifications marked as read'})
+        marked = unread.mark_read(self.get_queryset(), 'notifications', request.user.pk)
+        return Response({'message': 'All notifications marked as read', 'marked': marked})
+
+    @action(detail=False, methods=['get'])
+    def unread_counts(self, request):
+        """Unread badge counts, read from the counter cache"""
+        counts = unread.unread_counts(request.user.pk)
+        return Response({**counts, 'total': sum(counts.values())})
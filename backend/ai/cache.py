@@ -0,0 +1,169 @@
+"""
+Response cache for repeated chatbot questions
+
+Answers to first-turn questions are cached per process, keyed on the
+normalised question text and the session type. When there is no exact hit,
+the closest cached question of the same session type is found by cosine
+similarity over character trigram counts, and reused if it clears
+``AI_RESPONSE_CACHE_SIMILARITY``. Entries expire after ``AI_RESPONSE_CACHE_TTL``
+seconds and the least recently used entry is evicted once
+``AI_RESPONSE_CACHE_MAX_ENTRIES`` is reached.
+"""
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+NON_WORD_RE = re.compile(r'[^a-z0-9 ]+')
+SPACE_RE = re.compile(r'\s+')
+
+
+def normalize_prompt(text: str) -> str:
+    """Lower-case, drop punctuation and collapse whitespace"""
+    text = NON_WORD_RE.sub(' ', (text or '').lower())
+    return SPACE_RE.sub(' ', text).strip()
+
+
+def trigram_vector(text: str) -> Counter:
+    padded = f'  {text} '
+    return Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def cosine(a: Counter, b: Counter, norm_a: float, norm_b: float) -> float:
+    if not norm_a or not norm_b:
+        return 0.0
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(count * b[gram] for gram, count in a.items() if gram in b) / (norm_a * norm_b)
+
+
+class CacheEntry:
+    __slots__ = ('response', 'vector', 'norm', 'expires_at')
+
+    def __init__(self, response: str, vector: Counter, expires_at: float):
+        self.response = response
+        self.vector = vector
+        self.norm = math.sqrt(sum(c * c for c in vector.values()))
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    """Thread-safe LRU + TTL cache of model answers with trigram similarity lookup"""
+
+    def __init__(self, max_entries: int = 512, ttl: int = 3600, similarity: Optional[float] = 0.9):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    def get(self, namespace: str, prompt: str) -> Optional[str]:
+        text = normalize_prompt(prompt)
+        if not text:
+            return None
+        key = (namespace, text)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.response
+            if entry is not None:
+                del self._entries[key]
+
+            match = self._closest(namespace, text, now) if self.similarity else None
+            if match is not None:
+                self._entries.move_to_end(match)
+                self.similar_hits += 1
+                return self._entries[match].response
+
+            self.misses += 1
+            return None
+
+    def set(self, namespace: str, prompt: str, response: str):
+        text = normalize_prompt(prompt)
+        if not text or not response:
+            return
+        key = (namespace, text)
+        entry = CacheEntry(response, trigram_vector(text), time.monotonic() + self.ttl)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _closest(self, namespace, text, now):
+        vector = trigram_vector(text)
+        norm = math.sqrt(sum(c * c for c in vector.values()))
+        best_key, best_score = None, self.similarity
+        expired = []
+        for key, entry in self._entries.items():
+            if key[0] != namespace:
+                continue
+            if entry.expires_at <= now:
+                expired.append(key)
+                continue
+            score = cosine(vector, entry.vector, norm, entry.norm)
+            if score >= best_score:
+                best_key, best_score = key, score
+        for key in expired:
+            del self._entries[key]
+        return best_key
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.similar_hits = self.misses = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.similar_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'similar_hits': self.similar_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.similar_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Process-wide cache configured from settings"""
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache(
+                    max_entries=settings.AI_RESPONSE_CACHE_MAX_ENTRIES,
+                    ttl=settings.AI_RESPONSE_CACHE_TTL,
+                    similarity=settings.AI_RESPONSE_CACHE_SIMILARITY or None,
+                )
+    return _response_cache
+
+
+def cacheable_prompt(messages: List[Dict], session_type: str) -> Optional[str]:
+    """
+    The question to cache on, or None when the exchange should not be cached.
+
+    Only opening questions in the configured session types qualify; later
+    turns depend on the conversation so far.
+    """
+    if not settings.AI_RESPONSE_CACHE_ENABLED:
+        return None
+    if session_type not in settings.AI_RESPONSE_CACHE_SESSION_TYPES:
+        return None
+    if len(messages) != 1 or messages[0].get('role') != 'user':
+        return None
+    return messages[0].get('content') or None
@@ -1,7 +1,14 @@
+import asyncio
+import logging
 import os
 import openai
 from django.conf import settings
 
+from .cache import cacheable_prompt, get_response_cache
+from .clients import chat_completion
+
+logger = logging.getLogger(__name__)
+
 class AIBotService:
     """Service for handling AI chatbot interactions"""
     
@@ -21,6 +28,16 @@ class AIBotService:
             but understandable."""
         }
 
+    def build_messages(self, message, user_type='client'):
+        """Build the prompt for a single chatbot turn"""
+        context = dict(self.context)
+        if user_type in ['expert', 'admin']:
+            context["content"] += """
+            For experts and admins, provide more technical and detailed responses.
+            Include specific tools, frameworks, and methodologies when relevant.
+            """
+        return [context, {"role": "user", "content": message}]
+
     def get_chatbot_response(self, message, user_type='client'):
         """
         Get AI response using OpenAI's API
@@ -33,16 +50,7 @@ class AIBotService:
             str: AI's response
         """
         try:
-            messages = [
-                self.context,
-                {"role": "user", "content": message}
-            ]
-            
-            if user_type in ['expert', 'admin']:
-                messages[0]["content"] += """
-                For experts and admins, provide more technical and detailed responses.
-                Include specific tools, frameworks, and methodologies when relevant.
-                """
+            messages = self.build_messages(message, user_type)
             
             response = openai.ChatCompletion.create(
                 model="gpt-3.5-turbo",
@@ -59,6 +67,40 @@ class AIBotService:
             # Log the error in production
             return f"I apologize, but I'm having trouble processing your request. Please try again later. Error: {str(e)}"
 
+    async def aget_chatbot_response(self, message, user_type='client'):
+        """
+        Async variant of ``get_chatbot_response``
+        
+        Uses the pooled client from ``ai.clients`` so the worker can serve
+        other requests while waiting on the model.
+        """
+        # The chatbot prompt varies by user type, so each gets its own namespace
+        namespace = f'chatbot:{user_type}'
+        prompt = cacheable_prompt([{"role": "user", "content": message}], 'general_inquiry')
+        if prompt is not None:
+            cached = get_response_cache().get(namespace, prompt)
+            if cached is not None:
+                return cached
+        
+        try:
+            result = await chat_completion(
+                self.build_messages(message, user_type),
+                temperature=0.7,
+                max_tokens=150,
+                top_p=1.0,
+                frequency_penalty=0.0,
+                presence_penalty=0.0
+            )
+            if prompt is not None:
+                get_response_cache().set(namespace, prompt, result.content)
+            return result.content
+        except asyncio.TimeoutError:
+            logger.error("Chatbot request timed out after %ss", settings.OPENAI_TIMEOUT)
+            return "I apologize, but the assistant is taking too long to respond. Please try again later."
+        except Exception as e:
+            logger.error(f"Chatbot error: {str(e)}")
+            return "I apologize, but I'm having trouble processing your request. Please try again later."
+
     def suggest_price(self, task_details):
         """
         Suggest a price range for a task based on its details
@@ -0,0 +1,153 @@
+"""
+Shared async OpenAI client
+
+One ``AsyncOpenAI`` client (and its pooled ``httpx.AsyncClient``) is kept per
+event loop, so keep-alive connections are reused across requests when the
+project is served over ASGI. A semaphore caps the number of in-flight model
+calls per loop and every call is bounded by ``OPENAI_TIMEOUT``, which covers
+both the wait for a free slot and the HTTP round trip.
+"""
+import asyncio
+import logging
+import weakref
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+import openai
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = 'gpt-3.5-turbo'
+
+_clients = weakref.WeakKeyDictionary()
+
+
+class ChatCompletionResult:
+    """Text and token usage of a single chat completion"""
+
+    __slots__ = ('content', 'tokens_used')
+
+    def __init__(self, content: str, tokens_used: int):
+        self.content = content
+        self.tokens_used = tokens_used
+
+
+def _build_client():
+    timeout = settings.OPENAI_TIMEOUT
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.OPENAI_MAX_CONNECTIONS,
+        ),
+        timeout=httpx.Timeout(timeout, connect=min(timeout, 5.0)),
+    )
+    client = openai.AsyncOpenAI(
+        api_key=settings.OPENAI_API_KEY or 'missing',
+        base_url=settings.OPENAI_BASE_URL or None,
+        max_retries=settings.OPENAI_MAX_RETRIES,
+        http_client=http_client,
+    )
+    return client, asyncio.Semaphore(settings.OPENAI_MAX_CONCURRENCY)
+
+
+def get_async_client():
+    """Return the ``(client, semaphore)`` pair bound to the running event loop"""
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(loop)
+    if entry is None:
+        entry = _build_client()
+        _clients[loop] = entry
+    return entry
+
+
+async def close_async_client():
+    """Close the pooled connections of the running loop's client"""
+    entry = _clients.pop(asyncio.get_running_loop(), None)
+    if entry is not None:
+        await entry[0].close()
+
+
+async def _create(messages, model, max_tokens, temperature, extra):
+    client, semaphore = get_async_client()
+    async with semaphore:
+        response = await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            **extra,
+        )
+    usage = response.usage.total_tokens if response.usage else 0
+    return ChatCompletionResult(response.choices[0].message.content or '', usage)
+
+
+async def chat_completion(messages: List[Dict], *, model: str = DEFAULT_MODEL, max_tokens: int = 500,
+                          temperature: float = 0.7, timeout: Optional[float] = None,
+                          **extra) -> ChatCompletionResult:
+    """
+    Run one chat completion on the pooled client
+
+    Raises ``asyncio.TimeoutError`` when the call (including the wait for a
+    concurrency slot) takes longer than ``timeout`` seconds, and the usual
+    ``openai.OpenAIError`` subclasses for API failures.
+    """
+    if timeout is None:
+        timeout = settings.OPENAI_TIMEOUT
+    return await asyncio.wait_for(
+        _create(messages, model, max_tokens, temperature, extra),
+        timeout=timeout,
+    )
+
+
+async def chat_completions(batch: List[List[Dict]], **kwargs) -> List:
+    """
+    Run several chat completions concurrently
+
+    Results come back in input order; a failed call yields its exception
+    instead of a ``ChatCompletionResult`` so one bad prompt does not sink the batch.
+    """
+    return await asyncio.gather(
+        *(chat_completion(messages, **kwargs) for messages in batch),
+        return_exceptions=True,
+    )
+
+
+async def stream_chat_completion(messages: List[Dict], *, model: str = DEFAULT_MODEL, max_tokens: int = 500,
+                                 temperature: float = 0.7, timeout: Optional[float] = None,
+                                 **extra) -> AsyncIterator[str]:
+    """
+    Yield the content deltas of a streamed chat completion as they arrive
+
+    ``timeout`` bounds the wait for a concurrency slot, the wait for the
+    stream to open and every gap between chunks, rather than the whole
+    generation. The slot is held until the stream is exhausted or closed.
+    """
+    if timeout is None:
+        timeout = settings.OPENAI_TIMEOUT
+    client, semaphore = get_async_client()
+    await asyncio.wait_for(semaphore.acquire(), timeout=timeout)
+    try:
+        stream = await asyncio.wait_for(
+            client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+                **extra,
+            ),
+            timeout=timeout,
+        )
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(stream.__anext__(), timeout=timeout)
+                except StopAsyncIteration:
+                    break
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.response.aclose()
+    finally:
+        semaphore.release()
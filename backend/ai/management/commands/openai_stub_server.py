@@ -0,0 +1,122 @@
+import json
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Fakes ``POST /v1/chat/completions`` with a canned reply"""
+
+    delay = 0.0
+    chunk_delay = 0.05
+    reply = 'This is a stub reply.'
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self.send_json(400, {'error': {'message': 'Invalid JSON body'}})
+
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            return self.send_json(404, {'error': {'message': f'Unknown path {self.path}'}})
+
+        if self.delay:
+            time.sleep(self.delay)
+
+        if payload.get('stream'):
+            return self.send_stream(payload)
+
+        prompt_tokens = sum(len(str(m.get('content', '')).split()) for m in payload.get('messages', []))
+        completion_tokens = len(self.reply.split())
+        self.send_json(200, {
+            'id': f'chatcmpl-{uuid.uuid4().hex}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': payload.get('model', 'stub'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': self.reply},
+                'finish_reason': 'stop',
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens,
+            },
+        })
+
+    def send_stream(self, payload):
+        """Send the reply word by word as ``chat.completion.chunk`` events"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        completion_id = f'chatcmpl-{uuid.uuid4().hex}'
+        words = self.reply.split(' ')
+        for index, word in enumerate(words):
+            content = word if index == 0 else f' {word}'
+            self.write_chunk('data: ' + json.dumps({
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': payload.get('model', 'stub'),
+                'choices': [{'index': 0, 'delta': {'content': content}, 'finish_reason': None}],
+            }) + '\n\n')
+            if self.chunk_delay:
+                time.sleep(self.chunk_delay)
+        self.write_chunk('data: [DONE]\n\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    requires_system_checks = []
+    help = (
+        "Run a local server that fakes the OpenAI chat completions endpoint. "
+        "Point OPENAI_BASE_URL at http://<host>:<port>/v1 to use it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--delay', type=float, default=0.0, help='Seconds to wait before answering')
+        parser.add_argument('--chunk-delay', type=float, default=StubHandler.chunk_delay,
+                            help='Seconds between chunks of a streamed reply')
+        parser.add_argument('--reply', default=StubHandler.reply, help='Assistant message to return')
+
+    def handle(self, *args, **options):
+        handler = type('ConfiguredStubHandler', (StubHandler,), {
+            'delay': options['delay'],
+            'chunk_delay': options['chunk_delay'],
+            'reply': options['reply'],
+        })
+        server = ThreadingHTTPServer((options['host'], options['port']), handler)
+        self.stdout.write(self.style.SUCCESS(
+            f"OpenAI stub listening on http://{options['host']}:{options['port']}/v1"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
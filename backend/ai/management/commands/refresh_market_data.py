@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from ai.market_data import FixtureSource, get_sources, rebuild_snapshots, refresh_market_data
+
+
+class Command(BaseCommand):
+    help = "Refresh stored market data and the precomputed price suggestion snapshots"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fixture', nargs='?', const='', default=None,
+                            help='Read listings from a JSON fixture instead of the configured sources '
+                                 '(defaults to MARKET_DATA_FIXTURE)')
+        parser.add_argument('--snapshots-only', action='store_true',
+                            help='Only rebuild the cached snapshots from stored rows')
+
+    def handle(self, *args, **options):
+        if options['snapshots_only']:
+            snapshots = rebuild_snapshots()
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {len(snapshots)} snapshots'))
+            return
+
+        if options['fixture'] is not None:
+            sources = [FixtureSource(options['fixture'] or None)]
+        else:
+            sources = get_sources()
+        rows = refresh_market_data(sources=sources)
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {rows} rows from {', '.join(s.platform for s in sources)}"
+        ))
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ai.pricing_model import PriceModelError, train_from_tasks
+
+
+class Command(BaseCommand):
+    help = "Fit the price suggestion model on completed tasks and save it to PRICE_MODEL_PATH"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None, help='Where to write the model (defaults to PRICE_MODEL_PATH)')
+
+    def handle(self, *args, **options):
+        try:
+            model = train_from_tasks()
+        except PriceModelError as e:
+            raise CommandError(str(e))
+
+        path = options['output'] or settings.PRICE_MODEL_PATH
+        model.save(path)
+        self.stdout.write(self.style.SUCCESS(
+            f'Trained on {model.n_samples} tasks (quantiles {", ".join(str(q) for q in model.quantiles)}); '
+            f'saved to {path}. Restart workers to load it.'
+        ))
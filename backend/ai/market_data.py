@@ -0,0 +1,263 @@
+"""
+Market price data for price suggestions
+
+A periodic job (``ai.tasks.refresh_market_data``) pulls listings from every
+configured source, stores one ``WebScrapingData`` row per
+(platform, category, service_type) and precomputes summary statistics for
+each (category, service_type) into the cache. The suggestion path only ever
+reads those summaries with ``get_market_snapshot``; nothing is scraped while
+serving a request.
+
+Sources are pluggable through ``MARKET_DATA_SOURCES``, a list of dotted paths
+to ``MarketDataSource`` subclasses. ``FixtureSource`` reads a local JSON file
+and can stand in for the real platforms in tests and development.
+"""
+import json
+import logging
+from datetime import timedelta
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from tasks.models import Task
+from .models import WebScrapingData
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_CACHE_PREFIX = 'market_data:snapshot'
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+class MarketDataSource:
+    """
+    A platform to collect listing prices from.
+
+    ``fetch`` returns a list of listing dicts, each with at least a numeric
+    ``price``; extra keys are kept in ``WebScrapingData.raw_data``.
+    """
+    platform = None
+
+    def fetch(self, category: str, service_type: str) -> List[Dict]:
+        raise NotImplementedError
+
+
+class FiverrSource(MarketDataSource):
+    platform = 'fiverr'
+
+    def fetch(self, category: str, service_type: str) -> List[Dict]:
+        # Placeholder listings until a scraper that respects the platform's
+        # robots.txt and terms of service is in place
+        return [
+            {'price': 25, 'title': f'{service_type} Service', 'rating': 4.8},
+            {'price': 50, 'title': f'Premium {service_type}', 'rating': 4.9},
+            {'price': 100, 'title': f'Expert {service_type}', 'rating': 5.0},
+        ]
+
+
+class UpworkSource(MarketDataSource):
+    platform = 'upwork'
+
+    def fetch(self, category: str, service_type: str) -> List[Dict]:
+        return [
+            {'price': 30, 'title': f'{service_type} Project', 'rating': 4.7},
+            {'price': 75, 'title': f'Advanced {service_type}', 'rating': 4.8},
+            {'price': 150, 'title': f'Expert {service_type}', 'rating': 4.9},
+        ]
+
+
+class FixtureSource(MarketDataSource):
+    """
+    Listings from a JSON file shaped like
+    ``{"platform": "fiverr", "listings": {"<category>": {"<service_type>": [{"price": 10}, ...]}}}``
+    """
+
+    def __init__(self, path: Optional[str] = None, data: Optional[Dict] = None):
+        if data is None:
+            path = path or settings.MARKET_DATA_FIXTURE
+            with open(path, encoding='utf-8') as fh:
+                data = json.load(fh)
+        self.platform = data.get('platform', 'fiverr')
+        self.listings = data.get('listings', {})
+
+    def fetch(self, category: str, service_type: str) -> List[Dict]:
+        return list(self.listings.get(category, {}).get(service_type, []))
+
+
+def get_sources() -> List[MarketDataSource]:
+    return [import_string(path)() for path in settings.MARKET_DATA_SOURCES]
+
+
+def default_pairs() -> List[Tuple[str, str]]:
+    """Every (category, service_type) the suggestion path asks for"""
+    return [
+        (category, complexity)
+        for category, _ in Task.CATEGORY_CHOICES
+        for complexity, _ in Task.COMPLEXITY_CHOICES
+    ]
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    """Linear-interpolated percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    position = (len(ordered) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def summarize(prices: Iterable[float]) -> Dict:
+    ordered = sorted(float(p) for p in prices)
+    if not ordered:
+        return {'min_price': 0, 'max_price': 0, 'average_price': 0, 'data_points': 0, 'percentiles': {}}
+    return {
+        'min_price': ordered[0],
+        'max_price': ordered[-1],
+        'average_price': round(sum(ordered) / len(ordered), 2),
+        'data_points': len(ordered),
+        'percentiles': {f'p{q}': round(percentile(ordered, q), 2) for q in PERCENTILES},
+    }
+
+
+def listing_prices(listings: Iterable[Dict]) -> List[float]:
+    prices = []
+    for item in listings:
+        try:
+            price = float(item['price'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if price > 0:
+            prices.append(price)
+    return prices
+
+
+def snapshot_key(category: str, service_type: str) -> str:
+    return f'{SNAPSHOT_CACHE_PREFIX}:{category}:{service_type}'
+
+
+def build_snapshot(rows: Iterable[WebScrapingData]) -> Dict:
+    """Combine the latest row of each platform into one summary"""
+    prices, platforms = [], []
+    refreshed_at = None
+    for row in rows:
+        row_prices = row.raw_data.get('prices', [])
+        prices.extend(row_prices)
+        platforms.append({
+            'name': row.get_platform_display(),
+            'data_points': row.data_points,
+            'average_price': float(row.average_price),
+        })
+        if refreshed_at is None or row.scraped_at > refreshed_at:
+            refreshed_at = row.scraped_at
+    snapshot = summarize(prices)
+    snapshot['platforms'] = platforms
+    snapshot['refreshed_at'] = refreshed_at.isoformat() if refreshed_at else None
+    return snapshot
+
+
+def refresh_market_data(sources: Optional[List[MarketDataSource]] = None,
+                        pairs: Optional[List[Tuple[str, str]]] = None) -> int:
+    """
+    Fetch every (source, category, service_type), store the results and
+    rebuild the cached snapshots. Returns the number of rows written.
+
+    A failing source is logged and skipped; the previous rows for that
+    platform keep feeding its snapshots.
+    """
+    sources = get_sources() if sources is None else sources
+    pairs = default_pairs() if pairs is None else pairs
+
+    rows = []
+    for source in sources:
+        for category, service_type in pairs:
+            try:
+                listings = source.fetch(category, service_type)
+            except Exception as e:
+                logger.error(f"Market data fetch failed for {source.platform} {category}/{service_type}: {str(e)}")
+                continue
+            prices = listing_prices(listings)
+            if not prices:
+                continue
+            stats = summarize(prices)
+            rows.append(WebScrapingData(
+                platform=source.platform,
+                category=category,
+                service_type=service_type,
+                price_range_min=Decimal(str(stats['min_price'])),
+                price_range_max=Decimal(str(stats['max_price'])),
+                average_price=Decimal(str(stats['average_price'])),
+                data_points=stats['data_points'],
+                raw_data={'prices': prices, 'percentiles': stats['percentiles'], 'listings': listings},
+            ))
+    WebScrapingData.objects.bulk_create(rows)
+
+    retention = settings.MARKET_DATA_RETENTION_DAYS
+    if retention:
+        WebScrapingData.objects.filter(scraped_at__lt=timezone.now() - timedelta(days=retention)).delete()
+
+    rebuild_snapshots(pairs)
+    return len(rows)
+
+
+def latest_rows(pairs: List[Tuple[str, str]]) -> Dict[Tuple[str, str], List[WebScrapingData]]:
+    """
+    Newest row per platform for each pair, in one query.
+
+    Only the newest row of each (category, service_type, platform) is
+    returned; older ones never leave the database. Backends with DISTINCT ON
+    pick them from the ``scrape_pair_latest_idx`` order, the others (MySQL)
+    through a correlated subquery on the same index.
+    """
+    wanted = set(pairs)
+    if not wanted:
+        return {}
+    queryset = WebScrapingData.objects.filter(
+        reduce(or_, (Q(category=category, service_type=service_type) for category, service_type in wanted))
+    )
+    if connection.features.can_distinct_on_fields:
+        queryset = queryset.order_by('category', 'service_type', 'platform', '-scraped_at', '-pk').distinct(
+            'category', 'service_type', 'platform'
+        )
+    else:
+        newest = WebScrapingData.objects.filter(
+            category=OuterRef('category'), service_type=OuterRef('service_type'), platform=OuterRef('platform')
+        ).order_by('-scraped_at', '-pk').values('pk')[:1]
+        queryset = queryset.filter(pk=Subquery(newest)).order_by('category', 'service_type', 'platform')
+    grouped = {}
+    for row in queryset:
+        grouped.setdefault((row.category, row.service_type), []).append(row)
+    return grouped
+
+
+def rebuild_snapshots(pairs: Optional[List[Tuple[str, str]]] = None) -> Dict[str, Dict]:
+    """Recompute the cached snapshots from the stored rows (no fetching)"""
+    pairs = default_pairs() if pairs is None else pairs
+    grouped = latest_rows(pairs)
+    snapshots = {
+        snapshot_key(category, service_type): build_snapshot(grouped.get((category, service_type), []))
+        for category, service_type in pairs
+    }
+    cache.set_many(snapshots, timeout=None)
+    return snapshots
+
+
+def get_market_snapshot(category: str, service_type: str) -> Dict:
+    """
+    Precomputed market summary for a (category, service_type).
+
+    One cache read on the hot path. If the cache was flushed, the snapshot
+    is rebuilt from the latest stored rows; sources are never contacted.
+    """
+    key = snapshot_key(category, service_type)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = rebuild_snapshots([(category, service_type)])[key]
+    return snapshot
@@ -53,6 +53,9 @@ class ChatMessage(models.Model):
     
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['session', 'timestamp'], name='chatmsg_session_ts_idx'),
+        ]
     
     def __str__(self):
         return f"{self.role} message in session {self.session.session_id}"
@@ -101,6 +104,10 @@ class WebScrapingData(models.Model):
     class Meta:
         ordering = ['-scraped_at']
         unique_together = ['platform', 'category', 'service_type', 'scraped_at']
+        indexes = [
+            models.Index(fields=['category', 'service_type', 'platform', '-scraped_at'], name='scrape_pair_latest_idx'),
+            models.Index(fields=['scraped_at'], name='scrape_scraped_at_idx'),
+        ]
     
     def __str__(self):
         return f"{self.platform} - {self.category} - ${self.average_price}"
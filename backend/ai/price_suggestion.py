@@ -1,5 +1,7 @@
 from django.core.cache import cache
 
+from .pricing_model import get_price_model
+
 CATEGORY_MAP = {
     'web_development': {
         'simple': (100, 200),
@@ -31,24 +33,110 @@ DEFAULT_RANGE = {
 
 
 class PriceSuggestionService:
-    """MVP price suggestion using a lookup table with optional caching"""
+    """
+    Price suggestions from the trained quantile model (``ai.pricing_model``),
+    falling back to the lookup table until a model has been trained
+    """
 
-    def suggest(self, category: str, complexity: str):
+    def suggest(self, category: str, complexity: str, budget_range: str = None,
+                description: str = '', deadline_days: float = None):
         category = (category or '').lower()
         complexity = (complexity or 'moderate').lower()
+        model = get_price_model()
+        if model is None:
+            return self.lookup_suggest(category, complexity)
+
+        low, median, high = model.predict([{
+            'category': category,
+            'complexity': complexity,
+            'budget_range': budget_range,
+            'description_length': len(description or ''),
+            'deadline_days': deadline_days,
+        }])[0]
+        return self.model_result(model, low, median, high)
+
+    def lookup_suggest(self, category: str, complexity: str):
         mapping = CATEGORY_MAP.get(category, DEFAULT_RANGE)
         low, high = mapping.get(complexity, DEFAULT_RANGE['moderate'])
         return {
             'min_price': float(low),
             'max_price': float(high),
+            'suggested_price': (low + high) / 2,
             'currency': 'USD',
             'basis': 'lookup_table_mvp'
         }
 
+    def model_result(self, model, low, median, high):
+        level = round(model.quantiles[-1] - model.quantiles[0], 2)
+        return {
+            'min_price': round(float(low), 2),
+            'max_price': round(float(high), 2),
+            'suggested_price': round(float(median), 2),
+            'confidence_interval': {
+                'level': level,
+                'lower': round(float(low), 2),
+                'upper': round(float(high), 2),
+            },
+            'currency': 'USD',
+            'basis': 'quantile_model',
+            'model_trained_at': model.trained_at,
+        }
+
+    def cache_key(self, category: str, complexity: str, description_length: int = None):
+        model = get_price_model()
+        version = model.trained_at if model is not None else 'table'
+        key = f"price_suggestion:{version}:{category}:{complexity}"
+        if description_length:
+            key = f"{key}:{description_length}"
+        return key
+
     def cached_suggest(self, category: str, complexity: str):
-        key = f"price_suggestion:{category}:{complexity}"
+        key = self.cache_key(category, complexity)
         data = cache.get(key)
         if data is None:
             data = self.suggest(category, complexity)
             cache.set(key, data, timeout=3600)
         return data
+
+    def suggest_many(self, items):
+        """
+        Suggestions for a batch of ``{'category', 'complexity', 'description'}``
+        dicts, in input order.
+
+        Inputs that would get the same answer are computed once, cached
+        answers are read with a single ``get_many`` and every miss is priced
+        in one vectorised model pass, then written back with ``set_many``.
+        """
+        inputs = [
+            (
+                (item.get('category') or '').lower(),
+                (item.get('complexity') or 'moderate').lower(),
+                len(item.get('description') or ''),
+            )
+            for item in items
+        ]
+        unique = list(dict.fromkeys(inputs))
+        keys = {entry: self.cache_key(*entry) for entry in unique}
+        found = cache.get_many(list(keys.values()))
+        results = {entry: found[key] for entry, key in keys.items() if key in found}
+
+        misses = [entry for entry in unique if entry not in results]
+        if misses:
+            computed = self.compute_many(misses)
+            results.update(computed)
+            cache.set_many({keys[entry]: computed[entry] for entry in misses}, timeout=3600)
+
+        return [results[entry] for entry in inputs]
+
+    def compute_many(self, entries):
+        model = get_price_model()
+        if model is None:
+            return {entry: self.lookup_suggest(entry[0], entry[1]) for entry in entries}
+        predictions = model.predict([
+            {'category': category, 'complexity': complexity, 'description_length': length}
+            for category, complexity, length in entries
+        ])
+        return {
+            entry: self.model_result(model, *row)
+            for entry, row in zip(entries, predictions)
+        }
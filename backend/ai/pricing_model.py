@@ -0,0 +1,194 @@
+"""
+Statistical price model trained on completed tasks
+
+Linear quantile regression on ``log(final_price)`` over one-hot category,
+complexity and budget range plus log description length and log deadline
+horizon. One coefficient vector is fit per quantile (by default the 10th,
+50th and 90th percentiles) with iteratively reweighted least squares, so the
+median is the suggested price and the outer quantiles give an 80% interval.
+
+The model is trained offline with ``manage.py train_price_model``, saved to
+``PRICE_MODEL_PATH`` and loaded once per worker by ``get_price_model``.
+Prediction is a single matrix product and needs no network access.
+"""
+import logging
+import math
+import os
+import threading
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+from django.conf import settings
+from django.db.models.functions import Length
+
+from tasks.models import Task
+
+logger = logging.getLogger(__name__)
+
+QUANTILES = (0.1, 0.5, 0.9)
+DEFAULT_DEADLINE_DAYS = 14.0
+MIN_TRAINING_SAMPLES = 30
+
+CATEGORIES = [c for c, _ in Task.CATEGORY_CHOICES]
+COMPLEXITIES = [c for c, _ in Task.COMPLEXITY_CHOICES]
+BUDGET_RANGES = [c for c, _ in Task.BUDGET_RANGE_CHOICES]
+
+
+class PriceModelError(Exception):
+    """Raised when a model cannot be trained or loaded"""
+
+
+def _one_hot_columns():
+    columns, width = {}, 1  # column 0 is the intercept
+    for name, vocabulary in (('category', CATEGORIES), ('complexity', COMPLEXITIES), ('budget_range', BUDGET_RANGES)):
+        columns[name] = {value: width + i for i, value in enumerate(vocabulary)}
+        width += len(vocabulary)
+    return columns, width
+
+
+ONE_HOT_COLUMNS, LENGTH_COLUMN = _one_hot_columns()
+DEADLINE_COLUMN = LENGTH_COLUMN + 1
+FEATURE_COUNT = DEADLINE_COLUMN + 1
+
+
+def encode_features(rows: Sequence[Dict]) -> np.ndarray:
+    """
+    Feature matrix for a batch of inputs.
+
+    Each row is a dict with ``category``, ``complexity`` and optionally
+    ``budget_range``, ``description_length`` and ``deadline_days``. Unknown
+    categorical values encode as all zeros, i.e. the intercept baseline.
+    """
+    X = np.zeros((len(rows), FEATURE_COUNT))
+    X[:, 0] = 1.0
+    for i, row in enumerate(rows):
+        for name, columns in ONE_HOT_COLUMNS.items():
+            column = columns.get(row.get(name))
+            if column is not None:
+                X[i, column] = 1.0
+        X[i, LENGTH_COLUMN] = math.log1p(max(row.get('description_length') or 0, 0))
+        deadline_days = row.get('deadline_days')
+        if deadline_days is None:
+            deadline_days = DEFAULT_DEADLINE_DAYS
+        X[i, DEADLINE_COLUMN] = math.log1p(max(deadline_days, 0))
+    return X
+
+
+def fit_quantile(X: np.ndarray, y: np.ndarray, q: float, iterations: int = 100,
+                 ridge: float = 1e-3, tol: float = 1e-6) -> np.ndarray:
+    """Linear quantile regression by iteratively reweighted least squares"""
+    penalty = ridge * np.eye(X.shape[1])
+    penalty[0, 0] = 0.0  # leave the intercept unpenalised
+    beta = np.linalg.solve(X.T @ X + penalty, X.T @ y)
+    for _ in range(iterations):
+        residual = y - X @ beta
+        weights = np.where(residual >= 0, q, 1 - q) / np.maximum(np.abs(residual), 1e-4)
+        Xw = X * weights[:, None]
+        updated = np.linalg.solve(X.T @ Xw + penalty, Xw.T @ y)
+        if np.max(np.abs(updated - beta)) < tol:
+            return updated
+        beta = updated
+    return beta
+
+
+class PriceModel:
+    """Coefficients for each quantile of log price"""
+
+    def __init__(self, coefficients: np.ndarray, quantiles: Sequence[float] = QUANTILES,
+                 n_samples: int = 0, trained_at: Optional[str] = None):
+        self.coefficients = np.asarray(coefficients, dtype=float)
+        self.quantiles = tuple(float(q) for q in quantiles)
+        self.n_samples = n_samples
+        self.trained_at = trained_at
+
+    @classmethod
+    def fit(cls, rows: Sequence[Dict], prices: Sequence[float], quantiles: Sequence[float] = QUANTILES):
+        if len(rows) < MIN_TRAINING_SAMPLES:
+            raise PriceModelError(
+                f'Need at least {MIN_TRAINING_SAMPLES} completed tasks with a final price, got {len(rows)}'
+            )
+        X = encode_features(rows)
+        y = np.log(np.asarray(prices, dtype=float))
+        coefficients = np.column_stack([fit_quantile(X, y, q) for q in quantiles])
+        return cls(coefficients, quantiles, len(rows), datetime.now(dt_timezone.utc).isoformat())
+
+    def predict(self, rows: Sequence[Dict]) -> np.ndarray:
+        """Prices for each row and quantile, shape ``(len(rows), len(quantiles))``"""
+        log_prices = encode_features(rows) @ self.coefficients
+        # Independently fit quantiles can cross; sorting restores the order
+        return np.exp(np.sort(log_prices, axis=1))
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}.tmp.npz'
+        np.savez(
+            tmp_path,
+            coefficients=self.coefficients,
+            quantiles=np.asarray(self.quantiles),
+            n_samples=np.asarray(self.n_samples),
+            trained_at=np.asarray(self.trained_at or ''),
+            feature_count=np.asarray(self.coefficients.shape[0]),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str):
+        try:
+            with np.load(path) as data:
+                coefficients = data['coefficients']
+                if int(data['feature_count']) != FEATURE_COUNT:
+                    raise PriceModelError('Model was trained with a different feature set; retrain it')
+                return cls(coefficients, data['quantiles'].tolist(), int(data['n_samples']),
+                           str(data['trained_at']) or None)
+        except (OSError, KeyError, ValueError) as e:
+            raise PriceModelError(f'Cannot load price model from {path}: {e}')
+
+
+def train_from_tasks(queryset=None) -> PriceModel:
+    """Fit a model on completed tasks that have a final price"""
+    if queryset is None:
+        queryset = Task.objects.filter(status='completed', final_price__gt=0)
+    rows, prices = [], []
+    values = queryset.annotate(description_length=Length('description')).values_list(
+        'category', 'complexity', 'budget_range', 'description_length', 'deadline', 'created_at', 'final_price'
+    )
+    for category, complexity, budget_range, length, deadline, created_at, final_price in values.iterator(chunk_size=2000):
+        rows.append({
+            'category': category,
+            'complexity': complexity,
+            'budget_range': budget_range,
+            'description_length': length,
+            'deadline_days': (deadline - created_at).total_seconds() / 86400 if deadline and created_at else None,
+        })
+        prices.append(float(final_price))
+    return PriceModel.fit(rows, prices)
+
+
+_model = None
+_model_loaded = False
+_model_lock = threading.Lock()
+
+
+def get_price_model() -> Optional[PriceModel]:
+    """The worker's model, loaded from ``PRICE_MODEL_PATH`` on first use (None if absent)"""
+    global _model, _model_loaded
+    if not _model_loaded:
+        with _model_lock:
+            if not _model_loaded:
+                path = settings.PRICE_MODEL_PATH
+                _model = None
+                if os.path.exists(path):
+                    try:
+                        _model = PriceModel.load(path)
+                    except PriceModelError as e:
+                        logger.error(str(e))
+                _model_loaded = True
+    return _model
+
+
+def reset_price_model():
+    """Forget the loaded model so the next call reloads it from disk"""
+    global _model, _model_loaded
+    with _model_lock:
+        _model, _model_loaded = None, False
@@ -101,6 +101,18 @@ class PriceSuggestionRequestSerializer(serializers.Serializer):
     force_refresh = serializers.BooleanField(default=False)
 
 
+class PriceSuggestionItemSerializer(serializers.Serializer):
+    """One task in a batch price suggestion request"""
+    category = serializers.CharField(max_length=50)
+    complexity = serializers.CharField(max_length=20, default='moderate')
+    description = serializers.CharField(required=False, allow_blank=True, default='')
+
+
+class BatchPriceSuggestionRequestSerializer(serializers.Serializer):
+    """Serializer for batch price suggestion requests"""
+    tasks = serializers.ListField(child=PriceSuggestionItemSerializer(), min_length=1, max_length=500)
+
+
 class AIStatsSerializer(serializers.Serializer):
     """Serializer for AI usage statistics"""
     total_chat_sessions = serializers.IntegerField()
@@ -1,56 +1,97 @@
 """
 AI services for Mai-Guru platform
 """
+import asyncio
+import math
+import time
 import openai
 import requests
 from bs4 import BeautifulSoup
 from django.conf import settings
 from django.core.cache import cache
 from django.utils import timezone
+from django.utils.functional import cached_property
 import json
 import logging
-from typing import Dict, List, Optional, Tuple
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from asgiref.sync import sync_to_async
+from accounts.models import User
+from tasks.models import Task
+from .cache import cacheable_prompt, get_response_cache
+from .market_data import FiverrSource, UpworkSource, get_market_snapshot
+from .clients import DEFAULT_MODEL, chat_completion, stream_chat_completion
 from .models import ChatSession, ChatMessage, PriceSuggestion, WebScrapingData, AIUsageLog
 
 logger = logging.getLogger(__name__)
 
 
+SYSTEM_PROMPTS = {
+    'client_support': "You are a helpful customer support assistant for Mai-Guru, an AI-powered freelance platform. Help clients with their questions about projects, payments, and platform features. Be professional, friendly, and informative.",
+    'pricing_negotiation': "You are a pricing negotiation assistant for Mai-Guru. Help clients understand fair pricing for their projects based on market rates and project complexity. Be transparent about pricing factors.",
+    'post_project': "You are a post-project support assistant for Mai-Guru. Help clients with project completion, reviews, and any follow-up questions. Focus on ensuring client satisfaction.",
+    'general_inquiry': "You are a general assistant for Mai-Guru, an AI-powered freelance platform. Help users with general questions about the platform, services, and how to get started."
+}
+
+FALLBACK_RESPONSE = "I apologize, but I'm having trouble processing your request. Please try again later."
+
+
 class OpenAIService:
     """Service for OpenAI API interactions"""
     
     def __init__(self):
-        self.client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
+        self.response_cache = get_response_cache()
+        # Whether the last response came from the response cache
+        self.cache_hit = False
     
-    def get_chat_response(self, messages: List[Dict], session_type: str = 'general') -> Tuple[str, int]:
+    @cached_property
+    def client(self):
+        # Only the blocking code path needs the sync client
+        return openai.OpenAI(api_key=settings.OPENAI_API_KEY)
+    
+    def build_messages(self, messages: List[Dict], session_type: str) -> List[Dict]:
+        """Prepend the system prompt for the session type"""
+        system_message = {
+            "role": "system",
+            "content": SYSTEM_PROMPTS.get(session_type, SYSTEM_PROMPTS['general_inquiry'])
+        }
+        return [system_message] + messages
+    
+    def cached_response(self, messages: List[Dict], session_type: str, use_cache: bool = True) -> Optional[str]:
+        """Look the exchange up in the response cache (see ``ai.cache``)"""
+        self.cache_hit = False
+        prompt = cacheable_prompt(messages, session_type) if use_cache else None
+        if prompt is None:
+            return None
+        response = self.response_cache.get(session_type, prompt)
+        self.cache_hit = response is not None
+        return response
+    
+    def remember_response(self, messages: List[Dict], session_type: str, response: str, use_cache: bool = True):
+        prompt = cacheable_prompt(messages, session_type) if use_cache else None
+        if prompt is not None:
+            self.response_cache.set(session_type, prompt, response)
+    
+    def get_chat_response(self, messages: List[Dict], session_type: str = 'general',
+                          use_cache: bool = True) -> Tuple[str, int]:
         """
         Get response from OpenAI chat completion
         
         Args:
             messages: List of message dictionaries
             session_type: Type of chat session for context
+            use_cache: Allow answering from the response cache
             
         Returns:
-            Tuple of (response_text, tokens_used)
+            Tuple of (response_text, tokens_used); cached answers report 0 tokens
         """
+        cached = self.cached_response(messages, session_type, use_cache)
+        if cached is not None:
+            return cached, 0
+        
         try:
-            system_prompts = {
-                'client_support': "You are a helpful customer support assistant for Mai-Guru, an AI-powered freelance platform. Help clients with their questions about projects, payments, and platform features. Be professional, friendly, and informative.",
-                'pricing_negotiation': "You are a pricing negotiation assistant for Mai-Guru. Help clients understand fair pricing for their projects based on market rates and project complexity. Be transparent about pricing factors.",
-                'post_project': "You are a post-project support assistant for Mai-Guru. Help clients with project completion, reviews, and any follow-up questions. Focus on ensuring client satisfaction.",
-                'general_inquiry': "You are a general assistant for Mai-Guru, an AI-powered freelance platform. Help users with general questions about the platform, services, and how to get started."
-            }
-            
-            system_message = {
-                "role": "system",
-                "content": system_prompts.get(session_type, system_prompts['general_inquiry'])
-            }
-            
-            # Add system message at the beginning
-            full_messages = [system_message] + messages
-            
             response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=full_messages,
+                model=DEFAULT_MODEL,
+                messages=self.build_messages(messages, session_type),
                 max_tokens=500,
                 temperature=0.7
             )
@@ -58,11 +99,57 @@ class OpenAIService:
             response_text = response.choices[0].message.content
             tokens_used = response.usage.total_tokens
             
+            self.remember_response(messages, session_type, response_text, use_cache)
             return response_text, tokens_used
             
         except Exception as e:
             logger.error(f"OpenAI API error: {str(e)}")
-            return "I apologize, but I'm having trouble processing your request. Please try again later.", 0
+            return FALLBACK_RESPONSE, 0
+    
+    async def aget_chat_response(self, messages: List[Dict], session_type: str = 'general',
+                                 use_cache: bool = True) -> Tuple[str, int]:
+        """
+        Async variant of ``get_chat_response`` using the pooled client in ``ai.clients``
+        
+        Returns:
+            Tuple of (response_text, tokens_used)
+        """
+        cached = self.cached_response(messages, session_type, use_cache)
+        if cached is not None:
+            return cached, 0
+        
+        try:
+            result = await chat_completion(
+                self.build_messages(messages, session_type),
+                max_tokens=500,
+                temperature=0.7
+            )
+            self.remember_response(messages, session_type, result.content, use_cache)
+            return result.content, result.tokens_used
+        except asyncio.TimeoutError:
+            logger.error("OpenAI API timeout after %ss", settings.OPENAI_TIMEOUT)
+        except Exception as e:
+            logger.error(f"OpenAI API error: {str(e)}")
+        return FALLBACK_RESPONSE, 0
+    
+    def astream_chat_response(self, messages: List[Dict], session_type: str = 'general') -> AsyncIterator[str]:
+        """
+        Stream the completion as content deltas (errors are raised to the caller)
+        """
+        return stream_chat_completion(
+            self.build_messages(messages, session_type),
+            max_tokens=500,
+            temperature=0.7
+        )
+
+
+def estimate_tokens(messages: List[Dict], completion_chunks: int) -> int:
+    """
+    Streamed completions carry no usage block, so approximate it:
+    ~4 characters per prompt token and one token per streamed chunk.
+    """
+    prompt_chars = sum(len(m.get('content') or '') for m in messages)
+    return math.ceil(prompt_chars / 4) + completion_chunks
 
 
 class WebScrapingService:
@@ -86,25 +173,18 @@ class WebScrapingService:
             List of pricing data dictionaries
         """
         try:
-            # This is a simplified example - actual implementation would need proper scraping
-            # with respect to robots.txt and terms of service
             cache_key = f"fiverr_prices_{category}_{service_type}"
             cached_data = cache.get(cache_key)
             
             if cached_data:
                 return cached_data
             
-            # Mock data for demonstration - replace with actual scraping logic
-            mock_data = [
-                {'price': 25, 'title': f'{service_type} Service', 'rating': 4.8},
-                {'price': 50, 'title': f'Premium {service_type}', 'rating': 4.9},
-                {'price': 100, 'title': f'Expert {service_type}', 'rating': 5.0},
-            ]
+            data = FiverrSource().fetch(category, service_type)
             
             # Cache for 1 hour
-            cache.set(cache_key, mock_data, 3600)
+            cache.set(cache_key, data, 3600)
             
-            return mock_data
+            return data
             
         except Exception as e:
             logger.error(f"Fiverr scraping error: {str(e)}")
@@ -128,16 +208,11 @@ class WebScrapingService:
             if cached_data:
                 return cached_data
             
-            # Mock data for demonstration
-            mock_data = [
-                {'price': 30, 'title': f'{service_type} Project', 'rating': 4.7},
-                {'price': 75, 'title': f'Advanced {service_type}', 'rating': 4.8},
-                {'price': 150, 'title': f'Expert {service_type}', 'rating': 4.9},
-            ]
+            data = UpworkSource().fetch(category, service_type)
             
-            cache.set(cache_key, mock_data, 3600)
+            cache.set(cache_key, data, 3600)
             
-            return mock_data
+            return data
             
         except Exception as e:
             logger.error(f"Upwork scraping error: {str(e)}")
@@ -147,6 +222,9 @@ class WebScrapingService:
         """
         Get aggregated market data from multiple platforms
         
+        Reads the snapshot precomputed by ``ai.tasks.refresh_market_data``;
+        no platform is contacted here.
+        
         Args:
             category: Service category
             service_type: Specific service type
@@ -154,32 +232,7 @@ class WebScrapingService:
         Returns:
             Dictionary with aggregated market data
         """
-        fiverr_data = self.scrape_fiverr_prices(category, service_type)
-        upwork_data = self.scrape_upwork_prices(category, service_type)
-        
-        all_prices = []
-        all_prices.extend([item['price'] for item in fiverr_data])
-        all_prices.extend([item['price'] for item in upwork_data])
-        
-        if not all_prices:
-            return {
-                'min_price': 0,
-                'max_price': 0,
-                'average_price': 0,
-                'data_points': 0,
-                'platforms': []
-            }
-        
-        return {
-            'min_price': min(all_prices),
-            'max_price': max(all_prices),
-            'average_price': sum(all_prices) / len(all_prices),
-            'data_points': len(all_prices),
-            'platforms': [
-                {'name': 'Fiverr', 'data': fiverr_data},
-                {'name': 'Upwork', 'data': upwork_data}
-            ]
-        }
+        return get_market_snapshot(category, service_type)
 
 
 class PriceSuggestionService:
@@ -187,7 +240,6 @@ class PriceSuggestionService:
     
     def __init__(self):
         self.openai_service = OpenAIService()
-        self.scraping_service = WebScrapingService()
     
     def suggest_price(self, task) -> Dict:
         """
@@ -200,8 +252,8 @@ class PriceSuggestionService:
             Dictionary with price suggestion and reasoning
         """
         try:
-            # Get market data
-            market_data = self.scraping_service.get_market_data(task.category, task.complexity)
+            # Get precomputed market data
+            market_data = get_market_snapshot(task.category, task.complexity)
             
             # Prepare prompt for AI
             prompt = f"""
@@ -286,7 +338,7 @@ class ChatbotService:
     def __init__(self):
         self.openai_service = OpenAIService()
     
-    def process_message(self, session: ChatSession, message: str, user: User) -> Dict:
+    def process_message(self, session: ChatSession, message: str, user: User, stream: bool = False):
         """
         Process a user message and return AI response
         
@@ -294,31 +346,21 @@ class ChatbotService:
             session: Chat session instance
             message: User message
             user: User instance
+            stream: Return an async iterator of ``(event, data)`` pairs
+                instead of waiting for the full response (see ``stream_message``)
             
         Returns:
             Dictionary with response and metadata
         """
+        if stream:
+            return self.stream_message(session, message, user)
+        
         try:
-            # Get recent messages from session
-            recent_messages = ChatMessage.objects.filter(session=session).order_by('-timestamp')[:10]
-            
-            # Convert to OpenAI format
-            messages = []
-            for msg in reversed(recent_messages):
-                messages.append({
-                    'role': msg.role,
-                    'content': msg.content
-                })
-            
-            # Add current user message
-            messages.append({
-                'role': 'user',
-                'content': message
-            })
+            messages = self.build_history(session, message)
             
-            # Get AI response
+            # Get AI response; task-specific sessions never use the response cache
             response, tokens_used = self.openai_service.get_chat_response(
-                messages, session.session_type
+                messages, session.session_type, use_cache=session.task_id is None
             )
             
             # Save user message
@@ -343,7 +385,7 @@ class ChatbotService:
                 service_type='chatbot',
                 tokens_used=tokens_used,
                 request_data={'session_id': session.session_id, 'message_length': len(message)},
-                response_data={'response_length': len(response)}
+                response_data={'response_length': len(response), 'cached': self.openai_service.cache_hit}
             )
             
             return {
@@ -360,6 +402,109 @@ class ChatbotService:
                 'error': f"Error processing message: {str(e)}"
             }
     
+    def build_history(self, session: ChatSession, message: str) -> List[Dict]:
+        """Recent session messages plus the new one, in OpenAI format"""
+        recent_messages = ChatMessage.objects.filter(session=session).order_by('-timestamp')[:10]
+        
+        messages = []
+        for msg in reversed(recent_messages):
+            messages.append({
+                'role': msg.role,
+                'content': msg.content
+            })
+        
+        messages.append({
+            'role': 'user',
+            'content': message
+        })
+        return messages
+    
+    async def stream_message(self, session: ChatSession, message: str, user: User) -> AsyncIterator[Tuple[str, Dict]]:
+        """
+        Stream the AI response for a user message
+        
+        Yields ``('start', ...)`` straight away, one ``('token', ...)`` per
+        content delta and a final ``('done', ...)`` or ``('error', ...)``.
+        The user message is stored up front; the assistant message is stored
+        once, when the stream ends, with its token count and response time.
+        """
+        started = time.monotonic()
+        messages = await sync_to_async(self._start_turn)(session, message)
+        yield 'start', {'session_id': session.session_id}
+        
+        parts = []
+        error = None
+        use_cache = session.task_id is None
+        cached = self.openai_service.cached_response(messages, session.session_type, use_cache)
+        if cached is not None:
+            parts.append(cached)
+            yield 'token', {'content': cached}
+        else:
+            try:
+                async for delta in self.openai_service.astream_chat_response(messages, session.session_type):
+                    parts.append(delta)
+                    yield 'token', {'content': delta}
+            except asyncio.TimeoutError:
+                error = 'The assistant took too long to respond.'
+                logger.error("Chatbot stream timed out for session %s", session.session_id)
+            except Exception as e:
+                error = 'Error processing message.'
+                logger.error(f"Chatbot stream error: {str(e)}")
+        
+        if not parts:
+            yield 'error', {'error': error or 'The assistant returned an empty response.'}
+            return
+        
+        response = ''.join(parts)
+        if cached is not None:
+            tokens_used = 0
+        else:
+            tokens_used = estimate_tokens(
+                self.openai_service.build_messages(messages, session.session_type), len(parts)
+            )
+            if not error:
+                self.openai_service.remember_response(messages, session.session_type, response, use_cache)
+        response_time = time.monotonic() - started
+        ai_message = await sync_to_async(self._finish_turn)(
+            session, user, message, response, tokens_used, response_time, cached is not None
+        )
+        if error:
+            yield 'error', {'error': error, 'message_id': ai_message.id}
+            return
+        yield 'done', {
+            'message_id': ai_message.id,
+            'tokens_used': tokens_used,
+            'response_time': round(response_time, 3),
+            'cached': cached is not None,
+        }
+    
+    def _start_turn(self, session: ChatSession, message: str) -> List[Dict]:
+        messages = self.build_history(session, message)
+        ChatMessage.objects.create(
+            session=session,
+            role='user',
+            content=message,
+            tokens_used=0
+        )
+        return messages
+    
+    def _finish_turn(self, session, user, message, response, tokens_used, response_time, cached) -> ChatMessage:
+        ai_message = ChatMessage.objects.create(
+            session=session,
+            role='assistant',
+            content=response,
+            tokens_used=tokens_used,
+            response_time=response_time
+        )
+        AIUsageLog.objects.create(
+            user=user,
+            service_type='chatbot',
+            tokens_used=tokens_used,
+            request_data={'session_id': session.session_id, 'message_length': len(message), 'stream': True},
+            response_data={'response_length': len(response), 'response_time': response_time, 'cached': cached}
+        )
+        return ai_message
+    
     def create_session(self, user: User, session_type: str, task: Task = None) -> ChatSession:
         """
         Create a new chat session
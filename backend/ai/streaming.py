@@ -0,0 +1,46 @@
+"""
+Server-sent events helpers for streamed AI responses
+"""
+import json
+
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+
+
+def format_sse(event: str, data) -> str:
+    """Encode one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+async def encode_events(events):
+    """Turn an async iterator of ``(event, data)`` pairs into SSE text"""
+    async for event, data in events:
+        yield format_sse(event, data)
+
+
+def sse_response(events) -> StreamingHttpResponse:
+    """
+    Stream ``(event, data)`` pairs to the client as ``text/event-stream``
+
+    Chunks are only flushed one by one when the project runs under ASGI;
+    Django's WSGI handler has to buffer async iterators.
+    """
+    response = StreamingHttpResponse(encode_events(events), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets views accept ``Accept: text/event-stream``. Streams themselves
+    bypass rendering; this only encodes ordinary responses such as auth
+    or validation errors as a single ``error`` event.
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return format_sse('error', data).encode(self.charset)
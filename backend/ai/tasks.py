@@ -0,0 +1,18 @@
+"""
+Celery tasks for the AI app
+"""
+import logging
+
+from celery import shared_task
+
+from .market_data import refresh_market_data as refresh
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name='ai.tasks.refresh_market_data')
+def refresh_market_data():
+    """Periodic refresh of WebScrapingData and the price suggestion snapshots"""
+    rows = refresh()
+    logger.info("Market data refreshed: %s rows written", rows)
+    return rows
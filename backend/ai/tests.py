@@ -0,0 +1,270 @@
+import asyncio
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from http.server import ThreadingHTTPServer
+
+from django.core.cache import cache
+from django.test import AsyncClient, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import User
+
+from .clients import ChatCompletionResult, chat_completion, chat_completions, close_async_client, get_async_client
+from .management.commands.openai_stub_server import StubHandler
+from .market_data import FixtureSource, get_market_snapshot, latest_rows, refresh_market_data, snapshot_key
+from .models import WebScrapingData
+from .views import ChatSessionViewSet
+
+
+class CountingStubHandler(StubHandler):
+    """``openai_stub_server`` handler that records how many requests overlap before being answered"""
+
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+
+    def do_POST(self):
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        self.counted = True
+        try:
+            super().do_POST()
+        finally:
+            self.answered()
+
+    def send_response(self, *args, **kwargs):
+        # The client may start its next call as soon as it has the response
+        self.answered()
+        super().send_response(*args, **kwargs)
+
+    def answered(self):
+        if self.counted:
+            self.counted = False
+            with self.lock:
+                type(self).in_flight -= 1
+
+
+class StubServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        pass  # timed out clients hang up before the stub answers
+
+
+class OpenAIStubTestCase(TestCase):
+    """Runs ``openai_stub_server`` on a free port and points the pooled client at it"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = StubServer(('127.0.0.1', 0), CountingStubHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.stub_settings = override_settings(
+            OPENAI_BASE_URL=f'http://127.0.0.1:{cls.server.server_port}/v1',
+            OPENAI_API_KEY='test',
+            OPENAI_MAX_RETRIES=0,
+            OPENAI_TIMEOUT=5.0,
+            AI_RESPONSE_CACHE_ENABLED=False,
+        )
+        cls.stub_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub_settings.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        # Requests abandoned by an earlier timeout test are still sleeping in the stub
+        deadline = time.monotonic() + 5
+        while CountingStubHandler.in_flight and time.monotonic() < deadline:
+            time.sleep(0.05)
+        CountingStubHandler.delay = 0.0
+        CountingStubHandler.chunk_delay = 0.0
+        CountingStubHandler.max_in_flight = 0
+
+    def tearDown(self):
+        CountingStubHandler.delay = StubHandler.delay
+        CountingStubHandler.chunk_delay = StubHandler.chunk_delay
+
+
+class AsyncClientTests(OpenAIStubTestCase):
+    """The pooled ``AsyncOpenAI`` client in ``ai.clients``"""
+
+    def test_one_client_per_event_loop(self):
+        async def loop_client():
+            try:
+                self.assertIs(get_async_client(), get_async_client())
+                result = await chat_completion([{'role': 'user', 'content': 'hello there'}])
+                self.assertEqual(result.content, StubHandler.reply)
+                self.assertGreater(result.tokens_used, 0)
+                return get_async_client()[0]
+            finally:
+                await close_async_client()
+
+        self.assertIsNot(asyncio.run(loop_client()), asyncio.run(loop_client()))
+
+    @override_settings(OPENAI_MAX_CONCURRENCY=2)
+    async def test_semaphore_caps_in_flight_calls(self):
+        CountingStubHandler.delay = 0.2
+        try:
+            results = await chat_completions([[{'role': 'user', 'content': f'q{n}'}] for n in range(5)])
+        finally:
+            await close_async_client()
+        self.assertTrue(all(isinstance(result, ChatCompletionResult) for result in results))
+        self.assertEqual(CountingStubHandler.max_in_flight, 2)
+
+    async def test_timeout_raises(self):
+        CountingStubHandler.delay = 1.0
+        try:
+            with self.assertRaises(asyncio.TimeoutError):
+                await chat_completion([{'role': 'user', 'content': 'slow'}], timeout=0.2)
+        finally:
+            await close_async_client()
+
+
+class AsyncChatbotViewTests(OpenAIStubTestCase):
+    """``AsyncDispatchMixin`` views driven end to end against the stub"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='client', email='client@example.com', password='x')
+        self.token = str(AccessToken.for_user(self.user))
+
+    async def post(self, **data):
+        return await AsyncClient().post('/api/ai/chatbot/', data, content_type='application/json',
+                                        headers={'Authorization': f'Bearer {self.token}'})
+
+    async def test_reply_comes_from_the_model(self):
+        try:
+            response = await self.post(message='How do I post a task?')
+        finally:
+            await close_async_client()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'response': StubHandler.reply})
+
+    async def test_requires_authentication(self):
+        response = await AsyncClient().post('/api/ai/chatbot/', {'message': 'hi'}, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+    async def test_requests_are_not_serialised(self):
+        CountingStubHandler.delay = 0.3
+        try:
+            responses = await asyncio.gather(*(self.post(message=f'question {n}') for n in range(3)))
+        finally:
+            await close_async_client()
+        self.assertEqual([response.status_code for response in responses], [200] * 3)
+        self.assertEqual(CountingStubHandler.max_in_flight, 3)
+
+    @override_settings(OPENAI_TIMEOUT=0.2)
+    async def test_timeout_becomes_an_error_reply(self):
+        CountingStubHandler.delay = 1.0
+        try:
+            response = await self.post(message='Anyone there?')
+        finally:
+            await close_async_client()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('taking too long', response.json()['response'])
+
+    @override_settings(OPENAI_TIMEOUT=0.2)
+    async def test_stream_timeout_ends_with_an_error_event(self):
+        CountingStubHandler.delay = 1.0
+        try:
+            response = await self.post(message='Anyone there?', stream=True)
+            body = ''.join([chunk if isinstance(chunk, str) else chunk.decode()
+                            async for chunk in response.streaming_content])
+        finally:
+            await close_async_client()
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertTrue(body.startswith('event: start\n'))
+        self.assertIn('event: error\ndata: {"error":"The assistant took too long to respond."}', body)
+
+    async def test_sync_and_async_handlers_share_the_dispatch(self):
+        view = ChatSessionViewSet.as_view({'get': 'list', 'post': 'create'})
+        self.assertTrue(asyncio.iscoroutinefunction(view))
+        factory = APIRequestFactory()
+
+        request = factory.get('/')
+        force_authenticate(request, self.user)
+        response = await view(request)
+        self.assertEqual(response.data, {'message': 'Chat sessions endpoint'})
+
+        request = factory.post('/', {'message': 'hi'}, format='json')
+        force_authenticate(request, self.user)
+        try:
+            response = await view(request)
+        finally:
+            await close_async_client()
+        self.assertEqual(response.data, {'response': StubHandler.reply})
+
+
+class MarketDataTests(TestCase):
+    """Latest rows per platform and the snapshot cache built from them"""
+
+    PAIR = ('web_development', 'simple')
+
+    def setUp(self):
+        cache.delete(snapshot_key(*self.PAIR))
+        self.addCleanup(cache.delete, snapshot_key(*self.PAIR))
+
+    def add_row(self, platform, category, service_type, average, age=timedelta()):
+        row = WebScrapingData.objects.create(
+            platform=platform, category=category, service_type=service_type, price_range_min=average,
+            price_range_max=average, average_price=average, data_points=1,
+            raw_data={'prices': [float(average)]},
+        )
+        WebScrapingData.objects.filter(pk=row.pk).update(scraped_at=timezone.now() - age)
+        return row.pk
+
+    def refresh(self, *prices):
+        category, service_type = self.PAIR
+        source = FixtureSource(data={'platform': 'fiverr', 'listings': {
+            category: {service_type: [{'price': price} for price in prices]},
+        }})
+        return refresh_market_data(sources=[source], pairs=[self.PAIR])
+
+    def test_latest_rows_keeps_the_newest_row_per_platform_of_wanted_pairs(self):
+        self.add_row('fiverr', 'web_development', 'simple', 10, age=timedelta(days=2))
+        fiverr = self.add_row('fiverr', 'web_development', 'simple', 20, age=timedelta(days=1))
+        upwork = self.add_row('upwork', 'web_development', 'simple', 30, age=timedelta(days=3))
+        ai_ml = self.add_row('fiverr', 'ai_ml', 'complex', 40)
+        # Same categories and service types, but not a requested pair
+        self.add_row('fiverr', 'web_development', 'complex', 50)
+        self.add_row('fiverr', 'ai_ml', 'simple', 60)
+
+        with self.assertNumQueries(1):
+            grouped = latest_rows([('web_development', 'simple'), ('ai_ml', 'complex')])
+
+        self.assertEqual({pair: [row.pk for row in rows] for pair, rows in grouped.items()}, {
+            ('web_development', 'simple'): [fiverr, upwork],
+            ('ai_ml', 'complex'): [ai_ml],
+        })
+        self.assertEqual(latest_rows([]), {})
+
+    def test_snapshot_cache_is_replaced_by_a_refresh(self):
+        self.refresh(10, 20, 30)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_market_snapshot(*self.PAIR)['average_price'], 20)
+
+        # The snapshot never expires, so rows written behind the job's back are not picked up...
+        self.add_row('upwork', *self.PAIR, Decimal('500'))
+        self.assertEqual(get_market_snapshot(*self.PAIR)['average_price'], 20)
+
+        # ...until the next refresh rebuilds it
+        self.refresh(40, 60)
+        snapshot = get_market_snapshot(*self.PAIR)
+        self.assertEqual(snapshot['average_price'], 200)
+        self.assertEqual(sorted(p['name'] for p in snapshot['platforms']), ['Fiverr', 'Upwork'])
+
+    def test_flushed_snapshot_is_rebuilt_from_stored_rows(self):
+        self.refresh(10, 20, 30)
+        cache.delete(snapshot_key(*self.PAIR))
+        with self.assertNumQueries(1):
+            self.assertEqual(get_market_snapshot(*self.PAIR)['average_price'], 20)
+        with self.assertNumQueries(0):
+            get_market_snapshot(*self.PAIR)
@@ -1,7 +1,9 @@
 from django.urls import path
-from .views import ChatbotView, PriceSuggestionView
+from .views import BatchPriceSuggestionView, ChatbotView, PriceSuggestionView, ResponseCacheStatsView
 
 urlpatterns = [
     path('chatbot/', ChatbotView.as_view(), name='ai_chatbot'),
+    path('chatbot/cache-stats/', ResponseCacheStatsView.as_view(), name='ai_chatbot_cache_stats'),
     path('price-suggestion/', PriceSuggestionView.as_view(), name='ai_price_suggestion'),
+    path('price-suggestion/batch/', BatchPriceSuggestionView.as_view(), name='ai_price_suggestion_batch'),
 ]
\ No newline at end of file
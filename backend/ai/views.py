@@ -1,36 +1,126 @@
 # This file marks the directory as a Python package.
 
+from .cache import get_response_cache
 from .chatbot import AIBotService
+from .models import ChatSession
 from .price_suggestion import PriceSuggestionService
+from .serializers import BatchPriceSuggestionRequestSerializer
+from .services import ChatbotService
+from .streaming import EventStreamRenderer, sse_response
 
+from asgiref.sync import sync_to_async
+from rest_framework import status
+from rest_framework.exceptions import NotFound
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from rest_framework import viewsets
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from marketplace.async_views import AsyncAPIView, AsyncModelViewSet
 
 User = get_user_model()
 
-class ChatbotView(APIView):
+class ChatbotView(AsyncAPIView):
+    """
+    Chatbot reply for a single message.
+
+    Send ``"stream": true`` (or ``Accept: text/event-stream``) to receive the
+    reply as server-sent events within a chat session: ``start``, one
+    ``token`` event per chunk, then ``done`` or ``error``. ``session_id``
+    continues an existing session; otherwise a new one of ``session_type``
+    is started.
+    """
     permission_classes = [IsAuthenticated]
-    def post(self, request):
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [EventStreamRenderer]
+
+    async def post(self, request):
+        if self.wants_stream(request):
+            return await self.stream(request)
         message = request.data.get('message', '')
         user_type = request.data.get('user_type', 'client')
         ai_service = AIBotService()
-        response = ai_service.get_chatbot_response(message, user_type)
+        response = await ai_service.aget_chatbot_response(message, user_type)
         return Response({'response': response})
 
+    def wants_stream(self, request):
+        flag = request.data.get('stream')
+        if isinstance(flag, str):
+            flag = flag.lower() in ('1', 'true', 'yes')
+        return bool(flag) or 'text/event-stream' in request.META.get('HTTP_ACCEPT', '')
+
+    async def stream(self, request):
+        message = (request.data.get('message') or '').strip()
+        if not message:
+            return Response({'error': 'Message is required'}, status=status.HTTP_400_BAD_REQUEST)
+        session = await sync_to_async(self.get_session)(request)
+        service = ChatbotService()
+        return sse_response(service.process_message(session, message, request.user, stream=True))
+
+    def get_session(self, request):
+        session_id = request.data.get('session_id')
+        if session_id:
+            try:
+                return ChatSession.objects.get(session_id=session_id, user=request.user, is_active=True)
+            except ChatSession.DoesNotExist:
+                raise NotFound('Chat session not found')
+        session_type = request.data.get('session_type', 'general_inquiry')
+        if session_type not in dict(ChatSession.SESSION_TYPES):
+            session_type = 'general_inquiry'
+        return ChatbotService().create_session(request.user, session_type)
+
+def parse_deadline_days(data):
+    """Days until the deadline from ``deadline_days`` or an ISO ``deadline``"""
+    try:
+        if data.get('deadline_days') not in (None, ''):
+            return float(data['deadline_days'])
+    except (TypeError, ValueError):
+        return None
+    deadline = parse_datetime(str(data.get('deadline') or ''))
+    if deadline is None:
+        return None
+    if timezone.is_naive(deadline):
+        deadline = timezone.make_aware(deadline)
+    return (deadline - timezone.now()).total_seconds() / 86400
+
+class ResponseCacheStatsView(APIView):
+    """Hit/miss counters of this worker's chatbot response cache"""
+    permission_classes = [IsAdminUser]
+    def get(self, request):
+        return Response(get_response_cache().stats())
+
 class PriceSuggestionView(APIView):
+    """
+    Price range for a task from the locally trained model. Optional inputs
+    (``budget_range``, ``description``, ``deadline`` or ``deadline_days``)
+    sharpen the estimate.
+    """
     permission_classes = [IsAuthenticated]
     def post(self, request):
         category = request.data.get('category', 'web_development')
         complexity = request.data.get('complexity', 'moderate')
         price_service = PriceSuggestionService()
-        suggestion = price_service.cached_suggest(category, complexity)
+        suggestion = price_service.suggest(
+            category,
+            complexity,
+            budget_range=request.data.get('budget_range'),
+            description=request.data.get('description') or '',
+            deadline_days=parse_deadline_days(request.data),
+        )
         return Response({'suggestion': suggestion})
 
+class BatchPriceSuggestionView(APIView):
+    """Price suggestions for up to 500 tasks in one request, in input order"""
+    permission_classes = [IsAuthenticated]
+    def post(self, request):
+        serializer = BatchPriceSuggestionRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        suggestions = PriceSuggestionService().suggest_many(serializer.validated_data['tasks'])
+        return Response({'suggestions': suggestions})
+
 # ViewSets for the main URLs
-class ChatSessionViewSet(viewsets.ModelViewSet):
+class ChatSessionViewSet(AsyncModelViewSet):
     """ViewSet for chat sessions"""
     queryset = User.objects.none()  # Empty queryset for now
     permission_classes = [IsAuthenticated]
@@ -38,11 +128,11 @@ class ChatSessionViewSet(viewsets.ModelViewSet):
     def list(self, request):
         return Response({'message': 'Chat sessions endpoint'})
     
-    def create(self, request):
+    async def create(self, request):
         message = request.data.get('message', '')
         user_type = request.data.get('user_type', 'client')
         ai_service = AIBotService()
-        response = ai_service.get_chatbot_response(message, user_type)
+        response = await ai_service.aget_chatbot_response(message, user_type)
         return Response({'response': response})
 
 
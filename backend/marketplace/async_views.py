@@ -0,0 +1,60 @@
+"""
+Async-capable DRF views shared by the API apps
+
+DRF's ``APIView.dispatch`` is synchronous, so coroutine handlers cannot be
+used with it directly. These classes dispatch on the event loop instead:
+authentication, permission and throttle checks run in a worker thread via
+``sync_to_async`` (they may hit the database), coroutine handlers are awaited
+in place, and ordinary handlers are pushed to a thread so they keep working.
+"""
+import asyncio
+
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from rest_framework import viewsets
+from rest_framework.views import APIView
+
+
+class AsyncDispatchMixin:
+    """Run the DRF request cycle as a coroutine"""
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            if asyncio.iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+
+        except Exception as exc:
+            response = await sync_to_async(self.handle_exception)(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncAPIView(AsyncDispatchMixin, APIView):
+    """``APIView`` whose handlers may be ``async def``"""
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return markcoroutinefunction(super().as_view(**initkwargs))
+
+
+class AsyncModelViewSet(AsyncDispatchMixin, viewsets.ModelViewSet):
+    """``ModelViewSet`` whose actions may be ``async def``"""
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        return markcoroutinefunction(super().as_view(actions, **initkwargs))
@@ -0,0 +1,138 @@
+"""
+``Idempotency-Key`` support for endpoints with side effects
+
+A client sends the same ``Idempotency-Key`` header on every retry of one
+logical request. The first request to arrive runs the view. A successful
+(2xx) response is kept in the cache for ``IDEMPOTENCY_TTL`` seconds and
+replayed to later retries with an ``Idempotent-Replayed: true`` header.
+Error responses are not kept, so a retry after a failure really retries.
+
+Requests that arrive while the first one is still running are coalesced:
+they wait up to ``IDEMPOTENCY_WAIT_SECONDS`` for its result instead of
+calling the gateway again, and get a 409 if it is still not done. Reusing a
+key with a different method, path or body is rejected with a 422.
+
+The first request's claim on the key lasts ``IDEMPOTENCY_LOCK_SECONDS`` and
+is renewed in the background while the view runs. A slow gateway call
+therefore cannot let a retry in. The claim of a worker that died lapses
+on its own.
+
+Keys are scoped to the authenticated user, so clients cannot collide.
+"""
+import hashlib
+import json
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+CACHE_PREFIX = 'idempotency'
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(request: Request) -> str:
+    """Hash of the method, path and body the key was first used with"""
+    body = json.dumps(request.data, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def record_key(request: Request, key: str) -> str:
+    user = request.user.pk if request.user and request.user.is_authenticated else 'anon'
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f'{CACHE_PREFIX}:{user}:{digest}'
+
+
+def idempotency_token(request: Request):
+    """
+    Stable id derived from the request's key, or None without one; for
+    passing on to gateways with their own idempotency headers
+    """
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not key:
+        return None
+    return hashlib.sha256(record_key(request, key).encode()).hexdigest()[:36]
+
+
+def keep_claim(cache_key: str, stop: threading.Event):
+    """Renew a running request's claim on its key until ``stop`` is set"""
+    while not stop.wait(settings.IDEMPOTENCY_LOCK_SECONDS / 3):
+        cache.touch(cache_key, settings.IDEMPOTENCY_LOCK_SECONDS)
+
+
+def replay(record) -> Response:
+    return Response(record['data'], status=record['status'], headers={REPLAYED_HEADER: 'true'})
+
+
+def idempotent(view):
+    """
+    Make a DRF view (function view or viewset action) honour ``Idempotency-Key``
+
+    Requests without the header run as before. On function views, place it
+    below ``@api_view`` so it receives the DRF request.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        request = next(arg for arg in args if isinstance(arg, Request))
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {"error": f"{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        cache_key = record_key(request, key)
+        fingerprint = request_fingerprint(request)
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+        delay = 0.05
+        while not cache.add(cache_key, {'state': 'running', 'fingerprint': fingerprint},
+                            timeout=settings.IDEMPOTENCY_LOCK_SECONDS):
+            record = cache.get(cache_key)
+            # None: the first request failed and let go of the key; back off before claiming it
+            if record is not None:
+                if record['fingerprint'] != fingerprint:
+                    return Response(
+                        {"error": f"{IDEMPOTENCY_HEADER} was already used for a different request"},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                    )
+                if record['state'] == 'done':
+                    return replay(record)
+            if time.monotonic() >= deadline:
+                return Response(
+                    {"error": f"A request with this {IDEMPOTENCY_HEADER} is still in progress"},
+                    status=status.HTTP_409_CONFLICT
+                )
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+        stop = threading.Event()
+        keeper = threading.Thread(target=keep_claim, args=(cache_key, stop), daemon=True)
+        keeper.start()
+        try:
+            response = view(*args, **kwargs)
+        except Exception:
+            cache.delete(cache_key)
+            raise
+        finally:
+            stop.set()
+            keeper.join()
+        if status.is_success(response.status_code) and hasattr(response, 'data'):
+            cache.set(cache_key, {
+                'state': 'done',
+                'fingerprint': fingerprint,
+                'status': response.status_code,
+                'data': response.data,
+            }, timeout=settings.IDEMPOTENCY_TTL)
+        else:
+            cache.delete(cache_key)
+        return response
+
+    return wrapper
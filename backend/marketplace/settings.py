@@ -5,6 +5,7 @@ Django settings for Mai-Guru freelance marketplace project.
 import os
 from pathlib import Path
 import environ
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -40,6 +41,7 @@ THIRD_PARTY_APPS = [
     'rest_framework_simplejwt',
     'corsheaders',
     'django_celery_beat',
+    'channels',
 ]
 
 LOCAL_APPS = [
@@ -48,6 +50,7 @@ LOCAL_APPS = [
     'payments.apps.PaymentsConfig',
     'ai.apps.AiConfig',
     'messages.apps.MessagesConfig',
+    'realtime.apps.RealtimeConfig',
 ]
 
 INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
@@ -55,7 +58,7 @@ INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'marketplace.middleware.AsyncWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -83,6 +86,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'marketplace.wsgi.application'
+ASGI_APPLICATION = 'marketplace.asgi.application'
 
 # Database
 # Enforce MySQL by default; configurable via environment
@@ -189,6 +193,8 @@ SIMPLE_JWT = {
 # CORS Settings
 CORS_ALLOW_ALL_ORIGINS = env.bool('CORS_ALLOW_ALL_ORIGINS', default=True)
 CORS_ALLOWED_ORIGINS = env.list('CORS_ALLOWED_ORIGINS', default=[])
+CORS_ALLOW_HEADERS = list(default_headers) + ['idempotency-key']
+CORS_EXPOSE_HEADERS = ['idempotent-replayed']
 
 # Email Configuration
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -199,22 +205,111 @@ EMAIL_HOST_USER = env('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = env('DEFAULT_FROM_EMAIL', default='noreply@maiguru.com')
 SITE_URL = env('SITE_URL', default='http://localhost:3000')
+EMAIL_TIMEOUT = env.int('EMAIL_TIMEOUT', default=20)
+
+# Email outbox (accounts.outbox); requests only insert rows, Celery sends them
+EMAIL_OUTBOX_BATCH_SIZE = env.int('EMAIL_OUTBOX_BATCH_SIZE', default=200)  # emails per claim and SMTP connection
+EMAIL_OUTBOX_LEASE_SECONDS = env.int('EMAIL_OUTBOX_LEASE_SECONDS', default=5 * 60)
+EMAIL_OUTBOX_MAX_ATTEMPTS = env.int('EMAIL_OUTBOX_MAX_ATTEMPTS', default=8)
+EMAIL_OUTBOX_RETRY_BACKOFF = env.int('EMAIL_OUTBOX_RETRY_BACKOFF', default=30)  # seconds, doubled per attempt
+EMAIL_OUTBOX_RETRY_BACKOFF_MAX = env.int('EMAIL_OUTBOX_RETRY_BACKOFF_MAX', default=60 * 60)
+EMAIL_OUTBOX_RUN_SECONDS = env.int('EMAIL_OUTBOX_RUN_SECONDS', default=4 * 60)  # per delivery task
+EMAIL_OUTBOX_KICK_SECONDS = env.int('EMAIL_OUTBOX_KICK_SECONDS', default=5)
+EMAIL_OUTBOX_SWEEP_SECONDS = env.int('EMAIL_OUTBOX_SWEEP_SECONDS', default=60)
 
 # AI Configuration
 OPENAI_API_KEY = env('OPENAI_API_KEY', default='')
+OPENAI_BASE_URL = env('OPENAI_BASE_URL', default='')  # e.g. http://127.0.0.1:8765/v1 for the stub server
+OPENAI_TIMEOUT = env.float('OPENAI_TIMEOUT', default=30.0)  # seconds per call, including queueing
+OPENAI_MAX_CONCURRENCY = env.int('OPENAI_MAX_CONCURRENCY', default=10)  # in-flight calls per event loop
+OPENAI_MAX_CONNECTIONS = env.int('OPENAI_MAX_CONNECTIONS', default=20)
+OPENAI_MAX_RETRIES = env.int('OPENAI_MAX_RETRIES', default=2)
+
+# Cache for repeated first-turn chatbot questions (see ai/cache.py)
+AI_RESPONSE_CACHE_ENABLED = env.bool('AI_RESPONSE_CACHE_ENABLED', default=True)
+AI_RESPONSE_CACHE_SESSION_TYPES = env.list('AI_RESPONSE_CACHE_SESSION_TYPES', default=['general_inquiry', 'client_support'])
+AI_RESPONSE_CACHE_TTL = env.int('AI_RESPONSE_CACHE_TTL', default=3600)
+AI_RESPONSE_CACHE_MAX_ENTRIES = env.int('AI_RESPONSE_CACHE_MAX_ENTRIES', default=512)
+AI_RESPONSE_CACHE_SIMILARITY = env.float('AI_RESPONSE_CACHE_SIMILARITY', default=0.9)  # 0 disables fuzzy matching
+
+# Market data behind price suggestions (see ai/market_data.py)
+MARKET_DATA_SOURCES = env.list('MARKET_DATA_SOURCES', default=[
+    'ai.market_data.FiverrSource',
+    'ai.market_data.UpworkSource',
+])
+MARKET_DATA_FIXTURE = env('MARKET_DATA_FIXTURE', default=str(BASE_DIR / 'ai' / 'sample_data' / 'market_listings.json'))
+MARKET_DATA_RETENTION_DAYS = env.int('MARKET_DATA_RETENTION_DAYS', default=30)
+
+# Price model trained by `manage.py train_price_model` (see ai/pricing_model.py)
+PRICE_MODEL_PATH = env('PRICE_MODEL_PATH', default=str(BASE_DIR / 'ai' / 'trained' / 'price_model.npz'))
 
 # Payment Gateway Configuration
 PAYPAL_CLIENT_ID = env('PAYPAL_CLIENT_ID', default='')
 PAYPAL_CLIENT_SECRET = env('PAYPAL_CLIENT_SECRET', default='')
 PAYPAL_MODE = env('PAYPAL_MODE', default='sandbox')  # sandbox or live
+PAYPAL_WEBHOOK_ID = env('PAYPAL_WEBHOOK_ID', default='')
 
 MPESA_CONSUMER_KEY = env('MPESA_CONSUMER_KEY', default='')
 MPESA_CONSUMER_SECRET = env('MPESA_CONSUMER_SECRET', default='')
 MPESA_SHORTCODE = env('MPESA_SHORTCODE', default='')
 MPESA_PASSKEY = env('MPESA_PASSKEY', default='')
+MPESA_INITIATOR_NAME = env('MPESA_INITIATOR_NAME', default='')
+MPESA_SECURITY_CREDENTIAL = env('MPESA_SECURITY_CREDENTIAL', default='')
+MPESA_BASE_URL = env('MPESA_BASE_URL', default='https://sandbox.safaricom.co.ke')
+# Public base URL of this API for the B2C ResultURL/QueueTimeOutURL callbacks
+MPESA_CALLBACK_BASE_URL = env('MPESA_CALLBACK_BASE_URL', default=SITE_URL)
+# Secret path segment of the callback URLs; Safaricom does not sign callbacks
+MPESA_CALLBACK_TOKEN = env('MPESA_CALLBACK_TOKEN', default='')
 
 WISE_API_KEY = env('WISE_API_KEY', default='')
 WISE_ENVIRONMENT = env('WISE_ENVIRONMENT', default='sandbox')
+WISE_PROFILE_ID = env('WISE_PROFILE_ID', default='')
+WISE_WEBHOOK_PUBLIC_KEY = env('WISE_WEBHOOK_PUBLIC_KEY', default='')  # PEM, from the Wise docs
+
+# Payment gateway HTTP clients (payments.services.http)
+PAYMENT_GATEWAY_CONNECT_TIMEOUT = env.float('PAYMENT_GATEWAY_CONNECT_TIMEOUT', default=3.05)
+PAYMENT_GATEWAY_READ_TIMEOUT = env.float('PAYMENT_GATEWAY_READ_TIMEOUT', default=20.0)
+PAYMENT_GATEWAY_RETRIES = env.int('PAYMENT_GATEWAY_RETRIES', default=2)
+PAYMENT_GATEWAY_BACKOFF = env.float('PAYMENT_GATEWAY_BACKOFF', default=0.5)
+PAYMENT_GATEWAY_POOL_SIZE = env.int('PAYMENT_GATEWAY_POOL_SIZE', default=10)
+PAYMENT_TOKEN_REFRESH_MARGIN = env.int('PAYMENT_TOKEN_REFRESH_MARGIN', default=60)  # seconds
+
+# Payout pipeline (payments.tasks)
+PAYOUT_MAX_RETRIES = env.int('PAYOUT_MAX_RETRIES', default=8)
+PAYOUT_RETRY_BACKOFF = env.int('PAYOUT_RETRY_BACKOFF', default=30)  # seconds, doubled per attempt
+PAYOUT_RETRY_BACKOFF_MAX = env.int('PAYOUT_RETRY_BACKOFF_MAX', default=60 * 60)
+PAYOUT_STALL_MINUTES = env.int('PAYOUT_STALL_MINUTES', default=90)  # keep above the backoff cap
+
+# Idempotency-Key handling (marketplace.idempotency)
+IDEMPOTENCY_TTL = env.int('IDEMPOTENCY_TTL', default=24 * 60 * 60)
+IDEMPOTENCY_LOCK_SECONDS = env.int('IDEMPOTENCY_LOCK_SECONDS', default=60)  # renewed while running; lapses after a crash
+IDEMPOTENCY_WAIT_SECONDS = env.float('IDEMPOTENCY_WAIT_SECONDS', default=10.0)
+
+# Gateway webhooks (payments.webhooks)
+WEBHOOK_BATCH_SIZE = env.int('WEBHOOK_BATCH_SIZE', default=200)
+WEBHOOK_SWEEP_SECONDS = env.int('WEBHOOK_SWEEP_SECONDS', default=60)
+
+# Batch payout runs (payments.batch_payouts)
+PAYOUT_BATCH_GATEWAYS = {
+    'paypal': 'payments.batch_payouts.PayPalBatchGateway',
+    'wise': 'payments.batch_payouts.WiseBatchGateway',
+}
+PAYOUT_BATCH_PAYPAL_MAX_ITEMS = env.int('PAYOUT_BATCH_PAYPAL_MAX_ITEMS', default=15000)
+PAYOUT_BATCH_WISE_MAX_ITEMS = env.int('PAYOUT_BATCH_WISE_MAX_ITEMS', default=1000)
+
+# Platform fees (payments.money). Keys are "<task category>:<payment method>"
+# with "*" as a wildcard; tiers are marginal (up_to, rate) pairs.
+PLATFORM_FEE_SCHEDULES = {
+    '*:*': {'tiers': [(None, '0.10')]},
+}
+
+# Display exchange rates (payments.fx); transfers always use a live Wise quote
+FX_RATE_PAIRS = [('USD', 'KES'), ('KES', 'USD'), ('EUR', 'KES'), ('GBP', 'KES')]
+FX_RATE_REFRESH_SECONDS = env.int('FX_RATE_REFRESH_SECONDS', default=15 * 60)
+FX_RATE_FRESH_SECONDS = env.int('FX_RATE_FRESH_SECONDS', default=30 * 60)
+FX_RATE_MAX_AGE_SECONDS = env.int('FX_RATE_MAX_AGE_SECONDS', default=24 * 60 * 60)
+FX_RATE_CHECK_SECONDS = env.int('FX_RATE_CHECK_SECONDS', default=30)  # per-process re-read of the shared cache
+FX_RATE_REFRESH_LOCK_SECONDS = env.int('FX_RATE_REFRESH_LOCK_SECONDS', default=60)
 
 # File Upload Settings
 MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10MB
@@ -234,6 +329,36 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    'refresh-market-data': {
+        'task': 'ai.tasks.refresh_market_data',
+        'schedule': env.int('MARKET_DATA_REFRESH_SECONDS', default=6 * 60 * 60),
+    },
+    'process-pending-webhooks': {
+        'task': 'payments.tasks.process_pending_webhooks',
+        'schedule': WEBHOOK_SWEEP_SECONDS,
+    },
+    'refresh-fx-rates': {
+        'task': 'payments.tasks.refresh_fx_rates',
+        'schedule': FX_RATE_REFRESH_SECONDS,
+    },
+    'deliver-outbox': {
+        'task': 'accounts.tasks.deliver_outbox',
+        'schedule': EMAIL_OUTBOX_SWEEP_SECONDS,
+    },
+    'prune-realtime-events': {
+        'task': 'realtime.tasks.prune_user_events',
+        'schedule': 60 * 60,
+    },
+    'repair-unread-counters': {
+        'task': 'realtime.tasks.repair_unread_counters',
+        'schedule': 60 * 60,
+    },
+    'resume-stalled-payouts': {
+        'task': 'payments.tasks.resume_stalled_payouts',
+        'schedule': 10 * 60,
+    },
+}
 
 # Security Settings
 SECURE_BROWSER_XSS_FILTER = True
@@ -256,6 +381,25 @@ CACHES = {
     }
 }
 
+# Channels (WebSocket push, see realtime.consumers). Set
+# CHANNEL_LAYER_BACKEND=channels.layers.InMemoryChannelLayer for tests and
+# single-process development.
+CHANNEL_LAYER_BACKEND = env('CHANNEL_LAYER_BACKEND', default='channels_redis.core.RedisChannelLayer')
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': CHANNEL_LAYER_BACKEND,
+        'CONFIG': {
+            'hosts': [env('CHANNEL_REDIS_URL', default='redis://127.0.0.1:6379/2')],
+            'capacity': 200,  # messages buffered per connection before the layer drops
+            'expiry': 30,
+        } if CHANNEL_LAYER_BACKEND.startswith('channels_redis') else {'capacity': 200, 'expiry': 30},
+    }
+}
+REALTIME_MAX_UNACKED = env.int('REALTIME_MAX_UNACKED', default=100)  # events in flight per connection
+REALTIME_RESUME_LIMIT = env.int('REALTIME_RESUME_LIMIT', default=500)  # larger gaps resync over REST
+REALTIME_REPLAY_GRACE_SECONDS = env.int('REALTIME_REPLAY_GRACE_SECONDS', default=60)  # late commits replayed on resume
+REALTIME_EVENT_RETENTION_HOURS = env.int('REALTIME_EVENT_RETENTION_HOURS', default=24)
+
 # Logging Configuration
 LOGGING = {
     'version': 1,
@@ -0,0 +1,259 @@
+import asyncio
+import base64
+import json
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from accounts.models import User
+from tasks.models import Task
+
+from .idempotency import REPLAYED_HEADER, idempotent
+from .middleware import AsyncWhiteNoiseMiddleware
+
+
+class AsyncWhiteNoiseMiddlewareTests(SimpleTestCase):
+    """Static files are still served, and other requests stay on the event loop"""
+
+    def setUp(self):
+        self.static_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.static_root.cleanup)
+        Path(self.static_root.name, 'app.css').write_text('body{}')
+        settings = override_settings(STATIC_ROOT=self.static_root.name, STATIC_URL='/static/',
+                                     WHITENOISE_AUTOREFRESH=False)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.factory = RequestFactory()
+
+    async def test_passes_through_on_the_event_loop(self):
+        threads = []
+
+        async def get_response(request):
+            threads.append(threading.get_ident())
+            return HttpResponse('view')
+
+        middleware = AsyncWhiteNoiseMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        response = await middleware(self.factory.get('/api/tasks/'))
+        self.assertEqual(response.content, b'view')
+        self.assertEqual(threads, [threading.get_ident()])
+
+    async def test_serves_static_files(self):
+        async def get_response(request):
+            raise AssertionError('static requests must not reach the view')
+
+        response = await AsyncWhiteNoiseMiddleware(get_response)(self.factory.get('/static/app.css'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'body{}')
+        response.close()
+
+    def test_stays_sync_under_wsgi(self):
+        middleware = AsyncWhiteNoiseMiddleware(lambda request: HttpResponse('view'))
+        self.assertFalse(asyncio.iscoroutinefunction(middleware))
+        self.assertEqual(middleware(self.factory.get('/api/tasks/')).content, b'view')
+
+
+class PageNumberOrKeysetPaginationTests(TestCase):
+    """``/api/tasks/`` pages by number unless the client asks for cursors"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='client', email='client@example.com', password='x')
+        now = timezone.now()
+        for i in range(22):
+            Task.objects.create(
+                title=f'Task {i}', description='d', category='ai_ml', complexity='simple',
+                budget_range='100_500', deadline=now + timedelta(days=7), client=cls.user,
+            )
+        # Every third task shares a timestamp with its neighbours, so the pk has to break ties
+        for i, task in enumerate(Task.objects.order_by('pk')):
+            Task.objects.filter(pk=task.pk).update(created_at=now - timedelta(minutes=i // 3))
+        cls.expected = list(Task.objects.order_by('-created_at', '-pk').values_list('pk', flat=True))
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def get(self, url, **params):
+        response = self.api.get(url, params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def ids(self, page):
+        return [row['id'] for row in page['results']]
+
+    def cursor(self, data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip('=')
+
+    def test_page_number_response_is_unchanged_by_default(self):
+        page = self.get('/api/tasks/')
+        self.assertEqual(list(page), ['count', 'next', 'previous', 'results'])
+        self.assertEqual(page['count'], 22)
+        self.assertIn('page=2', page['next'])
+        self.assertEqual(len(page['results']), 20)
+        self.assertEqual(len(self.get('/api/tasks/', page=2)['results']), 2)
+
+    def test_cursor_mode_is_opt_in(self):
+        page = self.get('/api/tasks/', pagination='cursor', page_size=5)
+        self.assertEqual(list(page), ['next', 'previous', 'results'])
+        self.assertIsNone(page['previous'])
+        self.assertIn('cursor=', page['next'])
+        self.assertEqual(self.ids(page), self.expected[:5])
+
+    def test_cursor_round_trip_breaks_ties_by_pk(self):
+        pages = [self.get('/api/tasks/', pagination='cursor', page_size=4)]
+        while pages[-1]['next']:
+            pages.append(self.get(pages[-1]['next']))
+        self.assertEqual([pk for page in pages for pk in self.ids(page)], self.expected)
+        self.assertEqual(len(pages), 6)
+
+        back = [pages[-1]]
+        while back[-1]['previous']:
+            back.append(self.get(back[-1]['previous']))
+        self.assertEqual([self.ids(page) for page in reversed(back)], [self.ids(page) for page in pages])
+
+    def test_cursor_link_alone_selects_cursor_mode(self):
+        first = self.get('/api/tasks/', pagination='cursor', page_size=4)
+        cursor = first['next'].split('cursor=')[1].split('&')[0]
+        page = self.get('/api/tasks/', cursor=cursor, page_size=4)
+        self.assertEqual(list(page), ['next', 'previous', 'results'])
+        self.assertEqual(self.ids(page), self.expected[4:8])
+
+    def test_rejects_malformed_or_tampered_cursors(self):
+        task = Task.objects.get(pk=self.expected[3])
+        valid = {'p': task.created_at.isoformat(), 'i': task.pk}
+        cursors = [
+            'not a cursor!',
+            base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+            self.cursor(valid)[:-3],
+            self.cursor([valid['p'], valid['i']]),
+            self.cursor({'p': valid['p']}),
+            self.cursor({**valid, 'p': 'yesterday'}),
+            self.cursor({**valid, 'p': 12}),
+            self.cursor({**valid, 'i': 'one'}),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.api.get('/api/tasks/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(response.data['detail'], 'Invalid cursor')
+
+
+@override_settings(IDEMPOTENCY_WAIT_SECONDS=5.0)
+class IdempotencyTests(SimpleTestCase):
+    """``@idempotent`` replays successes, coalesces retries and lets failures retry"""
+
+    def setUp(self):
+        self.key = uuid.uuid4().hex
+        self.calls = 0
+        self.outcomes = []
+        self.release = threading.Event()
+        self.release.set()
+        self.factory = APIRequestFactory()
+
+        @api_view(['POST'])
+        @authentication_classes([])
+        @permission_classes([AllowAny])
+        @idempotent
+        def pay(request):
+            self.calls += 1
+            self.release.wait(5)
+            outcome = self.outcomes.pop(0) if self.outcomes else status.HTTP_201_CREATED
+            if isinstance(outcome, Exception):
+                raise outcome
+            return Response({'call': self.calls, 'amount': request.data.get('amount')}, status=outcome)
+
+        self.view = pay
+
+    def post(self, amount=10, key=None, user=None):
+        request = self.factory.post('/pay/', {'amount': amount}, format='json',
+                                    HTTP_IDEMPOTENCY_KEY=key or self.key)
+        if user is not None:
+            force_authenticate(request, user)
+        return self.view(request)
+
+    def post_in_thread(self, **kwargs):
+        result = {}
+        thread = threading.Thread(target=lambda: result.setdefault('response', self.post(**kwargs)))
+        thread.start()
+        return thread, result
+
+    def test_replays_a_cached_success(self):
+        first = self.post()
+        second = self.post()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual((second.status_code, second.data), (201, {'call': 1, 'amount': 10}))
+        self.assertNotIn(REPLAYED_HEADER, first)
+        self.assertEqual(second[REPLAYED_HEADER], 'true')
+
+    def test_different_request_with_the_same_key_is_rejected(self):
+        self.post(amount=10)
+        response = self.post(amount=99)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.calls, 1)
+
+    def test_keys_are_scoped_to_the_user(self):
+        self.post(user=User(pk=1, username='a'))
+        response = self.post(user=User(pk=2, username='b'))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.calls, 2)
+
+    def test_concurrent_retry_waits_for_the_first_result(self):
+        self.release.clear()
+        first, first_result = self.post_in_thread()
+        while not self.calls:
+            time.sleep(0.01)
+        retry, retry_result = self.post_in_thread()
+        time.sleep(0.2)
+        self.release.set()
+        first.join()
+        retry.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(retry_result['response'].data, first_result['response'].data)
+        self.assertEqual(retry_result['response'][REPLAYED_HEADER], 'true')
+
+    @override_settings(IDEMPOTENCY_WAIT_SECONDS=0.2)
+    def test_conflict_when_the_first_request_is_still_running(self):
+        self.release.clear()
+        first, _ = self.post_in_thread()
+        while not self.calls:
+            time.sleep(0.01)
+        try:
+            response = self.post()
+        finally:
+            self.release.set()
+            first.join()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.post()[REPLAYED_HEADER], 'true')
+
+    def test_error_response_releases_the_key(self):
+        self.outcomes = [status.HTTP_502_BAD_GATEWAY]
+        self.assertEqual(self.post().status_code, 502)
+        response = self.post()
+        self.assertEqual((response.status_code, self.calls), (201, 2))
+        self.assertNotIn(REPLAYED_HEADER, response)
+
+    def test_exception_releases_the_key(self):
+        self.outcomes = [RuntimeError('gateway exploded')]
+        with self.assertRaises(RuntimeError):
+            self.post()
+        response = self.post()
+        self.assertEqual((response.status_code, self.calls), (201, 2))
+
+    def test_requests_without_a_key_always_run(self):
+        for _ in range(2):
+            self.view(self.factory.post('/pay/', {'amount': 10}, format='json'))
+        self.assertEqual(self.calls, 2)
@@ -3,19 +3,21 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
 # ViewSets and APIViews
-from tasks.views import TaskViewSet
+from tasks.views import TaskMessageViewSet, TaskViewSet
 from payments.views import PaymentIntentViewSet, ExpertPayoutViewSet, create_paypal_order
 from messages.views import MessageViewSet, ReviewViewSet
 from accounts.views import (
     CurrentUserView,
     UserViewSet,
     ExpertInvitationViewSet,
+    NotificationViewSet,
 )
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from ai.views import ChatbotView, PriceSuggestionView
+from ai.views import BatchPriceSuggestionView, ChatbotView, PriceSuggestionView, ResponseCacheStatsView
 from messages.views import InvoiceListCreateView
 
 router = DefaultRouter()
+router.register(r'task-messages', TaskMessageViewSet, basename='task-messages')
 router.register(r'tasks', TaskViewSet, basename='tasks')
 router.register(r'payments/intents', PaymentIntentViewSet, basename='payment-intents')
 router.register(r'payments/payouts', ExpertPayoutViewSet, basename='expert-payouts')
@@ -23,6 +25,7 @@ router.register(r'messages', MessageViewSet, basename='messages')
 router.register(r'messages/reviews', ReviewViewSet, basename='reviews')
 router.register(r'accounts/users', UserViewSet, basename='users')
 router.register(r'accounts/invitations', ExpertInvitationViewSet, basename='expert-invitations')
+router.register(r'accounts/notifications', NotificationViewSet, basename='notifications')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -44,7 +47,9 @@ urlpatterns = [
     # AI endpoints (direct + under /api/ai/)
     path('api/chatbot/', ChatbotView.as_view(), name='chatbot_root'),
     path('api/ai/chatbot/', ChatbotView.as_view(), name='chatbot'),
+    path('api/ai/chatbot/cache-stats/', ResponseCacheStatsView.as_view(), name='chatbot_cache_stats'),
     path('api/ai/price-suggestion/', PriceSuggestionView.as_view(), name='price_suggestion'),
+    path('api/ai/price-suggestion/batch/', BatchPriceSuggestionView.as_view(), name='price_suggestion_batch'),
 
     # Compatibility aliases for existing frontend code
     path('api/admin/chatbot/', ChatbotView.as_view(), name='admin_chatbot'),
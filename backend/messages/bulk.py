@@ -0,0 +1,117 @@
+"""
+Bulk operations on messages and task messages
+
+Each operation is one statement over the selected rows:
+``UPDATE ... WHERE id IN (...)`` for an id list, or a range update for
+"everything in this thread up to message N". ``read_at`` and
+``archived_at`` are set on the server. Opening a long thread therefore
+costs one write, not one write per message.
+
+Marking read first locks the unread rows it will change. That keeps the
+unread counters (realtime.unread), the conversation unread counts and the
+published event exact when two tabs mark the same messages at once. Each
+affected user gets one aggregated realtime event with the ids, not one
+event per message.
+"""
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, List
+
+from django.db import transaction
+from django.utils import timezone
+
+from realtime import unread
+from realtime.events import publish
+from tasks.models import TaskMessage
+
+from .conversations import rebuild_summaries
+from .models import Conversation, Message
+
+MAX_BULK_IDS = 500
+
+
+@dataclass(frozen=True)
+class MessageStore:
+    """How bulk operations reach one message channel"""
+    model: type
+    channel: str
+    counter: str         # realtime.unread kind
+    thread_field: str    # rows sharing this field form a thread
+    event: str           # realtime event kind for read receipts
+
+    def rows(self):
+        return Message.objects.filter(channel=self.channel)
+
+
+MESSAGES = MessageStore(Message, Message.CHANNEL_DIRECT, 'messages', 'conversation_id', 'messages_read')
+TASK_MESSAGES = MessageStore(TaskMessage, Message.CHANNEL_TASK, 'task_messages', 'task_id', 'task_messages_read')
+
+
+def mark_read(store: MessageStore, user, queryset) -> List[int]:
+    """Mark the user's unread messages in ``queryset`` as read; returns their ids"""
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            queryset.filter(recipient=user, is_read=False).select_for_update()
+            .values_list('pk', 'sender_id', store.thread_field)
+        )
+        if not rows:
+            return []
+        ids = [pk for pk, _, _ in rows]
+        Message.objects.filter(pk__in=ids).update(is_read=True, read_at=now)
+
+        unread.adjust(user.pk, store.counter, -len(ids))
+        if store.thread_field == 'conversation_id':
+            for conversation_id, count in Counter(thread for _, _, thread in rows if thread).items():
+                Conversation.mark_read(conversation_id, user.pk, count)
+
+        by_sender: Dict[int, List[int]] = defaultdict(list)
+        for pk, sender_id, _ in rows:
+            by_sender[sender_id].append(pk)
+        data = {'reader': user.pk, 'read_at': now.isoformat()}
+        publish([user.pk], store.event, {**data, 'ids': ids})
+        for sender_id, sender_ids in by_sender.items():
+            if sender_id != user.pk:
+                publish([sender_id], store.event, {**data, 'ids': sender_ids})
+    return ids
+
+
+def mark_ids_read(store: MessageStore, user, ids: List[int]) -> List[int]:
+    return mark_read(store, user, store.rows().filter(pk__in=ids))
+
+
+def mark_thread_read(store: MessageStore, user, thread_id: int, up_to: int = None) -> List[int]:
+    """Mark a thread read, up to and including message ``up_to`` when given"""
+    queryset = store.rows().filter(**{store.thread_field: thread_id})
+    if up_to is not None:
+        queryset = queryset.filter(pk__lte=up_to)
+    return mark_read(store, user, queryset)
+
+
+def archive(store: MessageStore, user, ids: List[int]) -> int:
+    """Archive received messages; returns how many were archived"""
+    return store.rows().filter(pk__in=ids, recipient=user, archived_at__isnull=True).update(
+        archived_at=timezone.now()
+    )
+
+
+def delete(store: MessageStore, user, ids: List[int]) -> int:
+    """
+    Delete messages the user sent; returns how many were deleted
+
+    Replies cascade through ``parent_message``, so a message that has
+    replies is blanked instead and its row kept. The replies, which may be
+    someone else's, stay where they are.
+    """
+    with transaction.atomic():
+        queryset = store.model.objects.filter(channel=store.channel, pk__in=ids, sender=user)
+        threads = set()
+        if store.thread_field == 'conversation_id':
+            threads = set(queryset.exclude(conversation__isnull=True).values_list('conversation_id', flat=True))
+        answered = queryset.filter(replies__isnull=False).distinct()
+        blanked = Message.objects.filter(pk__in=list(answered.values_list('pk', flat=True))).update(
+            subject='', content=''
+        )
+        deleted, _ = queryset.filter(replies__isnull=True).delete()
+        rebuild_summaries(threads)
+    return blanked + deleted
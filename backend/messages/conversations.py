@@ -0,0 +1,109 @@
+"""
+Conversation backfill and repair
+
+``Message.save`` keeps conversations current for new messages. Messages
+written before conversations existed, or through ``bulk_create`` and
+``QuerySet.update``, are brought in line here. Everything runs in batches
+of messages or conversations, one transaction per batch.
+"""
+import logging
+from typing import Iterable, List
+
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Conversation, ConversationParticipant, Message
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+def backfill_conversations(batch_size: int = BATCH_SIZE) -> int:
+    """Attach messages without a conversation to their thread's; returns how many were attached"""
+    attached = 0
+    last_id = 0
+    while True:
+        batch = list(
+            Message.objects.filter(channel=Message.CHANNEL_DIRECT, conversation__isnull=True, pk__gt=last_id)
+            .order_by('pk').only('id', 'subject', 'task_id', 'parent_message_id')[:batch_size]
+        )
+        if not batch:
+            return attached
+        last_id = batch[-1].pk
+        with transaction.atomic():
+            attached += _attach(batch)
+
+
+def _attach(batch: List[Message]) -> int:
+    parent_ids = {m.parent_message_id for m in batch if m.parent_message_id}
+    assigned = dict(
+        Message.objects.filter(pk__in=parent_ids, conversation__isnull=False).values_list('pk', 'conversation_id')
+    )
+    in_batch = {m.pk for m in batch}
+    # Replies point at lower ids, so a parent in this batch is assigned before its children
+    roots = [
+        m for m in batch
+        if m.parent_message_id is None or (m.parent_message_id not in assigned and m.parent_message_id not in in_batch)
+    ]
+    conversations = Conversation.objects.bulk_create([Conversation(subject=m.subject, task_id=m.task_id) for m in roots])
+    for message, conversation in zip(roots, conversations):
+        assigned[message.pk] = conversation.pk
+    for message in batch:
+        if message.pk not in assigned:
+            assigned[message.pk] = assigned.get(message.parent_message_id)
+        message.conversation_id = assigned[message.pk]
+    batch = [m for m in batch if m.conversation_id]
+    Message.objects.bulk_update(batch, ['conversation'])
+    rebuild_summaries({m.conversation_id for m in batch})
+    return len(batch)
+
+
+def rebuild_summaries(conversation_ids: Iterable[int]):
+    """Recompute the summary and inbox rows of the given conversations from their messages"""
+    ids = list(conversation_ids)
+    if not ids:
+        return
+    latest = Message.objects.filter(conversation=OuterRef('pk')).order_by('-created_at', '-id')
+    counts = (
+        Message.objects.filter(conversation=OuterRef('pk')).order_by()
+        .values('conversation').annotate(total=Count('id')).values('total')
+    )
+    Conversation.objects.filter(pk__in=ids).update(
+        last_message=Subquery(latest.values('pk')[:1]),
+        last_message_at=Subquery(latest.values('created_at')[:1]),
+        message_count=Coalesce(Subquery(counts), 0),
+    )
+
+    members = {}
+    messages = Message.objects.filter(conversation_id__in=ids).order_by()
+    for row in messages.values('conversation_id', 'sender_id').annotate(last=Max('created_at')):
+        members[row['conversation_id'], row['sender_id']] = [row['last'], 0]
+    received = messages.values('conversation_id', 'recipient_id').annotate(
+        last=Max('created_at'), unread=Count('id', filter=Q(is_read=False)),
+    )
+    for row in received:
+        member = members.setdefault((row['conversation_id'], row['recipient_id']), [row['last'], 0])
+        member[0] = max(member[0], row['last'])
+        member[1] = row['unread']
+
+    with transaction.atomic():
+        ConversationParticipant.objects.filter(conversation_id__in=ids).delete()
+        ConversationParticipant.objects.bulk_create([
+            ConversationParticipant(conversation_id=conversation_id, user_id=user_id, last_activity_at=last, unread_count=unread)
+            for (conversation_id, user_id), (last, unread) in members.items()
+        ])
+
+
+def rebuild_all(batch_size: int = BATCH_SIZE) -> int:
+    """Rebuild every conversation's summary; returns how many were rebuilt"""
+    rebuilt = 0
+    last_id = 0
+    while True:
+        ids = list(Conversation.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return rebuilt
+        last_id = ids[-1]
+        rebuild_summaries(ids)
+        rebuilt += len(ids)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from messages.conversations import backfill_conversations, rebuild_all
+
+
+class Command(BaseCommand):
+    help = "Attach messages without a conversation to their thread, optionally rebuilding every summary"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Messages or conversations per transaction')
+        parser.add_argument('--rebuild', action='store_true', help='Also recompute all conversation summaries')
+
+    def handle(self, *args, **options):
+        attached = backfill_conversations(options['batch_size'])
+        self.stdout.write(f"Attached {attached} messages to conversations")
+        if options['rebuild']:
+            rebuilt = rebuild_all(options['batch_size'])
+            self.stdout.write(f"Rebuilt {rebuilt} conversations")
+        self.stderr.write(self.style.SUCCESS('Done'))
@@ -1,11 +1,88 @@
 """
 Message and communication models for Mai-Guru platform
 """
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, Q, Value, When
 from django.utils import timezone
 from accounts.models import User
-from tasks.models import Task
-from payments.models import Invoice  # use unified Invoice model from payments app
+from realtime import unread
+
+# Task is referenced as 'tasks.Task': tasks.models defines the TaskMessage
+# and TaskReview proxies on top of these models and imports this module.
+
+
+class Conversation(models.Model):
+    """
+    A thread of messages (a root message and its replies) with a summary
+    kept current as messages are created, so an inbox never scans messages
+    """
+    subject = models.CharField(max_length=200, blank=True)
+    task = models.ForeignKey('tasks.Task', on_delete=models.CASCADE, null=True, blank=True, related_name='conversations')
+    last_message = models.ForeignKey('Message', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    message_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.subject or f"Conversation {self.pk}"
+
+    @classmethod
+    def for_message(cls, message):
+        """The reply's thread, or a new conversation for a root message"""
+        if message.parent_message_id and message.parent_message.conversation_id:
+            return cls(pk=message.parent_message.conversation_id)
+        return cls.objects.create(subject=message.subject, task_id=message.task_id)
+
+    def record(self, message):
+        """Fold a newly created message into the summary and its participants' inbox rows"""
+        at = message.created_at
+        # Guarded so a message committing late never replaces a newer last message
+        newest = Q(last_message_at__isnull=True) | Q(last_message_at__lte=at)
+        Conversation.objects.filter(pk=self.pk).update(
+            message_count=F('message_count') + 1,
+            last_message=Case(When(newest, then=Value(message.pk)), default=F('last_message'), output_field=models.BigIntegerField()),
+            last_message_at=Case(When(newest, then=Value(at)), default=F('last_message_at'), output_field=models.DateTimeField()),
+        )
+
+        user_ids = {message.sender_id, message.recipient_id}
+        ConversationParticipant.objects.bulk_create(
+            [ConversationParticipant(conversation=self, user_id=user_id, last_activity_at=at) for user_id in user_ids],
+            ignore_conflicts=True,
+        )
+        members = ConversationParticipant.objects.filter(conversation=self)
+        members.filter(user_id__in=user_ids, last_activity_at__lt=at).update(last_activity_at=at)
+        if not message.is_read:
+            members.filter(user_id=message.recipient_id).update(unread_count=F('unread_count') + 1)
+
+    @staticmethod
+    def mark_read(conversation_id, user_id, count):
+        """Take ``count`` newly read messages off ``user_id``'s unread count"""
+        if count:
+            ConversationParticipant.objects.filter(conversation_id=conversation_id, user_id=user_id).update(
+                unread_count=Case(When(unread_count__gt=count, then=F('unread_count') - count), default=0)
+            )
+
+
+class ConversationParticipant(models.Model):
+    """
+    One user's inbox row for a conversation. ``last_activity_at`` is copied
+    from the conversation so the inbox is a single range scan of
+    ``conv_inbox_idx``
+    """
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='participants')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversation_memberships')
+    unread_count = models.PositiveIntegerField(default=0)
+    last_activity_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['conversation', 'user']
+        ordering = ['-last_activity_at', '-id']
+        indexes = [
+            models.Index(fields=['user', '-last_activity_at', '-id'], name='conv_inbox_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} in {self.conversation}"
 
 
 class Message(models.Model):
@@ -17,6 +94,17 @@ class Message(models.Model):
         ('task_related', 'Task Related'),
         ('support', 'Support'),
         ('notification', 'Notification'),
+        # Task channel (tasks.TaskMessage)
+        ('question', 'Question'),
+        ('update', 'Update'),
+        ('feedback', 'Feedback'),
+        ('urgent', 'Urgent'),
+    ]
+    CHANNEL_DIRECT = 'direct'
+    CHANNEL_TASK = 'task'
+    CHANNEL_CHOICES = [
+        (CHANNEL_DIRECT, 'Direct'),
+        (CHANNEL_TASK, 'Task'),
     ]
     
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
@@ -24,35 +112,59 @@ class Message(models.Model):
     subject = models.CharField(max_length=200, blank=True)
     content = models.TextField()
     message_type = models.CharField(max_length=15, choices=MESSAGE_TYPES, default='general')
+    channel = models.CharField(max_length=10, choices=CHANNEL_CHOICES, default=CHANNEL_DIRECT)
     is_read = models.BooleanField(default=False)
     read_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     # Optional task reference
-    task = models.ForeignKey(Task, on_delete=models.CASCADE, null=True, blank=True, related_name='messages')
+    task = models.ForeignKey('tasks.Task', on_delete=models.CASCADE, null=True, blank=True, related_name='messages')
     
     # Message threading
     parent_message = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, null=True, blank=True, related_name='messages')
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['recipient', 'is_read', '-created_at'], name='msg_recipient_read_created_idx'),
+            models.Index(fields=['conversation', 'created_at'], name='msg_conversation_created_idx'),
+            models.Index(fields=['task', 'channel', 'created_at'], name='msg_task_thread_idx'),
+        ]
     
     def __str__(self):
         return f"Message from {self.sender.username} to {self.recipient.username}"
+
+    def save(self, *args, **kwargs):
+        # Task messages are threaded by task, not by conversation
+        if not self._state.adding or self.channel != self.CHANNEL_DIRECT:
+            return super().save(*args, **kwargs)
+        # The message and its conversation summary commit together
+        with transaction.atomic():
+            if self.conversation_id is None:
+                self.conversation = Conversation.for_message(self)
+            super().save(*args, **kwargs)
+            self.conversation.record(self)
     
     def mark_as_read(self):
         """Mark message as read"""
         if not self.is_read:
+            read_at = timezone.now()
+            # Conditional UPDATE so a concurrent read decrements the counter once
+            changed = unread.mark_read(Message.objects.filter(pk=self.pk), unread.kind_for(self), self.recipient_id, read_at=read_at)
+            if changed and self.conversation_id:
+                Conversation.mark_read(self.conversation_id, self.recipient_id, changed)
             self.is_read = True
-            self.read_at = timezone.now()
-            self.save(update_fields=['is_read', 'read_at'])
+            self.read_at = read_at
+            unread.remember(self)
 
 
 class Review(models.Model):
     """
     Client reviews for completed tasks
     """
-    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='reviews')
+    task = models.ForeignKey('tasks.Task', on_delete=models.CASCADE, related_name='reviews')
     client = models.ForeignKey(User, on_delete=models.CASCADE, related_name='given_reviews')
     expert = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_reviews')
     rating = models.PositiveIntegerField(choices=[(i, i) for i in range(1, 6)])
@@ -64,6 +176,9 @@ class Review(models.Model):
     class Meta:
         unique_together = ['task', 'client']
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['expert', 'is_public', '-created_at'], name='review_expert_public_idx'),
+        ]
     
     def __str__(self):
         return f"Review for {self.task.title} - {self.rating} stars"
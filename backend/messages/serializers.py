@@ -2,7 +2,8 @@
 Serializers for messages app
 """
 from rest_framework import serializers
-from .models import Message, Review
+from .bulk import MAX_BULK_IDS
+from .models import ConversationParticipant, Message, Review
 from payments.models import Invoice
 from tasks.serializers import TaskSerializer
 from accounts.serializers import UserSerializer
@@ -20,14 +21,57 @@ class MessageSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'sender', 'sender_name', 'recipient', 'recipient_name',
             'subject', 'content', 'message_type', 'message_type_display',
-            'is_read', 'read_at', 'created_at', 'task', 'task_title',
-            'parent_message'
+            'is_read', 'read_at', 'archived_at', 'created_at', 'task', 'task_title',
+            'parent_message', 'conversation'
         ]
         read_only_fields = [
-            'id', 'sender', 'is_read', 'read_at', 'created_at'
+            'id', 'sender', 'is_read', 'read_at', 'archived_at', 'created_at', 'conversation'
         ]
 
 
+class LastMessageSerializer(serializers.ModelSerializer):
+    """Preview of a conversation's latest message"""
+    sender_name = serializers.CharField(source='sender.get_full_name', read_only=True)
+    preview = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Message
+        fields = ['id', 'sender', 'sender_name', 'recipient', 'preview', 'is_read', 'created_at']
+
+    def get_preview(self, obj):
+        return obj.content[:200]
+
+
+class InboxEntrySerializer(serializers.ModelSerializer):
+    """A conversation as it appears in one user's inbox"""
+    conversation = serializers.IntegerField(source='conversation_id', read_only=True)
+    subject = serializers.CharField(source='conversation.subject', read_only=True)
+    task = serializers.IntegerField(source='conversation.task_id', read_only=True)
+    message_count = serializers.IntegerField(source='conversation.message_count', read_only=True)
+    last_message = LastMessageSerializer(source='conversation.last_message', read_only=True)
+
+    class Meta:
+        model = ConversationParticipant
+        fields = [
+            'conversation', 'subject', 'task', 'message_count', 'unread_count',
+            'last_activity_at', 'last_message'
+        ]
+        read_only_fields = fields
+
+
+class BulkMessageIdsSerializer(serializers.Serializer):
+    """Ids for a bulk message operation"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=MAX_BULK_IDS
+    )
+
+
+class ThreadReadSerializer(serializers.Serializer):
+    """A thread (conversation or task) to mark read, optionally only up to a message id"""
+    thread = serializers.IntegerField(min_value=1)
+    up_to = serializers.IntegerField(min_value=1, required=False)
+
+
 class ReviewSerializer(serializers.ModelSerializer):
     """Serializer for Review"""
     client_name = serializers.CharField(source='client.get_full_name', read_only=True)
@@ -1,12 +1,25 @@
 # messages/views.py
 from rest_framework import generics, permissions, viewsets
-from .models import Message
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from marketplace.pagination import KeysetPagination, PageNumberOrKeysetPagination
+from . import bulk
+from .models import ConversationParticipant, Message
 from .models import Review
 from payments.models import Invoice
-from .serializers import MessageSerializer, ReviewSerializer, InvoiceSerializer
+from .serializers import (
+    BulkMessageIdsSerializer, InboxEntrySerializer, MessageSerializer, ReviewSerializer,
+    InvoiceSerializer, ThreadReadSerializer,
+)
+
+
+class InboxPagination(KeysetPagination):
+    """Keyset pages of inbox rows, most recently active first (``conv_inbox_idx``)"""
+    timestamp_field = 'last_activity_at'
+
 
 class MessageListCreateView(generics.ListCreateAPIView):
-    queryset = Message.objects.all()
+    queryset = Message.objects.filter(channel=Message.CHANNEL_DIRECT)
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -20,11 +33,72 @@ class InvoiceListCreateView(generics.ListCreateAPIView):
     serializer_class = InvoiceSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+class BulkMessageActionsMixin:
+    """
+    Bulk endpoints for a message viewset; ``bulk_store`` names the model
+    (see messages.bulk). Each takes ``{"ids": [...]}`` except read_thread,
+    which takes ``{"thread": <conversation or task id>, "up_to": <message id>}``
+    """
+    bulk_store = None
+
+    def get_queryset(self):
+        return self.filter_archived(super().get_queryset())
+
+    def filter_archived(self, queryset):
+        """``?archived=true|false`` keeps only archived or unarchived messages"""
+        archived = self.request.query_params.get('archived')
+        if archived in ('true', 'false'):
+            queryset = queryset.filter(archived_at__isnull=archived == 'false')
+        return queryset
+
+    def bulk_ids(self, request):
+        serializer = BulkMessageIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['ids']
+
+    @action(detail=False, methods=['post'])
+    def bulk_read(self, request):
+        """Mark the given received messages read"""
+        ids = bulk.mark_ids_read(self.bulk_store, request.user, self.bulk_ids(request))
+        return Response({'updated': len(ids), 'ids': ids})
+
+    @action(detail=False, methods=['post'])
+    def read_thread(self, request):
+        """Mark a thread's received messages read, up to ``up_to`` when given"""
+        serializer = ThreadReadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = bulk.mark_thread_read(
+            self.bulk_store, request.user, serializer.validated_data['thread'], serializer.validated_data.get('up_to')
+        )
+        return Response({'updated': len(ids), 'ids': ids})
+
+    @action(detail=False, methods=['post'])
+    def bulk_archive(self, request):
+        """Archive the given received messages"""
+        return Response({'updated': bulk.archive(self.bulk_store, request.user, self.bulk_ids(request))})
+
+    @action(detail=False, methods=['post'])
+    def bulk_delete(self, request):
+        """Delete the given sent messages; ones that have replies are blanked instead"""
+        return Response({'deleted': bulk.delete(self.bulk_store, request.user, self.bulk_ids(request))})
+
 # ViewSets for the main URLs
-class MessageViewSet(viewsets.ModelViewSet):
-    queryset = Message.objects.all()
+class MessageViewSet(BulkMessageActionsMixin, viewsets.ModelViewSet):
+    queryset = Message.objects.filter(channel=Message.CHANNEL_DIRECT)
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PageNumberOrKeysetPagination
+    bulk_store = bulk.MESSAGES
+
+    @action(detail=False, methods=['get'])
+    def inbox(self, request):
+        """The user's conversations by last activity, each with its latest message and unread count"""
+        entries = ConversationParticipant.objects.filter(user=request.user).select_related(
+            'conversation__last_message__sender'
+        )
+        paginator = InboxPagination()
+        page = paginator.paginate_queryset(entries, request, view=self)
+        return paginator.get_paginated_response(InboxEntrySerializer(page, many=True).data)
 
 class ReviewViewSet(viewsets.ModelViewSet):
     queryset = Review.objects.all()
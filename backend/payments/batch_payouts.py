@@ -0,0 +1,398 @@
+"""
+Batch payout runs
+
+``run_batch_payouts`` claims every pending ``ExpertPayout`` (except M-PESA
+payouts, which go through the step pipeline in ``payments.tasks``). It
+groups them by the expert's primary ``ExpertPaymentMethod.method_type`` and
+the payout currency, and sends each group to that method's gateway in as
+few calls as the provider allows: PayPal payout batches of up to
+``PAYOUT_BATCH_PAYPAL_MAX_ITEMS`` items and Wise batch groups of up to
+``PAYOUT_BATCH_WISE_MAX_ITEMS`` transfers.
+
+Claiming is a short ``SELECT ... FOR UPDATE SKIP LOCKED`` that flips the
+rows to ``processing`` at step ``batch``, so concurrent runs never pick the
+same payout, the M-PESA pipeline and its stall sweeper leave them alone, and
+no transaction stays open while the gateways are called. The per-item
+results are written back with a single ``bulk_update``.
+
+Submitting is idempotent. Each chunk gets a batch id derived from its
+payouts' ``idempotency_key`` values and is stored on the payouts before
+the gateway is called. It is the PayPal ``sender_batch_id`` and
+``PayPal-Request-Id``, so PayPal answers a resubmission with the original
+batch. For Wise it names the batch group, and every transfer carries the
+payout's key as ``customerTransactionId``, so Wise hands back the existing
+transfer instead of creating a second one. If a run dies between submitting
+and saving the results, its payouts stay at step ``batch`` without a result.
+After ``PAYOUT_STALL_MINUTES`` a later run claims them again and resubmits
+them under the same id.
+
+Gateways are pluggable through ``PAYOUT_BATCH_GATEWAYS`` (method type to
+dotted path). ``FakeBatchGateway`` pays everything locally and stands in
+for the real providers in development and tests.
+"""
+import hashlib
+import logging
+import uuid
+from datetime import timedelta
+from itertools import groupby
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import ExpertPayout, ExpertPaymentMethod
+from .services.paypal_service import PayPalService
+from .services.wise_service import WiseService
+
+logger = logging.getLogger(__name__)
+
+# PayPal item states (transaction_status) mapped to ExpertPayout.status
+PAYPAL_ITEM_STATUS = {
+    'SUCCESS': 'completed',
+    'FAILED': 'failed',
+    'RETURNED': 'failed',
+    'BLOCKED': 'failed',
+    'DENIED': 'failed',
+    'REFUNDED': 'failed',
+    'REVERSED': 'failed',
+}
+
+
+class BatchItem:
+    """One payout in a gateway batch"""
+
+    __slots__ = ('payout', 'method')
+
+    def __init__(self, payout: ExpertPayout, method: ExpertPaymentMethod):
+        self.payout = payout
+        self.method = method
+
+
+class BatchItemResult:
+    """Outcome of one payout; ``status`` is an ``ExpertPayout`` status"""
+
+    __slots__ = ('payout_id', 'status', 'reference', 'response', 'error')
+
+    def __init__(self, payout_id: int, status: str, reference: Optional[str] = None,
+                 response: Optional[Dict] = None, error: str = ''):
+        self.payout_id = payout_id
+        self.status = status
+        self.reference = reference
+        self.response = response or {}
+        self.error = error
+
+
+class BatchGateway:
+    """
+    A payout provider that accepts many payouts per request.
+
+    ``submit`` sends one chunk of at most ``max_items`` items and returns a
+    ``BatchItemResult`` for every item. Payouts the provider has accepted
+    but not settled stay ``processing``.
+    """
+    method_type = None
+    max_items = 1000
+
+    def submit(self, items: List[BatchItem], currency: str, batch_id: str) -> List[BatchItemResult]:
+        raise NotImplementedError
+
+    def failed(self, items: List[BatchItem], error: str) -> List[BatchItemResult]:
+        return [BatchItemResult(item.payout.id, 'failed', error=error) for item in items]
+
+
+class PayPalBatchGateway(BatchGateway):
+    method_type = 'paypal'
+
+    def __init__(self):
+        self.max_items = settings.PAYOUT_BATCH_PAYPAL_MAX_ITEMS
+        self.service = PayPalService()
+
+    def submit(self, items, currency, batch_id):
+        missing = [item for item in items if not item.method.paypal_email]
+        items = [item for item in items if item.method.paypal_email]
+        results = self.failed(missing, 'Expert has no PayPal email')
+        if not items:
+            return results
+
+        batch = self.service.create_batch_payout(
+            sender_batch_id=batch_id,
+            items=[{
+                'receiver': item.method.paypal_email,
+                'amount': item.payout.amount,
+                'currency': currency,
+                'sender_item_id': item.payout.idempotency_key,
+            } for item in items],
+        )
+        batch_id = batch['batch_header']['payout_batch_id']
+        # Item states are only known once PayPal has processed the batch;
+        # whatever is still pending is picked up by reconcile_paypal_batches
+        status = self.service.get_payout_status(batch_id)
+        return results + paypal_item_results(items, batch_id, status)
+
+
+class WiseBatchGateway(BatchGateway):
+    method_type = 'wise'
+
+    def __init__(self):
+        self.max_items = settings.PAYOUT_BATCH_WISE_MAX_ITEMS
+        self.service = WiseService()
+
+    def submit(self, items, currency, batch_id):
+        missing = [item for item in items if not item.method.wise_account_id]
+        items = [item for item in items if item.method.wise_account_id]
+        results = self.failed(missing, 'Expert has no Wise recipient account')
+        if not items:
+            return results
+
+        group = self.service.create_batch_group(batch_id, currency)
+        added = []
+        for item in items:
+            payout = item.payout
+            try:
+                quote = self.service.create_recipient_quote(payout.amount, currency, item.method.wise_account_id)
+                transfer = self.service.add_batch_transfer(
+                    group['id'], quote['id'], item.method.wise_account_id, payout.idempotency_key,
+                    reference=f'Payout {payout.id}',
+                )
+            except Exception as e:
+                results.append(BatchItemResult(payout.id, 'failed', error=str(e)))
+                continue
+            added.append((payout, transfer))
+
+        if added:
+            completed = self.service.complete_batch_group(group['id'], group.get('version', 0))
+            self.service.fund_batch_group(group['id'])
+            for payout, transfer in added:
+                results.append(BatchItemResult(
+                    payout.id, 'processing', reference=str(transfer['id']),
+                    response={'batch_group_id': group['id'], 'batch_status': completed.get('status'),
+                              'transfer': transfer},
+                ))
+        return results
+
+
+class FakeBatchGateway(BatchGateway):
+    """
+    Local stand-in for a provider: every item succeeds immediately, except
+    receivers on the reserved ``.invalid`` domain, which fail. Like the real
+    providers it pays a batch id only once; a resubmission gets the results
+    of the first submission back.
+    """
+    max_items = 50
+
+    def __init__(self, method_type: Optional[str] = None):
+        self.method_type = method_type
+        self.batches = []
+        self.submitted = {}
+
+    def submit(self, items, currency, batch_id):
+        if batch_id in self.submitted:
+            return [self.submitted[batch_id][item.payout.id] for item in items]
+        provider_id = f'FAKE-{uuid.uuid4().hex[:12].upper()}'
+        self.batches.append((provider_id, currency, [item.payout.id for item in items]))
+        results = {}
+        for n, item in enumerate(items):
+            receiver = item.method.paypal_email or item.method.wise_email or ''
+            if receiver.endswith('.invalid'):
+                result = BatchItemResult(item.payout.id, 'failed', error='Receiver rejected',
+                                         response={'batch_id': provider_id})
+            else:
+                result = BatchItemResult(item.payout.id, 'completed', reference=f'{provider_id}-{n}',
+                                         response={'batch_id': provider_id})
+            results[item.payout.id] = result
+        self.submitted[batch_id] = results
+        return list(results.values())
+
+
+def paypal_item_results(items: List[BatchItem], batch_id: str, status: Dict) -> List[BatchItemResult]:
+    by_item_id = {
+        entry.get('payout_item', {}).get('sender_item_id'): entry
+        for entry in status.get('items', [])
+    }
+    results = []
+    for item in items:
+        entry = by_item_id.get(str(item.payout.idempotency_key), {})
+        item_status = entry.get('transaction_status', 'PENDING')
+        error = entry.get('errors', {}).get('message', '') if item_status in PAYPAL_ITEM_STATUS else ''
+        results.append(BatchItemResult(
+            item.payout.id,
+            PAYPAL_ITEM_STATUS.get(item_status, 'processing'),
+            reference=entry.get('payout_item_id'),
+            response={'batch_id': batch_id, 'transaction_status': item_status,
+                      'transaction_id': entry.get('transaction_id')},
+            error=error,
+        ))
+    return results
+
+
+def get_batch_gateways() -> Dict[str, BatchGateway]:
+    return {method_type: import_string(path)() for method_type, path in settings.PAYOUT_BATCH_GATEWAYS.items()}
+
+
+def primary_method(methods: List[ExpertPaymentMethod]) -> Optional[ExpertPaymentMethod]:
+    for method in methods:
+        if method.is_primary:
+            return method
+    return methods[0] if methods else None
+
+
+def claim_pending_payouts(limit: Optional[int] = None) -> List[ExpertPayout]:
+    """
+    Mark pending batchable payouts ``processing`` and return them, together
+    with claimed payouts whose run died before saving their results (no
+    ``batch`` entry in ``gateway_response`` after ``PAYOUT_STALL_MINUTES``)
+    """
+    stalled = Q(status='processing', step='batch',
+                step_updated_at__lt=timezone.now() - timedelta(minutes=settings.PAYOUT_STALL_MINUTES)) & ~Q(
+                gateway_response__has_key='batch')
+    queryset = ExpertPayout.objects.filter(Q(status='pending') | stalled).exclude(payout_method='mpesa').order_by('id')
+    with transaction.atomic():
+        ids = list(queryset.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+        now = timezone.now()
+        ExpertPayout.objects.filter(id__in=ids).update(
+            status='processing', step='batch', step_updated_at=now, updated_at=now
+        )
+    return list(
+        ExpertPayout.objects.filter(id__in=ids).select_related('expert').prefetch_related(
+            Prefetch('expert__payment_methods', queryset=ExpertPaymentMethod.objects.order_by('-is_primary', 'id'))
+        ).order_by('id')
+    )
+
+
+def group_payouts(payouts: List[ExpertPayout]):
+    """
+    ``{(method_type, currency): [BatchItem, ...]}`` plus the payouts whose
+    expert has no payment method
+    """
+    groups, unroutable = {}, []
+    for payout in payouts:
+        method = primary_method(list(payout.expert.payment_methods.all()))
+        if method is None:
+            unroutable.append(payout)
+            continue
+        payout.payout_method = method.method_type
+        groups.setdefault((method.method_type, payout.currency), []).append(BatchItem(payout, method))
+    return groups, unroutable
+
+
+def chunked(items: List, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def batch_id_for(items: List[BatchItem]) -> str:
+    """Stable id of a chunk: the same payouts always get the same id"""
+    keys = sorted(str(item.payout.idempotency_key) for item in items)
+    return 'payouts-' + hashlib.sha256('\n'.join(keys).encode()).hexdigest()[:32]
+
+
+def plan_batches(items: List[BatchItem], size: int):
+    """
+    ``(batch_id, items)`` chunks of at most ``size`` items. Payouts that
+    already carry a batch id (a crashed run) keep it and its chunk; new ones
+    get an id that is saved before anything is submitted.
+    """
+    resumed = {}
+    fresh = []
+    for item in items:
+        if item.payout.batch_id:
+            resumed.setdefault(item.payout.batch_id, []).append(item)
+        else:
+            fresh.append(item)
+    batches = list(resumed.items())
+    for chunk in chunked(fresh, size):
+        batch_id = batch_id_for(chunk)
+        ExpertPayout.objects.filter(id__in=[item.payout.id for item in chunk]).update(batch_id=batch_id)
+        for item in chunk:
+            item.payout.batch_id = batch_id
+        batches.append((batch_id, chunk))
+    return batches
+
+
+def apply_results(payouts: Dict[int, ExpertPayout], results: List[BatchItemResult]) -> List[ExpertPayout]:
+    """Copy results onto the payouts and save them with one bulk_update"""
+    now = timezone.now()
+    changed = []
+    for result in results:
+        payout = payouts[result.payout_id]
+        payout.status = result.status
+        payout.gateway_response = {**payout.gateway_response, 'batch': result.response}
+        if result.reference:
+            payout.payout_reference = result.reference
+        if result.error:
+            payout.failure_reason = result.error
+        if result.status == 'completed':
+            payout.processed_at = now
+        payout.updated_at = now
+        changed.append(payout)
+    ExpertPayout.objects.bulk_update(
+        changed,
+        ['status', 'payout_method', 'gateway_response', 'payout_reference', 'failure_reason', 'processed_at',
+         'updated_at'],
+        batch_size=500,
+    )
+    return changed
+
+
+def summarize_results(results: List[BatchItemResult]) -> Dict[str, int]:
+    ordered = sorted(result.status for result in results)
+    return {status: len(list(group)) for status, group in groupby(ordered)}
+
+
+def run_batch_payouts(gateways: Optional[Dict[str, BatchGateway]] = None,
+                      limit: Optional[int] = None) -> Dict:
+    """
+    Pay out every pending payout in provider batches.
+
+    Returns the run id, the number of gateway batches sent and a count of
+    payouts per resulting status. A failing batch fails its payouts and the
+    run carries on with the next one.
+    """
+    gateways = get_batch_gateways() if gateways is None else gateways
+    run_id = f'payout-run-{timezone.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:6]}'
+    payouts = claim_pending_payouts(limit)
+    by_id = {payout.id: payout for payout in payouts}
+    groups, unroutable = group_payouts(payouts)
+
+    results = [BatchItemResult(p.id, 'failed', error='Expert has no payment method set up') for p in unroutable]
+    batches = 0
+    for (method_type, currency), items in groups.items():
+        gateway = gateways.get(method_type)
+        if gateway is None:
+            results.extend(BatchGateway().failed(items, f'No batch gateway for {method_type}'))
+            continue
+        for batch_id, chunk in plan_batches(items, gateway.max_items):
+            batches += 1
+            try:
+                results.extend(gateway.submit(chunk, currency, batch_id))
+            except Exception as e:
+                logger.error(f"Batch payout {run_id} {method_type}/{currency} {batch_id} failed: {str(e)}")
+                results.extend(gateway.failed(chunk, str(e)))
+
+    apply_results(by_id, results)
+    summary = {'run_id': run_id, 'payouts': len(payouts), 'batches': batches, 'statuses': summarize_results(results)}
+    logger.info(f"Batch payout run finished: {summary}")
+    return summary
+
+
+def reconcile_paypal_batches(service: Optional[PayPalService] = None) -> Dict[str, int]:
+    """Poll PayPal for batch payouts that were still pending when submitted"""
+    service = service or PayPalService()
+    payouts = list(ExpertPayout.objects.filter(
+        status='processing', gateway_response__batch__transaction_status__isnull=False
+    ).exclude(payout_method='mpesa'))
+    by_batch = {}
+    for payout in payouts:
+        by_batch.setdefault(payout.gateway_response['batch']['batch_id'], []).append(payout)
+
+    results = []
+    for batch_id, batch_payouts in by_batch.items():
+        status = service.get_payout_status(batch_id)
+        items = [BatchItem(payout, None) for payout in batch_payouts]
+        results.extend(r for r in paypal_item_results(items, batch_id, status) if r.status != 'processing')
+
+    apply_results({payout.id: payout for payout in payouts}, results)
+    return summarize_results(results)
@@ -0,0 +1,196 @@
+"""
+Currency conversion rates for display estimates
+
+The ``refresh_fx_rates`` beat task fetches mid-market rates from Wise. Each
+rate is kept in three places: the ``ExchangeRate`` table (one row per
+pair), the shared Django cache and a per-process dict. Reads never call
+Wise and never wait for it:
+
+- A rate younger than ``FX_RATE_FRESH_SECONDS`` is served as it is.
+- An older rate is still served (stale-while-revalidate), and a refresh
+  of that pair is queued. At most one refresh is queued per
+  ``FX_RATE_REFRESH_LOCK_SECONDS``.
+- A rate older than ``FX_RATE_MAX_AGE_SECONDS`` is no longer trusted.
+  ``RateUnavailable`` is raised, so the caller shows no estimate instead
+  of a wrong one.
+
+Only executing a transfer asks Wise for a binding quote (see
+``payments.tasks.create_quote``).
+"""
+import logging
+import threading
+import time
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+from .models import ExchangeRate
+from .money import quantize
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = 'fx'
+ONE = Decimal(1)
+
+# (source, target) -> (rate, fetched_at epoch, checked_at epoch)
+_rates: Dict[Tuple[str, str], Tuple[Decimal, float, float]] = {}
+_rates_lock = threading.Lock()
+
+
+class RateUnavailable(Exception):
+    """No rate for the pair recent enough to show"""
+
+
+def cache_key(source: str, target: str) -> str:
+    return f'{CACHE_PREFIX}:{source}:{target}'
+
+
+def configured_pairs() -> List[Tuple[str, str]]:
+    return [(source.upper(), target.upper()) for source, target in settings.FX_RATE_PAIRS]
+
+
+def is_supported(source: str, target: str) -> bool:
+    """Whether the pair is in ``FX_RATE_PAIRS`` (or converts a configured currency to itself)"""
+    pairs = configured_pairs()
+    source, target = source.upper(), target.upper()
+    if source == target:
+        return any(source in pair for pair in pairs)
+    return (source, target) in pairs
+
+
+def store_rates(rates: Iterable[Tuple[str, str, Decimal]], fetched_at=None) -> int:
+    """Upsert ``(source, target, rate)`` rows and publish them to both caches"""
+    fetched_at = fetched_at or timezone.now()
+    rows = [
+        ExchangeRate(source=source, target=target, rate=Decimal(str(rate)), fetched_at=fetched_at)
+        for source, target, rate in rates
+    ]
+    if not rows:
+        return 0
+    # MySQL upserts with ON DUPLICATE KEY UPDATE and rejects a conflict target
+    target = {'unique_fields': ['source', 'target']} if connection.features.supports_update_conflicts_with_target else {}
+    ExchangeRate.objects.bulk_create(rows, update_conflicts=True, update_fields=['rate', 'fetched_at'], **target)
+    stamp = fetched_at.timestamp()
+    cache.set_many(
+        {cache_key(row.source, row.target): (row.rate, stamp) for row in rows},
+        timeout=settings.FX_RATE_MAX_AGE_SECONDS,
+    )
+    now = time.time()
+    with _rates_lock:
+        for row in rows:
+            _rates[(row.source, row.target)] = (row.rate, stamp, now)
+    return len(rows)
+
+
+def refresh_rates(pairs: Optional[Sequence[Tuple[str, str]]] = None) -> int:
+    """
+    Fetch rates for ``pairs`` (default ``FX_RATE_PAIRS``) from Wise and store
+    them. A single pair is fetched on its own; several are taken from one
+    call for every pair Wise supports.
+    """
+    from .services.wise_service import WiseService
+
+    wanted = {(source.upper(), target.upper()) for source, target in (pairs or configured_pairs())}
+    wanted = {(source, target) for source, target in wanted if source != target}
+    if not wanted:
+        return 0
+    if len(wanted) == 1:
+        source, target = next(iter(wanted))
+        quoted = WiseService().get_rates(source, target)
+    else:
+        quoted = WiseService().get_rates()
+    rates = [
+        (item['source'], item['target'], item['rate'])
+        for item in quoted if (item.get('source'), item.get('target')) in wanted
+    ]
+    missing = wanted - {(source, target) for source, target, _ in rates}
+    if missing:
+        logger.warning("Wise returned no rate for %s", ', '.join(f'{s}/{t}' for s, t in sorted(missing)))
+    return store_rates(rates)
+
+
+def schedule_refresh(source: str, target: str):
+    """Queue a background refresh of one pair unless one was queued recently"""
+    from .tasks import refresh_fx_rates
+
+    if not is_supported(source, target):
+        return
+    if cache.add(f'{cache_key(source, target)}:refreshing', True, timeout=settings.FX_RATE_REFRESH_LOCK_SECONDS):
+        try:
+            refresh_fx_rates.delay([[source, target]])
+        except Exception:
+            logger.exception("Could not queue an FX rate refresh for %s/%s", source, target)
+
+
+def _lookup(source: str, target: str) -> Optional[Tuple[Decimal, float]]:
+    """
+    ``(rate, fetched_at)`` from the nearest tier that has it. The shared
+    tiers are consulted at most every ``FX_RATE_CHECK_SECONDS`` per process
+    once the local copy has gone stale.
+    """
+    now = time.time()
+    entry = _rates.get((source, target))
+    if entry and (now - entry[1] < settings.FX_RATE_FRESH_SECONDS
+                  or now - entry[2] < settings.FX_RATE_CHECK_SECONDS):
+        return entry[0], entry[1]
+
+    shared = cache.get(cache_key(source, target))
+    if shared is None:
+        row = ExchangeRate.objects.filter(source=source, target=target).values_list('rate', 'fetched_at').first()
+        if row:
+            shared = (row[0], row[1].timestamp())
+            if now - shared[1] < settings.FX_RATE_MAX_AGE_SECONDS:
+                cache.set(cache_key(source, target), shared, timeout=settings.FX_RATE_MAX_AGE_SECONDS)
+    if shared and (entry is None or shared[1] > entry[1]):
+        entry = (shared[0], shared[1], now)
+    elif entry:
+        entry = (entry[0], entry[1], now)
+    if entry is None:
+        return None
+    with _rates_lock:
+        _rates[(source, target)] = entry
+    return entry[0], entry[1]
+
+
+def get_rate(source: str, target: str) -> Decimal:
+    """Rate for display estimates; never blocks on Wise"""
+    source, target = source.upper(), target.upper()
+    if not is_supported(source, target):
+        raise RateUnavailable(f'{source}/{target} is not a configured pair')
+    if source == target:
+        return ONE
+    found = _lookup(source, target)
+    age = time.time() - found[1] if found else None
+    if age is None or age >= settings.FX_RATE_FRESH_SECONDS:
+        schedule_refresh(source, target)
+    if age is None or age >= settings.FX_RATE_MAX_AGE_SECONDS:
+        raise RateUnavailable(f'No current {source}/{target} rate')
+    return found[0]
+
+
+def convert(amount, source: str, target: str) -> Decimal:
+    """``amount`` in ``target`` at the cached rate, rounded to its minor unit"""
+    return quantize(Decimal(str(amount)) * get_rate(source, target), target)
+
+
+def convert_many(items: Iterable[Tuple[object, str, str]]) -> List[Optional[Decimal]]:
+    """
+    Convert ``(amount, source, target)`` items in input order, looking each
+    pair up once. Items whose pair has no usable rate come back as None.
+    """
+    rates = {}
+    results = []
+    for amount, source, target in items:
+        pair = (source.upper(), target.upper())
+        if pair not in rates:
+            try:
+                rates[pair] = get_rate(*pair)
+            except RateUnavailable:
+                rates[pair] = None
+        rate = rates[pair]
+        results.append(None if rate is None else quantize(Decimal(str(amount)) * rate, pair[1]))
+    return results
@@ -0,0 +1,59 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.models import PaymentIntent
+from payments.money import compute_fees, platform_fee
+from tasks.models import Task
+
+
+class Command(BaseCommand):
+    help = (
+        "Time platform fee computation per object against the vectorised batch "
+        "path over synthetic amounts, and check that both give identical fees"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=100000, help='Number of amounts to price')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per path')
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        categories = [c[0] for c in Task.CATEGORY_CHOICES]
+        methods = [c[0] for c in PaymentIntent.PAYMENT_METHOD_CHOICES]
+        items = [
+            (Decimal(rng.randint(100, 500000)) / 100, 'USD', rng.choice(categories), rng.choice(methods))
+            for _ in range(options['items'])
+        ]
+
+        scalar = [platform_fee(*item) for item in items]
+        batch = compute_fees(items)
+        mismatches = sum(1 for a, b in zip(scalar, batch) if (a.fee, a.payout) != (b.fee, b.payout))
+        if mismatches:
+            raise CommandError(f'{mismatches} of {len(items)} fees differ between the scalar and batch paths')
+
+        # The pre-Decimal computation, for reference: float fee, not rounded
+        floats = [float(item[0]) for item in items]
+        paths = [
+            ('float per object (previous)', lambda: [(amount * 0.10, amount - amount * 0.10) for amount in floats]),
+            ('Decimal per object', lambda: [platform_fee(*item) for item in items]),
+            ('vectorised batch', lambda: compute_fees(items)),
+        ]
+        self.stdout.write(f'Pricing {len(items)} amounts, {options["repeat"]} runs per path\n')
+        for label, run in paths:
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - start) * 1000)
+            median = statistics.median(timings)
+            self.stdout.write(self.style.SUCCESS(
+                f'== {label}: median {median:.1f} ms, max {max(timings):.1f} ms, '
+                f'{len(items) / median * 1000:,.0f} fees/s'
+            ))
+
+        drift = sum(1 for amount, b in zip(floats, batch) if Decimal(repr(amount * 0.10)) != b.fee)
+        self.stdout.write(f'\n{drift} of {len(items)} float fees were not exact to the cent')
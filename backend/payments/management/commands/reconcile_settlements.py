@@ -0,0 +1,45 @@
+import sys
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from payments.reconciliation import PARSERS, reconcile
+
+
+class Command(BaseCommand):
+    help = "Reconcile a PayPal, Wise or M-PESA settlement file against payments and payouts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('provider', choices=sorted(PARSERS))
+        parser.add_argument('path', help='Settlement CSV file')
+        parser.add_argument('--report', help='Write mismatches to this CSV file (default: stdout)')
+        parser.add_argument('--since', help='Only index our records created on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--until', help='Only index our records created before this date (YYYY-MM-DD)')
+        parser.add_argument('--apply', action='store_true',
+                            help='Write status fixes instead of only reporting them')
+
+    def handle(self, *args, **options):
+        since = self.parse_day(options['since'])
+        until = self.parse_day(options['until'])
+        report = open(options['report'], 'w', newline='', encoding='utf-8') if options['report'] else sys.stdout
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as fh:
+                counts = reconcile(options['provider'], fh, report=report, apply=options['apply'],
+                                   since=since, until=until)
+        finally:
+            if report is not sys.stdout:
+                report.close()
+        self.stderr.write(self.style.SUCCESS(
+            ', '.join(f'{kind}: {count}' for kind, count in sorted(counts.items())) or 'No rows'
+        ))
+
+    @staticmethod
+    def parse_day(value):
+        if not value:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'Invalid date: {value}')
+        return timezone.make_aware(datetime.combine(day, time.min))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from payments.models import PaymentIntent
+from payments.services import PaymentService
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute platform fees and expert payouts of unpaid payment intents "
+        "from the current PLATFORM_FEE_SCHEDULES; run after changing the schedules"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', action='append', choices=[s for s, _ in PaymentIntent.STATUS_CHOICES],
+                            help='Intent status to reprice; repeat for several (default: pending)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Intents per query and update')
+
+    def handle(self, *args, **options):
+        statuses = options['status'] or ['pending']
+        updated = PaymentService.recalculate_platform_fees(
+            PaymentIntent.objects.filter(status__in=statuses), batch_size=options['batch_size']
+        )
+        self.stdout.write(self.style.SUCCESS(f"Repriced {updated} payment intents ({', '.join(statuses)})"))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from payments.batch_payouts import FakeBatchGateway, reconcile_paypal_batches, run_batch_payouts
+
+
+class Command(BaseCommand):
+    help = "Pay every pending expert payout in PayPal payout batches and Wise batch groups"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Claim at most this many pending payouts')
+        parser.add_argument('--fake', action='store_true',
+                            help='Use the local fake gateway instead of PayPal and Wise')
+        parser.add_argument('--reconcile', action='store_true',
+                            help='Only poll PayPal for batches that were still pending')
+
+    def handle(self, *args, **options):
+        if options['reconcile']:
+            statuses = reconcile_paypal_batches()
+            self.stdout.write(self.style.SUCCESS(f'Reconciled PayPal batches: {statuses}'))
+            return
+
+        gateways = None
+        if options['fake']:
+            gateways = {method_type: FakeBatchGateway(method_type) for method_type in ('paypal', 'wise')}
+        summary = run_batch_payouts(gateways=gateways, limit=options['limit'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{summary['run_id']}: {summary['payouts']} payouts in {summary['batches']} batches, "
+            f"{summary['statuses']}"
+        ))
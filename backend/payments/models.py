@@ -1,6 +1,8 @@
 """
 Payment models for Mai-Guru platform
 """
+import uuid
+
 from django.db import models
 from django.core.validators import MinValueValidator
 from django.utils import timezone
@@ -68,9 +70,13 @@ class PaymentIntent(models.Model):
         return dict(self.STATUS_CHOICES)[self.status]
     
     def calculate_platform_fee(self):
-        """Calculate 10% platform fee"""
-        self.platform_fee = self.amount * 0.10
-        self.expert_payout_amount = self.amount - self.platform_fee
+        """Set the platform fee and expert payout from the task's fee schedule"""
+        from .money import platform_fee
+
+        breakdown = platform_fee(self.amount, self.currency, self.task.category, self.payment_method)
+        self.amount = breakdown.amount
+        self.platform_fee = breakdown.fee
+        self.expert_payout_amount = breakdown.payout
         return self.platform_fee
 
 
@@ -88,9 +94,20 @@ class ExpertPayout(models.Model):
     PAYOUT_METHOD_CHOICES = [
         ('paypal', 'PayPal'),
         ('wise', 'Wise'),
+        ('mpesa', 'M-Pesa'),
         ('bank_transfer', 'Bank Transfer'),
     ]
     
+    # Pipeline steps, in order (see payments.tasks)
+    STEP_CHOICES = [
+        ('quote', 'Create Wise Quote'),
+        ('create_transfer', 'Create Wise Transfer'),
+        ('fund_transfer', 'Fund Wise Transfer'),
+        ('mpesa_b2c', 'M-Pesa B2C Payment'),
+        ('batch', 'Provider Batch'),  # PayPal/Wise batch payouts (see payments.batch_payouts)
+        ('done', 'Done'),
+    ]
+    
     expert = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payouts')
     payment_intent = models.OneToOneField(PaymentIntent, on_delete=models.CASCADE, related_name='expert_payout')
     amount = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0.01)])
@@ -100,8 +117,19 @@ class ExpertPayout(models.Model):
     
     # Payout Details
     payout_reference = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    # Our id for the provider batch (PayPal sender_batch_id, Wise batch group name), set before submitting
+    batch_id = models.CharField(max_length=64, blank=True, db_index=True)
     processing_fee = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     
+    # Pipeline State
+    step = models.CharField(max_length=20, choices=STEP_CHOICES, default='quote')
+    step_attempts = models.PositiveIntegerField(default=0)
+    step_updated_at = models.DateTimeField(default=timezone.now)
+    idempotency_key = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    wise_quote_id = models.CharField(max_length=255, blank=True)
+    wise_transfer_id = models.CharField(max_length=255, blank=True)
+    mpesa_conversation_id = models.CharField(max_length=255, blank=True)
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -113,6 +141,9 @@ class ExpertPayout(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'step_updated_at'], name='payout_status_step_idx'),
+        ]
     
     def __str__(self):
         return f"Payout to {self.expert.username} - ${self.amount}"
@@ -260,4 +291,71 @@ class Invoice(models.Model):
     def save(self, *args, **kwargs):
         if not self.invoice_number:
             self.invoice_number = self.generate_invoice_number()
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+class WebhookEvent(models.Model):
+    """
+    Raw gateway callback, stored as received and applied later by a worker
+    (see payments.webhooks)
+    """
+    PROVIDER_CHOICES = [
+        ('paypal', 'PayPal'),
+        ('wise', 'Wise'),
+        ('mpesa', 'M-Pesa'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('ignored', 'Ignored'),
+        ('failed', 'Failed'),
+    ]
+    
+    provider = models.CharField(max_length=10, choices=PROVIDER_CHOICES)
+    event_id = models.CharField(max_length=255)
+    event_type = models.CharField(max_length=100, blank=True)
+    # Events sharing a key (one payment or payout) are applied in arrival order
+    ordering_key = models.CharField(max_length=255)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    error = models.TextField(blank=True)
+    
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['provider', 'event_id'], name='webhook_provider_event_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['ordering_key', 'status', 'id'], name='webhook_key_status_idx'),
+            models.Index(fields=['status', 'received_at'], name='webhook_status_received_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_provider_display()} {self.event_type} {self.event_id}"
+
+
+class ExchangeRate(models.Model):
+    """
+    Latest mid-market rate per currency pair, refreshed by Celery beat and
+    used for display estimates only (see payments.fx)
+    """
+    source = models.CharField(max_length=3)
+    target = models.CharField(max_length=3)
+    rate = models.DecimalField(max_digits=18, decimal_places=8)
+    fetched_at = models.DateTimeField()
+    
+    class Meta:
+        ordering = ['source', 'target']
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'target'], name='exchange_rate_pair_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.source}/{self.target} {self.rate}"
+
+
+# Register the notification models with the app
+from .notifications import PaymentNotification, PaymentStatusLog  # noqa: E402,F401
@@ -0,0 +1,217 @@
+"""
+Money arithmetic
+
+Amounts are ``Decimal`` throughout and are rounded half-up to the minor
+unit of their currency. Floats are converted through ``str`` so binary
+representation errors never reach a fee.
+
+Platform fees come from tiered schedules in ``PLATFORM_FEE_SCHEDULES``,
+chosen per task category and payment method. The tiers are marginal, like
+tax brackets: each rate applies only to the part of the amount inside its
+tier. A schedule can add a fixed fee and a minimum fee. ``platform_fee``
+prices one amount. ``compute_fees`` prices thousands at once in integer
+micro-units with numpy and gives exactly the same results.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+
+# Minor-unit exponents that differ from the usual 2
+CURRENCY_EXPONENTS = {
+    'JPY': 0,
+    'KRW': 0,
+    'UGX': 0,
+    'RWF': 0,
+    'BHD': 3,
+    'KWD': 3,
+}
+DEFAULT_EXPONENT = 2
+MICROS = 1_000_000  # rates are exact to six decimal places
+
+# Representative amount for a task that only has a budget range
+BUDGET_AMOUNTS = {
+    'less_100': Decimal('75'),
+    '100_500': Decimal('300'),
+    '501_1000': Decimal('750'),
+    '1001_2000': Decimal('1500'),
+    'above_2000': Decimal('2500'),
+}
+DEFAULT_BUDGET_AMOUNT = BUDGET_AMOUNTS['100_500']
+
+
+class MoneyError(ValueError):
+    """Raised for amounts or fee schedules that cannot be priced"""
+
+
+def to_decimal(value) -> Decimal:
+    if isinstance(value, Decimal):
+        return value
+    if isinstance(value, float):
+        return Decimal(repr(value))
+    return Decimal(value)
+
+
+def exponent(currency: str) -> int:
+    return CURRENCY_EXPONENTS.get((currency or '').upper(), DEFAULT_EXPONENT)
+
+
+def quantize(amount, currency: str = 'USD') -> Decimal:
+    """Round half-up to the currency's minor unit"""
+    return to_decimal(amount).quantize(Decimal(1).scaleb(-exponent(currency)), rounding=ROUND_HALF_UP)
+
+
+def to_minor(amount, currency: str = 'USD') -> int:
+    return int(quantize(amount, currency).scaleb(exponent(currency)))
+
+
+def from_minor(units: int, currency: str = 'USD') -> Decimal:
+    return Decimal(int(units)).scaleb(-exponent(currency))
+
+
+def budget_amount(budget_range: str) -> Decimal:
+    """Amount used for a task priced only by its budget range"""
+    return BUDGET_AMOUNTS.get(budget_range, DEFAULT_BUDGET_AMOUNT)
+
+
+class FeeSchedule:
+    """
+    Marginal fee tiers plus an optional fixed and minimum fee.
+
+    ``tiers`` is a list of ``(up_to, rate)`` in ascending order; the last
+    ``up_to`` may be None for "and above". ``up_to``, ``fixed`` and
+    ``minimum`` are in major units of the currency being priced.
+    """
+
+    def __init__(self, tiers: Sequence[Tuple[Optional[object], object]], fixed=0, minimum=0):
+        if not tiers:
+            raise MoneyError('A fee schedule needs at least one tier')
+        self.tiers = []
+        lower = Decimal(0)
+        for up_to, rate in tiers:
+            rate = to_decimal(rate)
+            if rate < 0 or rate != rate.quantize(Decimal('0.000001')):
+                raise MoneyError(f'Fee rate {rate} must be non-negative with at most 6 decimal places')
+            up_to = None if up_to is None else to_decimal(up_to)
+            if up_to is not None and up_to <= lower:
+                raise MoneyError('Fee tiers must be in ascending order')
+            self.tiers.append((lower, up_to, rate))
+            if up_to is None:
+                break
+            lower = up_to
+        self.fixed = to_decimal(fixed)
+        self.minimum = to_decimal(minimum)
+
+    @classmethod
+    def from_setting(cls, value: Dict) -> 'FeeSchedule':
+        return cls(value['tiers'], value.get('fixed', 0), value.get('minimum', 0))
+
+    def fee(self, amount, currency: str = 'USD') -> Decimal:
+        """Fee on one amount, never more than the amount itself"""
+        amount = quantize(amount, currency)
+        if amount < 0:
+            raise MoneyError('Amounts must not be negative')
+        variable = Decimal(0)
+        for lower, upper, rate in self.tiers:
+            if amount <= lower:
+                break
+            capped = amount if upper is None else min(amount, upper)
+            variable += (capped - lower) * rate
+        fee = quantize(variable, currency) + quantize(self.fixed, currency)
+        fee = max(fee, quantize(self.minimum, currency))
+        return min(fee, amount)
+
+    def fees_minor(self, amounts_minor: np.ndarray, currency: str = 'USD') -> np.ndarray:
+        """Vectorised ``fee`` over amounts in minor units (int64 in, int64 out)"""
+        amounts = np.asarray(amounts_minor, dtype=np.int64)
+        if (amounts < 0).any():
+            raise MoneyError('Amounts must not be negative')
+        variable_micros = np.zeros_like(amounts)
+        for lower, upper, rate in self.tiers:
+            lower_minor = to_minor(lower, currency)
+            capped = amounts if upper is None else np.minimum(amounts, to_minor(upper, currency))
+            portion = np.maximum(capped - lower_minor, 0)
+            variable_micros += portion * int(rate * MICROS)
+        # Round half-up from micro-units back to minor units
+        fees = (variable_micros + MICROS // 2) // MICROS
+        fees += to_minor(self.fixed, currency)
+        fees = np.maximum(fees, to_minor(self.minimum, currency))
+        return np.minimum(fees, amounts)
+
+
+class FeeBreakdown:
+    __slots__ = ('amount', 'fee', 'payout', 'currency')
+
+    def __init__(self, amount: Decimal, fee: Decimal, currency: str):
+        self.amount = amount
+        self.fee = fee
+        self.payout = amount - fee
+        self.currency = currency
+
+    def __repr__(self):
+        return f'FeeBreakdown({self.amount} {self.currency}: fee {self.fee}, payout {self.payout})'
+
+
+_schedules = {}
+
+
+def get_fee_schedule(category: Optional[str] = None, method: Optional[str] = None) -> FeeSchedule:
+    """
+    Schedule for a category and payment method. ``PLATFORM_FEE_SCHEDULES`` keys
+    are ``"<category>:<method>"`` with ``*`` as a wildcard; the most specific
+    match wins.
+    """
+    configured = settings.PLATFORM_FEE_SCHEDULES
+    for key in (f'{category}:{method}', f'{category}:*', f'*:{method}', '*:*'):
+        if key in configured:
+            schedule = _schedules.get(key)
+            if schedule is None or schedule[0] is not configured[key]:
+                schedule = _schedules[key] = (configured[key], FeeSchedule.from_setting(configured[key]))
+            return schedule[1]
+    raise MoneyError('PLATFORM_FEE_SCHEDULES has no "*:*" default')
+
+
+def platform_fee(amount, currency: str = 'USD', category: Optional[str] = None,
+                 method: Optional[str] = None) -> FeeBreakdown:
+    """Fee and expert payout for one amount"""
+    amount = quantize(amount, currency)
+    return FeeBreakdown(amount, get_fee_schedule(category, method).fee(amount, currency), currency)
+
+
+def compute_fees(items: Iterable[Tuple[object, str, Optional[str], Optional[str]]]) -> List[FeeBreakdown]:
+    """
+    Fees for many ``(amount, currency, category, method)`` items, in input order.
+
+    Items sharing a schedule and currency are priced together in one
+    vectorised pass.
+    """
+    items = list(items)
+    schedules = {}
+    groups = {}
+    for index, (amount, currency, category, method) in enumerate(items):
+        schedule = schedules.get((category, method))
+        if schedule is None:
+            schedule = schedules[(category, method)] = get_fee_schedule(category, method)
+        group = groups.get((id(schedule), currency))
+        if group is None:
+            group = groups[(id(schedule), currency)] = (schedule, currency, [], [])
+        group[2].append(index)
+        group[3].append(amount)
+
+    results = [None] * len(items)
+    for schedule, currency, indexes, amounts in groups.values():
+        places = exponent(currency)
+        quantum = Decimal(1).scaleb(-places)
+        scale = Decimal(1).scaleb(places)
+        minor = np.fromiter(
+            (int((to_decimal(amount) * scale).to_integral_value(ROUND_HALF_UP)) for amount in amounts),
+            dtype=np.int64, count=len(amounts),
+        )
+        fees = schedule.fees_minor(minor, currency)
+        for index, amount_minor, fee_minor in zip(indexes, minor.tolist(), fees.tolist()):
+            amount = Decimal(amount_minor) * quantum
+            fee = Decimal(fee_minor) * quantum
+            breakdown = results[index] = FeeBreakdown.__new__(FeeBreakdown)
+            breakdown.amount, breakdown.fee, breakdown.payout, breakdown.currency = amount, fee, amount - fee, currency
+    return results
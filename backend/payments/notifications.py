@@ -1,8 +1,10 @@
 from django.db import models
 from django.conf import settings
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
+
+from accounts import outbox
+
+outbox.register('payment_client', 'Payment Update: {{ event_type }}', html='payments/email/client_notification.html')
+outbox.register('payment_expert', 'Payment Update: {{ event_type }}', html='payments/email/expert_notification.html')
 
 class PaymentNotification(models.Model):
     """Tracks payment status changes and notifications"""
@@ -38,43 +40,29 @@ class PaymentNotification(models.Model):
         return f"{self.get_event_type_display()} - {self.payment_intent}"
 
     def send_notification(self):
-        """Send email notification based on event type"""
+        """Queue the email notification for this event (sent by the outbox worker)"""
         if self.notification_sent:
             return
 
         # Determine recipient based on event type
         if 'payout' in self.event_type:
             recipient = self.payment_intent.task.assigned_expert.email
-            template_name = 'payments/email/expert_notification.html'
+            template = 'payment_expert'
         else:
             recipient = self.payment_intent.client.email
-            template_name = 'payments/email/client_notification.html'
+            template = 'payment_client'
 
-        # Prepare email content
-        context = {
+        outbox.enqueue(template, recipient, {
             'event_type': self.get_event_type_display(),
             'message': self.message,
             'task_title': self.payment_intent.task.title,
-            'amount': self.payment_intent.amount,
+            'amount': str(self.payment_intent.amount),
             'currency': self.payment_intent.currency,
             'payment_method': self.payment_intent.get_payment_method_display(),
-        }
-
-        # Render email template
-        html_message = render_to_string(template_name, context)
-        plain_message = strip_tags(html_message)
-
-        # Send email
-        send_mail(
-            subject=f"Payment Update: {self.get_event_type_display()}",
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[recipient],
-            html_message=html_message
-        )
+        })
 
         self.notification_sent = True
-        self.save()
+        self.save(update_fields=['notification_sent'])
 
 
 class PaymentStatusLog(models.Model):
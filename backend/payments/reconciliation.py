@@ -0,0 +1,308 @@
+"""
+Settlement report reconciliation
+
+Matches a gateway settlement file against our records in one streaming
+pass:
+
+1. Build a hash index over our records for the settlement window,
+   reference -> ``Record``. PayPal uses ``PaymentIntent.paypal_capture_id``,
+   Wise uses ``PaymentIntent.wise_transfer_id`` and
+   ``ExpertPayout.wise_transfer_id``, and M-PESA uses
+   ``PaymentIntent.mpesa_transaction_id``.
+2. Stream the file through a parser generator. Each row is looked up in
+   the index and compared on amount, currency and status. A refund row
+   refers back to the original payment, so one record can match several
+   rows.
+3. Records no row matched are missing from the report.
+
+Memory is bounded by the number of our records in the window, not by the
+size of the file. Mismatches are written to the report as they are found,
+and fixes are flushed with ``bulk_update`` in fixed-size batches. Two
+kinds of fix are applied: a settled payment we still show as unfinished
+is marked completed, and a reversal of a payment we show as completed is
+marked refunded. Every fix writes a ``PaymentStatusLog`` row (on the
+payout's intent for payouts). Every other difference is only reported.
+"""
+import csv
+import io
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterable, Iterator, Optional
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ExpertPayout, PaymentIntent, PaymentStatusLog
+from .money import exponent, quantize
+
+FIX_BATCH_SIZE = 1000
+REPORT_FIELDS = ['kind', 'provider', 'reference', 'record', 'our_amount', 'their_amount',
+                 'our_currency', 'their_currency', 'our_status', 'their_status', 'line']
+UNFINISHED = {'pending', 'processing'}
+
+
+class SettlementRow:
+    __slots__ = ('reference', 'amount', 'currency', 'status', 'line')
+
+    def __init__(self, reference: str, amount: Decimal, currency: str, status: str, line: int):
+        self.reference = reference
+        self.amount = amount
+        self.currency = currency
+        self.status = status
+        self.line = line
+
+
+class Record:
+    """The fields of one of our rows that reconciliation needs"""
+
+    __slots__ = ('model', 'pk', 'amount', 'currency', 'status', 'intent_id', 'seen')
+
+    def __init__(self, model, pk: int, amount: Decimal, currency: str, status: str, intent_id: int):
+        self.model = model
+        self.pk = pk
+        self.amount = amount
+        self.currency = currency
+        self.status = status
+        self.intent_id = intent_id
+        self.seen = False
+
+    @property
+    def label(self) -> str:
+        return f'{self.model.__name__}:{self.pk}'
+
+
+def parse_amount(value: str) -> Optional[Decimal]:
+    try:
+        return abs(Decimal(str(value).replace(',', '').strip() or '0'))
+    except InvalidOperation:
+        return None
+
+
+class SettlementParser:
+    """
+    Turns a settlement file into ``SettlementRow`` objects lazily.
+
+    Subclasses map the provider's columns; ``status`` is ``completed`` for
+    settled money and ``refunded`` for reversals.
+    """
+    provider = None
+
+    def rows(self, fh: Iterable[str]) -> Iterator[SettlementRow]:
+        raise NotImplementedError
+
+
+class PayPalSettlementParser(SettlementParser):
+    """
+    PayPal settlement report (STL). Only ``CH`` (column header) and ``SB``
+    (section body) records matter. Amounts are in the currency's minor
+    unit (cents, or whole yen for zero-decimal currencies). T11xx
+    event codes are reversals and refunds, and they are matched on the
+    original transaction (``PayPal Reference ID``).
+    """
+    provider = 'paypal'
+
+    def rows(self, fh):
+        columns = None
+        for line, record in enumerate(csv.reader(fh), start=1):
+            if not record:
+                continue
+            kind = record[0].strip()
+            if kind == 'CH':
+                columns = {name.strip(): i for i, name in enumerate(record)}
+            elif kind == 'SB' and columns:
+                amount = parse_amount(record[columns['Gross Transaction Amount']])
+                if amount is None:
+                    continue
+                event_code = record[columns['Transaction Event Code']].strip()
+                reference = record[columns['Transaction ID']].strip()
+                if event_code.startswith('T11'):
+                    reference = record[columns['PayPal Reference ID']].strip() or reference
+                currency = record[columns['Gross Transaction Currency']].strip().upper()
+                yield SettlementRow(
+                    reference,
+                    quantize(amount.scaleb(-exponent(currency)), currency),
+                    currency,
+                    'refunded' if event_code.startswith('T11') else 'completed',
+                    line,
+                )
+
+
+class WiseSettlementParser(SettlementParser):
+    """Wise balance statement CSV (``TransferWise ID`` like ``TRANSFER-123``)"""
+    provider = 'wise'
+
+    def rows(self, fh):
+        for line, record in enumerate(csv.DictReader(fh), start=2):
+            reference = (record.get('TransferWise ID') or '').strip()
+            amount = parse_amount(record.get('Amount', ''))
+            if not reference.startswith('TRANSFER-') or amount is None:
+                continue
+            description = (record.get('Description') or '').lower()
+            yield SettlementRow(
+                reference[len('TRANSFER-'):],
+                amount,
+                (record.get('Currency') or '').strip().upper(),
+                'refunded' if 'refund' in description or 'cancel' in description else 'completed',
+                line,
+            )
+
+
+class MpesaSettlementParser(SettlementParser):
+    """M-PESA organisation statement CSV, keyed on ``Receipt No.``"""
+    provider = 'mpesa'
+
+    def rows(self, fh):
+        for line, record in enumerate(csv.DictReader(fh), start=2):
+            reference = (record.get('Receipt No.') or '').strip()
+            if not reference:
+                continue
+            amount = parse_amount(record.get('Paid In') or record.get('Withdrawn') or '')
+            if amount is None:
+                continue
+            state = (record.get('Transaction Status') or '').strip().lower()
+            yield SettlementRow(
+                reference,
+                amount,
+                'KES',
+                'completed' if state == 'completed' else ('refunded' if 'revers' in state else state),
+                line,
+            )
+
+
+PARSERS = {
+    'paypal': PayPalSettlementParser,
+    'wise': WiseSettlementParser,
+    'mpesa': MpesaSettlementParser,
+}
+
+# (model, reference field) pairs indexed for each provider
+INDEXED_FIELDS = {
+    'paypal': [(PaymentIntent, 'paypal_capture_id')],
+    'wise': [(PaymentIntent, 'wise_transfer_id'), (ExpertPayout, 'wise_transfer_id')],
+    'mpesa': [(PaymentIntent, 'mpesa_transaction_id')],
+}
+
+
+def build_index(provider: str, since: Optional[datetime] = None,
+                until: Optional[datetime] = None) -> Dict[str, Record]:
+    """reference -> Record for every record of ``provider`` created in the window"""
+    index = {}
+    for model, field in INDEXED_FIELDS[provider]:
+        queryset = model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+        if since:
+            queryset = queryset.filter(created_at__gte=since)
+        if until:
+            queryset = queryset.filter(created_at__lt=until)
+        intent_field = 'pk' if model is PaymentIntent else 'payment_intent_id'
+        values = queryset.order_by().values_list(field, 'pk', 'amount', 'currency', 'status', intent_field)
+        for reference, pk, amount, currency, status, intent_id in values.iterator(chunk_size=5000):
+            index.setdefault(str(reference), Record(model, pk, amount, currency, status, intent_id))
+    return index
+
+
+class Reconciler:
+    """
+    One reconciliation run; ``counts`` holds the number of rows per outcome.
+    With ``apply=False`` fixes are only reported.
+    """
+
+    def __init__(self, provider: str, report: Optional[io.TextIOBase] = None, apply: bool = False):
+        self.provider = provider
+        self.apply = apply
+        self.writer = csv.writer(report) if report is not None else None
+        if self.writer:
+            self.writer.writerow(REPORT_FIELDS)
+        self.counts = {}
+        self._fixes = []
+
+    def _count(self, kind: str):
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def _report(self, kind: str, reference: str, record: Optional[Record] = None,
+                row: Optional[SettlementRow] = None):
+        self._count(kind)
+        if self.writer:
+            self.writer.writerow([
+                kind, self.provider, reference,
+                record.label if record else '',
+                record.amount if record else '', row.amount if row else '',
+                record.currency if record else '', row.currency if row else '',
+                record.status if record else '', row.status if row else '',
+                row.line if row else '',
+            ])
+
+    def run(self, rows: Iterable[SettlementRow], index: Dict[str, Record]) -> Dict[str, int]:
+        for row in rows:
+            record = index.get(row.reference)
+            if record is None:
+                self._report('unknown_reference', row.reference, row=row)
+                continue
+            record.seen = True
+            # Payout amounts may be in the payout currency, not the one Wise debited
+            if record.currency == row.currency and record.amount != row.amount:
+                self._report('amount_mismatch', row.reference, record, row)
+            elif record.model is PaymentIntent and record.currency != row.currency:
+                self._report('currency_mismatch', row.reference, record, row)
+            elif row.status == 'completed' and record.status in UNFINISHED:
+                self._fix(record, 'completed', row)
+            elif row.status == 'refunded' and record.status == 'completed':
+                self._fix(record, 'refunded' if record.model is PaymentIntent else 'failed', row)
+            elif row.status not in ('completed', 'refunded'):
+                self._report('status_mismatch', row.reference, record, row)
+            else:
+                self._count('matched')
+        for reference, record in index.items():
+            if not record.seen:
+                self._report('missing_from_report', reference, record)
+        self._flush()
+        return self.counts
+
+    def _fix(self, record: Record, new_status: str, row: SettlementRow):
+        self._report(f'fix_{new_status}', row.reference, record, row)
+        if self.apply:
+            self._fixes.append((record, record.status, new_status))
+            if len(self._fixes) >= FIX_BATCH_SIZE:
+                self._flush()
+        record.status = new_status
+
+    def _flush(self):
+        if not self._fixes:
+            return
+        now = timezone.now()
+        # Completion stamps only move forward; reversals keep the original one
+        updates = {
+            (PaymentIntent, True): [], (PaymentIntent, False): [],
+            (ExpertPayout, True): [], (ExpertPayout, False): [],
+        }
+        logs = []
+        notes = f'Reconciled against {self.provider} settlement report'
+        for record, previous_status, new_status in self._fixes:
+            completed = new_status == 'completed'
+            if record.model is PaymentIntent:
+                obj = PaymentIntent(pk=record.pk, status=new_status, completed_at=now, updated_at=now)
+                logs.append(PaymentStatusLog(
+                    payment_intent_id=record.pk, previous_status=previous_status, new_status=new_status, notes=notes,
+                ))
+            else:
+                obj = ExpertPayout(pk=record.pk, status=new_status, processed_at=now, updated_at=now)
+                logs.append(PaymentStatusLog(
+                    payment_intent_id=record.intent_id, previous_status=previous_status, new_status=new_status,
+                    notes=f'Expert payout {record.pk}: {notes}',
+                ))
+            updates[record.model, completed].append(obj)
+        stamp_fields = {PaymentIntent: 'completed_at', ExpertPayout: 'processed_at'}
+        with transaction.atomic():
+            for (model, completed), objs in updates.items():
+                fields = ['status', 'updated_at'] + ([stamp_fields[model]] if completed else [])
+                model.objects.bulk_update(objs, fields)
+            PaymentStatusLog.objects.bulk_create(logs)
+        self._fixes = []
+
+
+def reconcile(provider: str, fh: Iterable[str], report: Optional[io.TextIOBase] = None,
+              apply: bool = False, since: Optional[datetime] = None,
+              until: Optional[datetime] = None) -> Dict[str, int]:
+    """Reconcile one settlement file; returns the row count per outcome"""
+    index = build_index(provider, since, until)
+    rows = PARSERS[provider]().rows(fh)
+    return Reconciler(provider, report=report, apply=apply).run(rows, index)
@@ -3,6 +3,7 @@ Serializers for payments app
 """
 from rest_framework import serializers
 from .models import PaymentIntent, ExpertPayout, ExpertPaymentMethod, Refund, Invoice
+from .fx import RateUnavailable, convert
 from tasks.serializers import TaskSerializer
 from accounts.serializers import UserSerializer
 
@@ -37,6 +38,7 @@ class ExpertPayoutSerializer(serializers.ModelSerializer):
     expert_name = serializers.CharField(source='expert.get_full_name', read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     payout_method_display = serializers.CharField(source='get_payout_method_display', read_only=True)
+    estimated_kes_amount = serializers.SerializerMethodField()
     
     class Meta:
         model = ExpertPayout
@@ -44,8 +46,8 @@ class ExpertPayoutSerializer(serializers.ModelSerializer):
             'id', 'expert', 'expert_name', 'payment_intent', 'amount',
             'currency', 'payout_method', 'payout_method_display', 'status',
             'status_display', 'payout_reference', 'processing_fee',
-            'created_at', 'updated_at', 'processed_at', 'failure_reason',
-            'gateway_response'
+            'estimated_kes_amount', 'created_at', 'updated_at', 'processed_at',
+            'failure_reason', 'gateway_response'
         ]
         read_only_fields = [
             'id', 'expert', 'payment_intent', 'status', 'payout_reference',
@@ -53,6 +55,15 @@ class ExpertPayoutSerializer(serializers.ModelSerializer):
             'gateway_response'
         ]
 
+    def get_estimated_kes_amount(self, obj):
+        """Indicative M-PESA amount at the cached rate; None when no current rate"""
+        if obj.payout_method != 'mpesa':
+            return None
+        try:
+            return str(convert(obj.amount, obj.currency, 'KES'))
+        except RateUnavailable:
+            return None
+
 
 class ExpertPaymentMethodSerializer(serializers.ModelSerializer):
     """Serializer for ExpertPaymentMethod"""
@@ -1,5 +1,6 @@
 from .paypal_service import PayPalService
 from .wise_service import WiseService
 from .mpesa_service import MPESAService
+from .payment_service import PaymentService
 
-__all__ = ['PayPalService', 'WiseService', 'MPESAService']
\ No newline at end of file
+__all__ = ['PayPalService', 'WiseService', 'MPESAService', 'PaymentService']
@@ -0,0 +1,236 @@
+"""
+Shared HTTP layer for the payment gateways
+
+Every gateway service talks through a ``GatewayClient``. There is one client
+per (provider, base URL) and process, and each client keeps a pooled
+keep-alive ``requests.Session``, so TLS handshakes are paid once per
+connection instead of once per call.
+
+OAuth tokens (PayPal, M-PESA) are cached in process and in the Django
+cache (Redis in production), so all workers share one token until it is
+``PAYMENT_TOKEN_REFRESH_MARGIN`` seconds from expiry. A 401 drops the
+cached token and retries the call once with a fresh one.
+
+Timeouts and retries come from the ``PAYMENT_GATEWAY_*`` settings.
+Connection failures are retried for every method, since the request never
+reached the gateway. 429/502/503/504 responses are only retried for
+idempotent methods; retrying a POST is left to the caller, which knows
+whether the request carries an idempotency key. Latency and status of
+every call are recorded in ``gateway_metrics``.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional, Tuple
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+TOKEN_CACHE_PREFIX = 'payments:gateway_token'
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+ID_SEGMENT_RE = re.compile(r'/(?:\d+|[0-9a-fA-F-]{16,}|[A-Z0-9]{12,})(?=/|$)')
+
+
+class GatewayMetrics:
+    """Per-endpoint call counts, errors and latency percentiles for this process"""
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, method: str, path: str, status, elapsed: float):
+        key = f'{provider} {method} {ID_SEGMENT_RE.sub("/:id", path.split("?")[0])}'
+        with self._lock:
+            entry = self._endpoints.get(key)
+            if entry is None:
+                entry = self._endpoints[key] = {'calls': 0, 'errors': 0, 'latencies': deque(maxlen=self.window)}
+            entry['calls'] += 1
+            if status is None or status >= 400:
+                entry['errors'] += 1
+            entry['latencies'].append(elapsed)
+        logger.debug(f"{key} -> {status} in {elapsed * 1000:.0f}ms")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            result = {}
+            for key, entry in self._endpoints.items():
+                ordered = sorted(entry['latencies'])
+                pick = lambda q: round(ordered[min(int(len(ordered) * q), len(ordered) - 1)] * 1000, 1)
+                result[key] = {
+                    'calls': entry['calls'],
+                    'errors': entry['errors'],
+                    'p50_ms': pick(0.5),
+                    'p95_ms': pick(0.95),
+                    'max_ms': round(ordered[-1] * 1000, 1),
+                }
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+gateway_metrics = GatewayMetrics()
+
+
+class TokenCache:
+    """
+    OAuth access tokens kept in process and in the shared Django cache
+
+    ``fetch`` returns ``(token, expires_in_seconds)``. Only one thread per
+    process fetches a token at a time; the others wait and reuse it.
+    """
+
+    def __init__(self):
+        self._tokens = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def cache_key(name: str) -> str:
+        return f'{TOKEN_CACHE_PREFIX}:{name}'
+
+    def _fresh(self, entry) -> Optional[str]:
+        if entry and entry[1] - settings.PAYMENT_TOKEN_REFRESH_MARGIN > time.time():
+            return entry[0]
+        return None
+
+    def get(self, name: str, fetch: Callable[[], Tuple[str, int]]) -> str:
+        token = self._fresh(self._tokens.get(name))
+        if token:
+            return token
+        with self._lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            token = self._fresh(self._tokens.get(name))
+            if token:
+                return token
+            entry = cache.get(self.cache_key(name))
+            if not self._fresh(entry):
+                token, expires_in = fetch()
+                entry = (token, time.time() + int(expires_in))
+                ttl = int(expires_in) - settings.PAYMENT_TOKEN_REFRESH_MARGIN
+                if ttl > 0:
+                    cache.set(self.cache_key(name), entry, timeout=ttl)
+            self._tokens[name] = tuple(entry)
+            return entry[0]
+
+    def invalidate(self, name: str):
+        with self._lock:
+            self._tokens.pop(name, None)
+        cache.delete(self.cache_key(name))
+
+
+token_cache = TokenCache()
+
+
+class GatewayClient:
+    """
+    Pooled HTTP client for one gateway
+
+    ``token_fetcher`` is called with the client and returns
+    ``(access_token, expires_in)``; when it is set, every call sends
+    ``Authorization: Bearer <token>`` unless ``authenticate=False``.
+    """
+
+    def __init__(self, provider: str, base_url: str, token_fetcher: Optional[Callable] = None,
+                 headers: Optional[Dict] = None):
+        self.provider = provider
+        self.base_url = base_url.rstrip('/')
+        self.token_fetcher = token_fetcher
+        self.headers = headers or {}
+        self.timeout = (settings.PAYMENT_GATEWAY_CONNECT_TIMEOUT, settings.PAYMENT_GATEWAY_READ_TIMEOUT)
+        self._session = None
+        self._pid = None
+
+    @property
+    def token_name(self) -> str:
+        return f'{self.provider}:{self.base_url}'
+
+    @property
+    def session(self) -> requests.Session:
+        # Sockets must not be shared with a forked worker (Celery prefork)
+        if self._session is None or self._pid != os.getpid():
+            self._session = self._build_session()
+            self._pid = os.getpid()
+        return self._session
+
+    def _build_session(self) -> requests.Session:
+        retries = settings.PAYMENT_GATEWAY_RETRIES
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=settings.PAYMENT_GATEWAY_BACKOFF,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=settings.PAYMENT_GATEWAY_POOL_SIZE,
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update(self.headers)
+        return session
+
+    def access_token(self) -> str:
+        return token_cache.get(self.token_name, lambda: self.token_fetcher(self))
+
+    def request(self, method: str, path: str, *, authenticate: bool = True, **kwargs) -> requests.Response:
+        """Send one request and record its latency; HTTP errors are not raised"""
+        url = path if path.startswith('http') else f'{self.base_url}{path}'
+        kwargs.setdefault('timeout', self.timeout)
+        use_token = authenticate and self.token_fetcher is not None
+
+        for attempt in range(2):
+            if use_token:
+                kwargs['headers'] = {**kwargs.get('headers', {}), 'Authorization': f'Bearer {self.access_token()}'}
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.RequestException:
+                gateway_metrics.record(self.provider, method, path, None, time.perf_counter() - started)
+                raise
+            gateway_metrics.record(self.provider, method, path, response.status_code, time.perf_counter() - started)
+            if response.status_code == 401 and use_token and attempt == 0:
+                token_cache.invalidate(self.token_name)
+                continue
+            return response
+        return response
+
+    def json(self, method: str, path: str, **kwargs) -> Dict:
+        """Send a request and return the decoded body, raising ``HTTPError`` on 4xx/5xx"""
+        response = self.request(method, path, **kwargs)
+        response.raise_for_status()
+        return response.json() if response.content else {}
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_gateway_client(provider: str, base_url: str, **kwargs) -> GatewayClient:
+    """The process-wide client for a gateway, created on first use"""
+    key = (provider, base_url)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = GatewayClient(provider, base_url, **kwargs)
+    return client
@@ -1,20 +1,65 @@
 """
 M-Pesa payment service integration
 """
-import requests
 from typing import Dict, Any
+from django.conf import settings
+
+from .http import get_gateway_client
+
+
+def fetch_access_token(client):
+    """OAuth client-credentials token from Safaricom as ``(token, expires_in)``"""
+    data = client.json(
+        'GET', '/oauth/v1/generate?grant_type=client_credentials',
+        authenticate=False, auth=(settings.MPESA_CONSUMER_KEY, settings.MPESA_CONSUMER_SECRET)
+    )
+    return data['access_token'], int(data.get('expires_in', 3599))
 
 
 class MPESAService:
-    """M-Pesa payment service implementation"""
-    
-    def __init__(self, consumer_key: str, consumer_secret: str, shortcode: str, passkey: str):
-        self.consumer_key = consumer_key
-        self.consumer_secret = consumer_secret
-        self.shortcode = shortcode
-        self.passkey = passkey
-        self.base_url = "https://sandbox.safaricom.co.ke"  # Use production URL for live
-    
+    """Service for handling M-PESA payment operations"""
+
+    def __init__(self):
+        self.consumer_key = settings.MPESA_CONSUMER_KEY
+        self.consumer_secret = settings.MPESA_CONSUMER_SECRET
+        self.shortcode = settings.MPESA_SHORTCODE
+        self.passkey = settings.MPESA_PASSKEY
+        self.base_url = settings.MPESA_BASE_URL
+        self.client = get_gateway_client('mpesa', self.base_url, token_fetcher=fetch_access_token)
+
+    def _get_access_token(self):
+        """Get OAuth access token from Safaricom (cached until shortly before expiry)"""
+        return self.client.access_token()
+
+    def callback_url(self, kind):
+        """URL of the webhook endpoint Safaricom posts B2C ``result``/``timeout`` callbacks to"""
+        base_url = settings.MPESA_CALLBACK_BASE_URL.rstrip('/')
+        return f"{base_url}/api/payments/webhooks/mpesa/{kind}/{settings.MPESA_CALLBACK_TOKEN}/"
+
+    def initiate_b2c_payment(self, phone_number, amount, remarks, originator_conversation_id=None) -> Dict[str, Any]:
+        """
+        Initiate B2C payment (Business to Customer)
+
+        Safaricom rejects a repeated ``OriginatorConversationID``, which keeps
+        a retried request from paying out twice.
+        """
+        payload = {
+            "InitiatorName": settings.MPESA_INITIATOR_NAME,
+            "SecurityCredential": settings.MPESA_SECURITY_CREDENTIAL,
+            "CommandID": "BusinessPayment",
+            "Amount": str(amount),
+            "PartyA": self.shortcode,
+            "PartyB": phone_number,
+            "Remarks": remarks,
+            "QueueTimeOutURL": self.callback_url('timeout'),
+            "ResultURL": self.callback_url('result'),
+            "Occasion": ""
+        }
+        if originator_conversation_id:
+            payload["OriginatorConversationID"] = str(originator_conversation_id)
+
+        return self.client.json('POST', '/mpesa/b2c/v3/paymentrequest', json=payload)
+
     def stk_push(self, phone_number: str, amount: float, account_reference: str) -> Dict[str, Any]:
         """Initiate STK push payment"""
         # Placeholder implementation
@@ -24,7 +69,7 @@ class MPESAService:
             "ResponseCode": "0",
             "ResponseDescription": "Success"
         }
-    
+
     def query_stk_status(self, checkout_request_id: str) -> Dict[str, Any]:
         """Query STK push status"""
         # Placeholder implementation
@@ -33,3 +78,7 @@ class MPESAService:
             "ResultCode": "0",
             "ResultDesc": "The service request is processed successfully."
         }
+
+
+# Name used by the original payments.services module
+MpesaService = MPESAService
@@ -0,0 +1,95 @@
+"""
+Client payment and expert payout orchestration
+"""
+
+from django.db import transaction
+
+from ..models import PaymentIntent, ExpertPayout
+from ..money import budget_amount, compute_fees, get_fee_schedule, quantize
+
+
+class PaymentService:
+    """Main service for handling all payment operations"""
+
+    @staticmethod
+    def calculate_platform_fee(amount, currency='USD', category=None, method=None):
+        """Platform fee on ``amount`` from the matching fee schedule"""
+        return get_fee_schedule(category, method).fee(amount, currency)
+
+    @classmethod
+    def create_payment_intent(cls, task, client, payment_method=''):
+        """Create a payment intent for a task"""
+        amount = quantize(task.final_price or task.estimated_price or budget_amount(task.budget_range))
+        platform_fee = cls.calculate_platform_fee(amount, 'USD', task.category, payment_method)
+
+        # Create PaymentIntent record
+        return PaymentIntent.objects.create(
+            task=task,
+            client=client,
+            amount=amount,
+            payment_method=payment_method,
+            platform_fee=platform_fee,
+            expert_payout_amount=amount - platform_fee,
+            currency='USD'  # Default to USD for client payments
+        )
+
+    @staticmethod
+    def recalculate_platform_fees(intents, batch_size=1000):
+        """
+        Reprice the payment intents in the ``intents`` queryset after a fee
+        schedule change, ``batch_size`` at a time in one vectorised pass
+        each; returns the number updated
+        """
+        intents = intents.select_related('task').only(
+            'id', 'amount', 'currency', 'payment_method', 'task__category'
+        ).order_by('pk')
+        updated = 0
+        last_pk = 0
+        while True:
+            batch = list(intents.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                return updated
+            last_pk = batch[-1].pk
+            breakdowns = compute_fees(
+                (intent.amount, intent.currency, intent.task.category, intent.payment_method) for intent in batch
+            )
+            for intent, breakdown in zip(batch, breakdowns):
+                intent.platform_fee = breakdown.fee
+                intent.expert_payout_amount = breakdown.payout
+            PaymentIntent.objects.bulk_update(batch, ['platform_fee', 'expert_payout_amount'])
+            updated += len(batch)
+
+    @classmethod
+    def process_payment(cls, payment_intent_id):
+        """
+        Start paying the expert for a payment intent
+
+        Creates the ``ExpertPayout`` and hands it to the Celery pipeline in
+        ``payments.tasks`` (Wise quote, transfer, funding, then M-PESA B2C).
+        Nothing here talks to a gateway, so the transaction below only spans
+        a couple of quick writes. Calling it again for the same intent
+        returns the existing payout instead of paying twice.
+        """
+        from ..tasks import dispatch_payout
+
+        with transaction.atomic():
+            payment_intent = PaymentIntent.objects.select_for_update().select_related('task').get(
+                id=payment_intent_id
+            )
+            payout, created = ExpertPayout.objects.get_or_create(
+                payment_intent=payment_intent,
+                defaults={
+                    'expert': payment_intent.task.assigned_expert,
+                    'amount': payment_intent.expert_payout_amount or (
+                        payment_intent.amount - payment_intent.platform_fee
+                    ),
+                    'currency': payment_intent.currency,
+                    'payout_method': 'mpesa',
+                }
+            )
+            if created:
+                payment_intent.status = 'processing'
+                payment_intent.save(update_fields=['status', 'updated_at'])
+                transaction.on_commit(lambda: dispatch_payout(payout.id, payout.step))
+
+        return payment_intent, payout
@@ -1,41 +1,41 @@
-import requests
+import time
 from decimal import Decimal
 from django.conf import settings
 
+from .http import get_gateway_client
+
+
+def fetch_access_token(client):
+    """OAuth client-credentials token from PayPal as ``(token, expires_in)``"""
+    data = client.json(
+        'POST', '/v1/oauth2/token',
+        authenticate=False,
+        auth=(settings.PAYPAL_CLIENT_ID, settings.PAYPAL_CLIENT_SECRET),
+        headers={"Accept": "application/json", "Accept-Language": "en_US"},
+        data={"grant_type": "client_credentials"}
+    )
+    return data["access_token"], int(data.get("expires_in", 32400))
+
+
 class PayPalService:
     """Service for handling PayPal payment operations"""
     def __init__(self):
         self.client_id = settings.PAYPAL_CLIENT_ID
         self.client_secret = settings.PAYPAL_CLIENT_SECRET
-        self.base_url = 'https://api-m.sandbox.paypal.com' if settings.PAYPAL_SANDBOX else 'https://api-m.paypal.com'
+        self.base_url = 'https://api-m.sandbox.paypal.com' if settings.PAYPAL_MODE == 'sandbox' else 'https://api-m.paypal.com'
+        self.client = get_gateway_client('paypal', self.base_url, token_fetcher=fetch_access_token)
 
     def _get_access_token(self):
-        """Get OAuth access token from PayPal"""
-        auth_url = f"{self.base_url}/v1/oauth2/token"
-        headers = {
-            "Accept": "application/json",
-            "Accept-Language": "en_US"
-        }
-        data = {"grant_type": "client_credentials"}
-        
-        response = requests.post(
-            auth_url,
-            auth=(self.client_id, self.client_secret),
-            headers=headers,
-            data=data
-        )
-        response.raise_for_status()
-        return response.json()["access_token"]
-
-    def create_order(self, amount, currency='USD', order_items=None):
-        """Create a PayPal order"""
-        access_token = self._get_access_token()
-        
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {access_token}"
-        }
+        """Get OAuth access token from PayPal (cached until shortly before expiry)"""
+        return self.client.access_token()
+
+    def create_order(self, amount, currency='USD', order_items=None, request_id=None):
+        """
+        Create a PayPal order
 
+        With ``request_id`` (sent as ``PayPal-Request-Id``) PayPal returns the
+        original order when the same request is repeated.
+        """
         payload = {
             "intent": "CAPTURE",
             "purchase_units": [{
@@ -50,39 +50,18 @@ class PayPalService:
         if order_items:
             payload["purchase_units"][0]["items"] = order_items
 
-        response = requests.post(
-            f"{self.base_url}/v2/checkout/orders",
-            headers=headers,
-            json=payload
-        )
-        response.raise_for_status()
-        return response.json()
+        headers = {"PayPal-Request-Id": request_id} if request_id else {}
+        return self.client.json('POST', '/v2/checkout/orders', json=payload, headers=headers)
 
     def capture_payment(self, order_id):
         """Capture an approved PayPal payment"""
-        access_token = self._get_access_token()
-        
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {access_token}"
-        }
-
-        response = requests.post(
-            f"{self.base_url}/v2/checkout/orders/{order_id}/capture",
-            headers=headers
+        return self.client.json(
+            'POST', f'/v2/checkout/orders/{order_id}/capture',
+            headers={"Content-Type": "application/json"}
         )
-        response.raise_for_status()
-        return response.json()
 
     def create_payout(self, email, amount, currency='USD', note="Task payment"):
         """Create a PayPal payout to an expert"""
-        access_token = self._get_access_token()
-        
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {access_token}"
-        }
-
         payload = {
             "sender_batch_header": {
                 "sender_batch_id": f"Batch_{int(time.time())}",
@@ -100,39 +79,47 @@ class PayPalService:
             }]
         }
 
-        response = requests.post(
-            f"{self.base_url}/v1/payments/payouts",
-            headers=headers,
-            json=payload
+        return self.client.json('POST', '/v1/payments/payouts', json=payload)
+
+    def create_batch_payout(self, sender_batch_id, items, note="Task payment"):
+        """
+        Create one PayPal payout batch
+
+        ``items`` are dicts with ``receiver``, ``amount``, ``currency`` and
+        ``sender_item_id``. ``sender_batch_id`` doubles as the
+        ``PayPal-Request-Id``, so resubmitting the same batch returns the
+        original one instead of paying twice.
+        """
+        payload = {
+            "sender_batch_header": {
+                "sender_batch_id": sender_batch_id,
+                "email_subject": "You have a payment from the Freelance Platform",
+                "email_message": note
+            },
+            "items": [{
+                "recipient_type": "EMAIL",
+                "amount": {
+                    "value": str(item["amount"]),
+                    "currency": item["currency"]
+                },
+                "note": item.get("note", note),
+                "receiver": item["receiver"],
+                "sender_item_id": str(item["sender_item_id"])
+            } for item in items]
+        }
+
+        return self.client.json(
+            'POST', '/v1/payments/payouts', json=payload, headers={'PayPal-Request-Id': sender_batch_id}
         )
-        response.raise_for_status()
-        return response.json()
 
     def get_payout_status(self, payout_batch_id):
         """Check the status of a payout"""
-        access_token = self._get_access_token()
-        
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {access_token}"
-        }
-
-        response = requests.get(
-            f"{self.base_url}/v1/payments/payouts/{payout_batch_id}",
-            headers=headers
+        return self.client.json(
+            'GET', f'/v1/payments/payouts/{payout_batch_id}', params={'page_size': 1000, 'total_required': 'true'}
         )
-        response.raise_for_status()
-        return response.json()
 
     def refund_payment(self, capture_id, amount=None, reason=None):
         """Refund a payment partially or fully"""
-        access_token = self._get_access_token()
-        
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {access_token}"
-        }
-
         payload = {}
         if amount:
             payload["amount"] = {
@@ -142,10 +129,8 @@ class PayPalService:
         if reason:
             payload["note_to_payer"] = reason
 
-        response = requests.post(
-            f"{self.base_url}/v2/payments/captures/{capture_id}/refund",
-            headers=headers,
+        return self.client.json(
+            'POST', f'/v2/payments/captures/{capture_id}/refund',
+            headers={"Content-Type": "application/json"},
             json=payload if payload else None
         )
-        response.raise_for_status()
-        return response.json()
\ No newline at end of file
@@ -1,32 +1,124 @@
 """
 Wise payment service integration
 """
-import requests
-from typing import Dict, Any
+from typing import Any, Dict, List
+from django.conf import settings
+
+from .http import get_gateway_client
 
 
 class WiseService:
-    """Wise payment service implementation"""
-    
-    def __init__(self, api_key: str, environment: str = 'sandbox'):
-        self.api_key = api_key
-        self.environment = environment
-        self.base_url = f"https://api.sandbox.wise.com" if environment == 'sandbox' else "https://api.wise.com"
-    
-    def create_transfer(self, amount: float, currency: str, recipient: Dict[str, Any]) -> Dict[str, Any]:
-        """Create a transfer via Wise"""
-        # Placeholder implementation
+    """Service for handling Wise payment operations"""
+
+    def __init__(self):
+        self.api_key = settings.WISE_API_KEY
+        self.profile_id = settings.WISE_PROFILE_ID
+        self.base_url = (
+            'https://api.sandbox.transferwise.tech'
+            if settings.WISE_ENVIRONMENT == 'sandbox' else 'https://api.wise.com'
+        )
+        self.client = get_gateway_client('wise', self.base_url)
+
+    def _get_headers(self):
         return {
-            "id": "placeholder_transfer_id",
-            "status": "pending",
-            "amount": amount,
-            "currency": currency
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json'
+        }
+
+    def create_quote(self, source_amount, source_currency='USD', target_currency='KES') -> Dict[str, Any]:
+        """Create a quote for currency conversion"""
+        payload = {
+            'sourceCurrency': source_currency,
+            'targetCurrency': target_currency,
+            'sourceAmount': float(source_amount),
+            'profile': self.profile_id
+        }
+        return self.client.json(
+            'POST', f'/v3/profiles/{self.profile_id}/quotes', headers=self._get_headers(), json=payload
+        )
+
+    def get_rates(self, source=None, target=None) -> List[Dict[str, Any]]:
+        """Current mid-market rates, for every pair Wise supports when no pair is given"""
+        params = {}
+        if source and target:
+            params = {'source': source, 'target': target}
+        return self.client.json('GET', '/v1/rates', headers=self._get_headers(), params=params)
+
+    def create_transfer(self, quote_id, account_holder_name, phone_number, customer_transaction_id=None) -> Dict[str, Any]:
+        """
+        Create a transfer using a quote
+
+        ``customer_transaction_id`` makes the call idempotent: Wise returns
+        the existing transfer when the same id is sent again.
+        """
+        payload = {
+            'targetAccount': {
+                'type': 'phone',
+                'phone': phone_number,
+                'accountHolderName': account_holder_name,
+                'currency': 'KES'
+            },
+            'quoteUuid': quote_id
         }
-    
-    def get_transfer_status(self, transfer_id: str) -> Dict[str, Any]:
+        if customer_transaction_id:
+            payload['customerTransactionId'] = str(customer_transaction_id)
+        return self.client.json('POST', '/v1/transfers', headers=self._get_headers(), json=payload)
+
+    def fund_transfer(self, transfer_id) -> Dict[str, Any]:
+        """Fund a transfer using your Wise balance"""
+        return self.client.json(
+            'POST', f'/v3/profiles/{self.profile_id}/transfers/{transfer_id}/payments',
+            headers=self._get_headers(), json={'type': 'BALANCE'}
+        )
+
+    def get_transfer_status(self, transfer_id) -> Dict[str, Any]:
         """Get transfer status"""
-        # Placeholder implementation
-        return {
-            "id": transfer_id,
-            "status": "completed"
+        return self.client.json('GET', f'/v1/transfers/{transfer_id}', headers=self._get_headers())
+
+    def create_recipient_quote(self, amount, currency, recipient_id) -> Dict[str, Any]:
+        """Quote a same-currency payment of ``amount`` to an existing recipient account"""
+        payload = {
+            'sourceCurrency': currency,
+            'targetCurrency': currency,
+            'targetAmount': float(amount),
+            'targetAccount': int(recipient_id),
+            'profile': self.profile_id
         }
+        return self.client.json(
+            'POST', f'/v3/profiles/{self.profile_id}/quotes', headers=self._get_headers(), json=payload
+        )
+
+    def create_batch_group(self, name, source_currency) -> Dict[str, Any]:
+        """Open a batch group that transfers can be added to"""
+        return self.client.json(
+            'POST', f'/v3/profiles/{self.profile_id}/batch-groups',
+            headers=self._get_headers(), json={'name': name, 'sourceCurrency': source_currency}
+        )
+
+    def add_batch_transfer(self, batch_group_id, quote_id, recipient_id, customer_transaction_id,
+                           reference='Task payment') -> Dict[str, Any]:
+        """Add one transfer to an open batch group"""
+        payload = {
+            'targetAccount': int(recipient_id),
+            'quoteUuid': quote_id,
+            'customerTransactionId': str(customer_transaction_id),
+            'details': {'reference': reference}
+        }
+        return self.client.json(
+            'POST', f'/v3/profiles/{self.profile_id}/batch-groups/{batch_group_id}/transfers',
+            headers=self._get_headers(), json=payload
+        )
+
+    def complete_batch_group(self, batch_group_id, version) -> Dict[str, Any]:
+        """Close a batch group so it can be funded"""
+        return self.client.json(
+            'PATCH', f'/v3/profiles/{self.profile_id}/batch-groups/{batch_group_id}',
+            headers=self._get_headers(), json={'status': 'COMPLETED', 'version': version}
+        )
+
+    def fund_batch_group(self, batch_group_id) -> Dict[str, Any]:
+        """Fund every transfer of a completed batch group from the Wise balance"""
+        return self.client.json(
+            'POST', f'/v3/profiles/{self.profile_id}/batch-payments/{batch_group_id}/payments',
+            headers=self._get_headers(), json={'type': 'BALANCE'}
+        )
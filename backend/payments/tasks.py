@@ -0,0 +1,259 @@
+"""
+Expert payout pipeline
+
+An M-PESA payout moves through ``ExpertPayout.STEP_CHOICES`` one Celery
+task per step: Wise quote, Wise transfer, Wise funding, then the M-PESA B2C
+payment. Each task does its HTTP call with no transaction open and then
+advances the persisted cursor with a single conditional UPDATE
+(``WHERE payout_method = 'mpesa' AND step = <this step>``), so a duplicate
+or late delivery of the same step loses the race and changes nothing, and
+PayPal/Wise batch payouts can never be moved along.
+
+Every step is safe to repeat: quotes cost nothing, the transfer carries the
+payout's ``idempotency_key`` as Wise's ``customerTransactionId``, funding
+checks the transfer status first and the B2C request reuses the key as its
+``OriginatorConversationID``. Connection errors, timeouts, 429 and 5xx
+responses are retried with exponential backoff; anything else fails the
+payout and its payment intent.
+
+M-PESA accepting the B2C request (``ResponseCode`` 0) only means it was
+queued. The payout reaches ``done`` still ``processing``; the ResultURL
+callback (payments.webhooks) completes or fails it and its payment intent.
+"""
+import logging
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+import requests
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ExpertPayout, PaymentIntent
+from .services.mpesa_service import MPESAService
+from .services.wise_service import WiseService
+
+logger = logging.getLogger(__name__)
+
+NEXT_STEP = {
+    'quote': 'create_transfer',
+    'create_transfer': 'fund_transfer',
+    'fund_transfer': 'mpesa_b2c',
+    'mpesa_b2c': 'done',
+}
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+# Wise transfer states after which funding must not be attempted again
+WISE_FUNDED_STATES = {'processing', 'funds_converted', 'outgoing_payment_sent'}
+
+
+class PayoutStepError(Exception):
+    """A gateway answered but refused the request; retrying will not help"""
+
+
+def is_transient(exc):
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code in RETRYABLE_STATUS_CODES
+    return False
+
+
+def retry_countdown(retries):
+    """Exponential backoff with jitter, capped at ``PAYOUT_RETRY_BACKOFF_MAX``"""
+    delay = min(settings.PAYOUT_RETRY_BACKOFF * (2 ** retries), settings.PAYOUT_RETRY_BACKOFF_MAX)
+    return delay + random.uniform(0, delay / 4)
+
+
+def dispatch_payout(payout_id, step):
+    """Queue the task for ``step`` (no-op once the payout is done)"""
+    task = STEP_TASKS.get(step)
+    if task is not None:
+        task.delay(payout_id)
+
+
+def fail_payout(payout_id, step, reason):
+    with transaction.atomic():
+        failed = ExpertPayout.objects.filter(pk=payout_id, step=step).exclude(status='failed').update(
+            status='failed', failure_reason=reason, step_updated_at=timezone.now()
+        )
+        if failed:
+            PaymentIntent.objects.filter(expert_payout__pk=payout_id).update(
+                status='failed', updated_at=timezone.now()
+            )
+    logger.error(f"Payout {payout_id} failed at {step}: {reason}")
+
+
+def run_step(task, payout_id, step, action):
+    """
+    Run ``action(payout)`` for one pipeline step and advance the cursor
+
+    ``action`` performs the gateway call and returns the fields to store
+    with the step transition.
+    """
+    payout = ExpertPayout.objects.select_related('expert', 'payment_intent__task').filter(pk=payout_id).first()
+    if payout is None or payout.payout_method != 'mpesa' or payout.step != step or \
+            payout.status in ('completed', 'failed'):
+        return  # batch payouts are paid by payments.batch_payouts, never through this pipeline
+
+    ExpertPayout.objects.filter(pk=payout_id, payout_method='mpesa', step=step).update(
+        status='processing', step_attempts=F('step_attempts') + 1, step_updated_at=timezone.now()
+    )
+    try:
+        fields = action(payout)
+    except Exception as exc:
+        if is_transient(exc) and task.request.retries < settings.PAYOUT_MAX_RETRIES:
+            logger.warning(f"Payout {payout_id} {step} failed, retrying: {str(exc)}")
+            raise task.retry(exc=exc, countdown=retry_countdown(task.request.retries))
+        fail_payout(payout_id, step, f"{step}: {str(exc)}")
+        return
+
+    next_step = NEXT_STEP[step]
+    gateway_response = dict(payout.gateway_response)
+    gateway_response[step] = fields.pop('response', None)
+    now = timezone.now()
+    advanced = ExpertPayout.objects.filter(pk=payout_id, payout_method='mpesa', step=step).update(
+        step=next_step,
+        step_attempts=0,
+        step_updated_at=now,
+        updated_at=now,
+        gateway_response=gateway_response,
+        **fields
+    )
+    if advanced:
+        dispatch_payout(payout_id, next_step)
+
+
+def expert_phone_number(payout):
+    phone_number = payout.expert.phone_number
+    if not phone_number:
+        raise PayoutStepError(f"Expert {payout.expert_id} has no phone number")
+    return phone_number
+
+
+def create_quote(payout):
+    quote = WiseService().create_quote(source_amount=payout.amount, source_currency=payout.currency)
+    return {
+        'wise_quote_id': str(quote['id']),
+        'amount': Decimal(str(quote['targetAmount'])),
+        'currency': 'KES',
+        'response': quote,
+    }
+
+
+def create_transfer(payout):
+    expert = payout.expert
+    transfer = WiseService().create_transfer(
+        payout.wise_quote_id,
+        f"{expert.first_name} {expert.last_name}",
+        expert_phone_number(payout),
+        customer_transaction_id=payout.idempotency_key,
+    )
+    return {'wise_transfer_id': str(transfer['id']), 'response': transfer}
+
+
+def fund_transfer(payout):
+    wise_service = WiseService()
+    transfer = wise_service.get_transfer_status(payout.wise_transfer_id)
+    if transfer.get('status') in WISE_FUNDED_STATES:
+        return {'response': transfer}
+    if transfer.get('status') != 'incoming_payment_waiting':
+        raise PayoutStepError(f"Wise transfer {payout.wise_transfer_id} is {transfer.get('status')}")
+    return {'response': wise_service.fund_transfer(payout.wise_transfer_id)}
+
+
+def mpesa_b2c(payout):
+    result = MPESAService().initiate_b2c_payment(
+        expert_phone_number(payout),
+        int(payout.amount),  # M-PESA requires integer amounts
+        f"Payment for task: {payout.payment_intent.task.title}",
+        originator_conversation_id=payout.idempotency_key,
+    )
+    if str(result.get('ResponseCode')) != '0':
+        raise PayoutStepError(result.get('ResponseDescription') or 'M-PESA rejected the payment')
+    return {
+        'mpesa_conversation_id': result.get('ConversationID', ''),
+        'payout_reference': result.get('ConversationID') or None,
+        'response': result,
+    }
+
+
+@shared_task(bind=True, name='payments.tasks.payout_create_quote', max_retries=None)
+def payout_create_quote(self, payout_id):
+    run_step(self, payout_id, 'quote', create_quote)
+
+
+@shared_task(bind=True, name='payments.tasks.payout_create_transfer', max_retries=None)
+def payout_create_transfer(self, payout_id):
+    run_step(self, payout_id, 'create_transfer', create_transfer)
+
+
+@shared_task(bind=True, name='payments.tasks.payout_fund_transfer', max_retries=None)
+def payout_fund_transfer(self, payout_id):
+    run_step(self, payout_id, 'fund_transfer', fund_transfer)
+
+
+@shared_task(bind=True, name='payments.tasks.payout_mpesa_b2c', max_retries=None)
+def payout_mpesa_b2c(self, payout_id):
+    run_step(self, payout_id, 'mpesa_b2c', mpesa_b2c)
+
+
+STEP_TASKS = {
+    'quote': payout_create_quote,
+    'create_transfer': payout_create_transfer,
+    'fund_transfer': payout_fund_transfer,
+    'mpesa_b2c': payout_mpesa_b2c,
+}
+
+
+@shared_task(name='payments.tasks.resume_stalled_payouts')
+def resume_stalled_payouts():
+    """
+    Re-queue M-PESA pipeline payouts whose step has not moved for
+    ``PAYOUT_STALL_MINUTES``, e.g. after a worker died mid-task or a message
+    was lost
+    """
+    cutoff = timezone.now() - timedelta(minutes=settings.PAYOUT_STALL_MINUTES)
+    stalled = ExpertPayout.objects.filter(
+        payout_method='mpesa', status__in=['pending', 'processing'], step_updated_at__lt=cutoff
+    ).exclude(step__in=['batch', 'done']).values_list('id', 'step')
+    count = 0
+    for payout_id, step in stalled.iterator():
+        dispatch_payout(payout_id, step)
+        count += 1
+    if count:
+        logger.info("Re-queued %s stalled payouts", count)
+    return count
+
+
+@shared_task(name='payments.tasks.run_batch_payouts')
+def run_batch_payouts(limit=None):
+    """Pay all pending payouts in provider batches (see payments.batch_payouts)"""
+    from .batch_payouts import run_batch_payouts as run
+    return run(limit=limit)
+
+
+@shared_task(name='payments.tasks.process_webhook_events')
+def process_webhook_events(ordering_key):
+    """Apply the pending gateway events of one payment or payout in order"""
+    from .webhooks import process_events
+    return process_events(ordering_key)
+
+
+@shared_task(name='payments.tasks.process_pending_webhooks')
+def process_pending_webhooks():
+    """Re-queue keys whose events are still pending, e.g. after a lost task"""
+    from .webhooks import pending_ordering_keys
+    keys = pending_ordering_keys(older_than=settings.WEBHOOK_SWEEP_SECONDS)
+    for key in keys:
+        process_webhook_events.delay(key)
+    return len(keys)
+
+
+@shared_task(name='payments.tasks.refresh_fx_rates')
+def refresh_fx_rates(pairs=None):
+    """Fetch display exchange rates from Wise (see payments.fx)"""
+    from .fx import refresh_rates
+    return refresh_rates([tuple(pair) for pair in pairs] if pairs else None)
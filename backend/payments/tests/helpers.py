@@ -0,0 +1,30 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.utils import timezone
+
+from accounts.models import User
+from payments.models import ExpertPaymentMethod, ExpertPayout, PaymentIntent
+from tasks.models import Task
+
+
+def make_user(username, **fields):
+    return User.objects.create_user(username=username, email=f'{username}@example.com', password='x', **fields)
+
+
+def make_intent(client, expert, amount='100.00', **fields):
+    task = Task.objects.create(
+        title='Task', description='d', category='ai_ml', complexity='simple', budget_range='100_500',
+        deadline=timezone.now() + timedelta(days=7), client=client, assigned_expert=expert,
+    )
+    fields.setdefault('payment_method', 'paypal')
+    return PaymentIntent.objects.create(task=task, client=client, amount=Decimal(amount), **fields)
+
+
+def make_payout(expert, intent, amount='90.00', **fields):
+    fields.setdefault('payout_method', 'mpesa')
+    return ExpertPayout.objects.create(expert=expert, payment_intent=intent, amount=Decimal(amount), **fields)
+
+
+def add_method(expert, method_type, **fields):
+    return ExpertPaymentMethod.objects.create(expert=expert, method_type=method_type, is_primary=True, **fields)
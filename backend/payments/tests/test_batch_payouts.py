@@ -0,0 +1,169 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from payments.batch_payouts import (
+    BatchItemResult, FakeBatchGateway, apply_results, claim_pending_payouts, run_batch_payouts,
+)
+from payments.models import ExpertPayout
+from payments.tasks import payout_create_quote, resume_stalled_payouts
+
+from .helpers import add_method, make_intent, make_payout, make_user
+
+
+class StalledBatchPayoutTests(TestCase):
+    """Batch payouts never fall into the M-PESA step pipeline"""
+
+    def setUp(self):
+        self.client_user = make_user('client')
+        self.expert = make_user('expert', phone_number='+254700000000')
+        add_method(self.expert, 'paypal', paypal_email='expert@example.com')
+
+    @mock.patch('payments.tasks.dispatch_payout')
+    def test_sweeper_skips_claimed_batch_payouts(self, dispatch):
+        payout = make_payout(self.expert, make_intent(self.client_user, self.expert), payout_method='paypal')
+
+        class PendingGateway(FakeBatchGateway):
+            def submit(self, items, currency, batch_id):
+                results = super().submit(items, currency, batch_id)
+                for result in results:
+                    result.status = 'processing'  # accepted, not settled yet
+                return results
+
+        run_batch_payouts(gateways={'paypal': PendingGateway('paypal')})
+        ExpertPayout.objects.filter(pk=payout.pk).update(step_updated_at=timezone.now() - timedelta(days=1))
+
+        self.assertEqual(resume_stalled_payouts(), 0)
+        dispatch.assert_not_called()
+        payout.refresh_from_db()
+        self.assertEqual((payout.status, payout.step), ('processing', 'batch'))
+
+    @mock.patch('payments.tasks.WiseService')
+    def test_pipeline_refuses_non_mpesa_payouts(self, wise):
+        payout = make_payout(self.expert, make_intent(self.client_user, self.expert), payout_method='paypal',
+                             status='processing')
+        payout_create_quote.apply(args=[payout.pk])
+
+        wise.assert_not_called()
+        payout.refresh_from_db()
+        self.assertEqual(payout.step, 'quote')
+
+
+class BatchPayoutRunTests(TestCase):
+    """Claiming, submitting and resubmitting batches against ``FakeBatchGateway``"""
+
+    def setUp(self):
+        self.client_user = make_user('client')
+        self.gateway = FakeBatchGateway('paypal')
+
+    def expert_payout(self, username, email=None, **fields):
+        expert = make_user(username)
+        add_method(expert, 'paypal', paypal_email=email or f'{username}@example.com')
+        fields.setdefault('payout_method', 'paypal')
+        return make_payout(expert, make_intent(self.client_user, expert), **fields)
+
+    def run_batches(self, **kwargs):
+        return run_batch_payouts(gateways={'paypal': self.gateway}, **kwargs)
+
+    def age(self, *payouts):
+        ExpertPayout.objects.filter(pk__in=[p.pk for p in payouts]).update(
+            step_updated_at=timezone.now() - timedelta(days=1)
+        )
+
+    def test_claim_takes_pending_batchable_payouts_once(self):
+        paypal = self.expert_payout('alice')
+        mpesa = self.expert_payout('bob', payout_method='mpesa')
+
+        self.assertEqual([p.pk for p in claim_pending_payouts()], [paypal.pk])
+        self.assertEqual(claim_pending_payouts(), [])
+        paypal.refresh_from_db()
+        mpesa.refresh_from_db()
+        self.assertEqual((paypal.status, paypal.step), ('processing', 'batch'))
+        self.assertEqual(mpesa.status, 'pending')
+
+    def test_submit_completes_payouts(self):
+        payouts = [self.expert_payout(name) for name in ('alice', 'bob')]
+
+        summary = self.run_batches()
+
+        self.assertEqual((summary['payouts'], summary['batches']), (2, 1))
+        self.assertEqual(summary['statuses'], {'completed': 2})
+        (provider_id, currency, ids), = self.gateway.batches
+        self.assertEqual((currency, sorted(ids)), ('USD', [p.pk for p in payouts]))
+        batch_ids = set()
+        for payout in payouts:
+            payout.refresh_from_db()
+            self.assertEqual(payout.status, 'completed')
+            self.assertTrue(payout.payout_reference.startswith(provider_id))
+            self.assertIsNotNone(payout.processed_at)
+            batch_ids.add(payout.batch_id)
+        self.assertEqual(len(batch_ids), 1)
+        self.assertTrue(batch_ids.pop())
+
+    def test_mixed_results_are_recorded_per_payout(self):
+        paid = self.expert_payout('alice')
+        rejected = self.expert_payout('bob', email='bob@example.invalid')
+        pending = self.expert_payout('carol')
+
+        class MixedGateway(FakeBatchGateway):
+            def submit(self, items, currency, batch_id):
+                results = super().submit(items, currency, batch_id)
+                for result in results:
+                    if result.payout_id == pending.pk:
+                        result.status = 'processing'
+                return results
+
+        self.gateway = MixedGateway('paypal')
+        summary = self.run_batches()
+
+        self.assertEqual(summary['statuses'], {'completed': 1, 'failed': 1, 'processing': 1})
+        for payout, status in ((paid, 'completed'), (rejected, 'failed'), (pending, 'processing')):
+            payout.refresh_from_db()
+            self.assertEqual(payout.status, status)
+        self.assertEqual(rejected.failure_reason, 'Receiver rejected')
+        self.assertIsNone(pending.processed_at)
+        self.assertEqual(self.run_batches()['payouts'], 0)
+
+    def test_resubmits_a_crashed_batch_under_the_same_id(self):
+        payouts = [self.expert_payout(name) for name in ('alice', 'bob')]
+
+        with mock.patch('payments.batch_payouts.apply_results', side_effect=RuntimeError('worker died')):
+            with self.assertRaises(RuntimeError):
+                self.run_batches()
+        self.assertEqual(len(self.gateway.batches), 1)
+        batch_ids = set(ExpertPayout.objects.filter(pk__in=[p.pk for p in payouts]).values_list('batch_id', flat=True))
+        self.assertEqual(len(batch_ids), 1)
+
+        self.assertEqual(self.run_batches()['payouts'], 0)  # not stalled yet
+        self.age(*payouts)
+        summary = self.run_batches()
+
+        self.assertEqual(summary['statuses'], {'completed': 2})
+        self.assertEqual(len(self.gateway.batches), 1)
+        self.assertEqual(set(self.gateway.submitted), batch_ids)
+        for payout in payouts:
+            payout.refresh_from_db()
+            self.assertEqual((payout.status, payout.batch_id), ('completed', *batch_ids))
+
+    def test_batch_id_depends_only_on_the_payouts(self):
+        first = [self.expert_payout(name) for name in ('alice', 'bob')]
+        self.run_batches(limit=2)
+        second = [self.expert_payout(name) for name in ('carol', 'dave')]
+        self.run_batches()
+
+        first_ids = set(ExpertPayout.objects.filter(pk__in=[p.pk for p in first]).values_list('batch_id', flat=True))
+        second_ids = set(ExpertPayout.objects.filter(pk__in=[p.pk for p in second]).values_list('batch_id', flat=True))
+        self.assertEqual(len(first_ids | second_ids), 2)
+        self.assertEqual(len(self.gateway.batches), 2)
+
+    def test_recorded_batches_are_not_reclaimed(self):
+        payout = self.expert_payout('alice')
+        claim_pending_payouts()
+        payout.refresh_from_db()
+        apply_results({payout.pk: payout}, [BatchItemResult(payout.pk, 'processing', response={'batch_id': 'B-1'})])
+        self.age(payout)
+
+        self.assertEqual(self.run_batches()['payouts'], 0)
+        self.assertEqual(self.gateway.batches, [])
@@ -0,0 +1,88 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+
+from payments import fx
+
+
+class FxRateTests(TestCase):
+    """Display rates: stale-while-revalidate reads and batch conversion"""
+
+    def setUp(self):
+        cache.clear()
+        fx._rates.clear()
+        self.addCleanup(fx._rates.clear)
+        queue = mock.patch('payments.tasks.refresh_fx_rates.delay')
+        self.refreshes = queue.start()
+        self.addCleanup(queue.stop)
+
+    def store(self, source, target, rate, age=timedelta()):
+        fx.store_rates([(source, target, Decimal(rate))], fetched_at=timezone.now() - age)
+
+    def test_fresh_rate_is_served_without_refreshing(self):
+        self.store('USD', 'KES', '129.50')
+        self.assertEqual(fx.get_rate('usd', 'kes'), Decimal('129.50'))
+        self.refreshes.assert_not_called()
+
+    def test_stale_rate_is_served_and_refreshed_once(self):
+        self.store('USD', 'KES', '129.50', age=timedelta(hours=2))
+
+        rates = [fx.get_rate('USD', 'KES') for _ in range(3)]
+        fx._rates.clear()  # another worker process, same shared cache
+        rates.append(fx.get_rate('USD', 'KES'))
+
+        self.assertEqual(rates, [Decimal('129.50')] * 4)
+        self.refreshes.assert_called_once_with([['USD', 'KES']])
+
+    def test_refresh_replaces_the_stale_rate(self):
+        self.store('USD', 'KES', '129.50', age=timedelta(hours=2))
+        fx.get_rate('USD', 'KES')
+        (pairs,), _ = self.refreshes.call_args
+
+        with mock.patch('payments.services.wise_service.WiseService') as wise:
+            wise.return_value.get_rates.return_value = [{'source': 'USD', 'target': 'KES', 'rate': 131.25}]
+            self.assertEqual(fx.refresh_rates([tuple(pair) for pair in pairs]), 1)
+        wise.return_value.get_rates.assert_called_once_with('USD', 'KES')
+
+        self.assertEqual(fx.get_rate('USD', 'KES'), Decimal('131.25'))
+        self.refreshes.assert_called_once()
+
+    def test_expired_rate_is_not_shown(self):
+        self.store('USD', 'KES', '129.50', age=timedelta(days=2))
+        with self.assertRaises(fx.RateUnavailable):
+            fx.get_rate('USD', 'KES')
+        self.refreshes.assert_called_once_with([['USD', 'KES']])
+
+    def test_rate_is_read_from_the_table_when_the_caches_are_cold(self):
+        self.store('EUR', 'KES', '140.10')
+        cache.clear()
+        fx._rates.clear()
+        self.assertEqual(fx.get_rate('EUR', 'KES'), Decimal('140.10'))
+
+    def test_convert_many_handles_mixed_pairs(self):
+        self.store('USD', 'KES', '129.50')
+        self.store('KES', 'USD', '0.0077', age=timedelta(hours=2))
+        items = [
+            (100, 'USD', 'KES'),
+            ('1000', 'KES', 'USD'),
+            (Decimal('2.333'), 'usd', 'kes'),
+            (10, 'EUR', 'KES'),  # configured, but no rate yet
+            (5, 'USD', 'USD'),
+            (1, 'USD', 'JPY'),  # not a configured pair
+        ]
+
+        with mock.patch('payments.fx.get_rate', wraps=fx.get_rate) as get_rate:
+            converted = fx.convert_many(items)
+
+        self.assertEqual(converted, [
+            Decimal('12950.00'), Decimal('7.70'), Decimal('302.12'), None, Decimal('5.00'), None,
+        ])
+        self.assertEqual(get_rate.call_count, 5)  # USD/KES is looked up once
+        self.assertEqual(
+            sorted(call.args[0] for call in self.refreshes.call_args_list),
+            [[['EUR', 'KES']], [['KES', 'USD']]],
+        )
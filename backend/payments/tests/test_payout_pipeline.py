@@ -0,0 +1,104 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from payments.models import ExpertPayout
+from payments.tasks import (
+    payout_create_quote, payout_create_transfer, payout_fund_transfer, payout_mpesa_b2c, resume_stalled_payouts,
+)
+
+from .helpers import make_intent, make_payout, make_user
+
+
+@mock.patch('payments.tasks.dispatch_payout')
+@mock.patch('payments.tasks.MPESAService')
+@mock.patch('payments.tasks.WiseService')
+class PayoutPipelineTests(TestCase):
+    """The M-PESA payout pipeline: one persisted step per task, resumable after a crash"""
+
+    def setUp(self):
+        client = make_user('client')
+        expert = make_user('expert', phone_number='+254700000000', first_name='Ex', last_name='Pert')
+        self.intent = make_intent(client, expert, status='processing')
+        self.payout = make_payout(expert, self.intent)
+
+    def configure(self, wise, mpesa, transfer_status='incoming_payment_waiting', response_code='0'):
+        wise.return_value.create_quote.return_value = {'id': 'Q1', 'targetAmount': 11610.5}
+        wise.return_value.create_transfer.return_value = {'id': 77}
+        wise.return_value.get_transfer_status.return_value = {'status': transfer_status}
+        wise.return_value.fund_transfer.return_value = {'status': 'COMPLETED'}
+        mpesa.return_value.initiate_b2c_payment.return_value = {
+            'ResponseCode': response_code, 'ConversationID': 'AG_1', 'ResponseDescription': 'Rejected',
+        }
+
+    def refresh(self):
+        self.payout.refresh_from_db()
+        self.intent.refresh_from_db()
+        return self.payout
+
+    def test_steps_advance_in_order(self, wise, mpesa, dispatch):
+        self.configure(wise, mpesa)
+        for task, next_step in [
+            (payout_create_quote, 'create_transfer'),
+            (payout_create_transfer, 'fund_transfer'),
+            (payout_fund_transfer, 'mpesa_b2c'),
+            (payout_mpesa_b2c, 'done'),
+        ]:
+            task.apply(args=[self.payout.pk])
+            self.assertEqual(self.refresh().step, next_step)
+            dispatch.assert_called_with(self.payout.pk, next_step)
+
+        payout = self.refresh()
+        self.assertEqual((payout.wise_quote_id, payout.wise_transfer_id, payout.currency), ('Q1', '77', 'KES'))
+        self.assertEqual(payout.mpesa_conversation_id, 'AG_1')
+        self.assertEqual(set(payout.gateway_response), {'quote', 'create_transfer', 'fund_transfer', 'mpesa_b2c'})
+        # Accepted by M-PESA is not paid; the result callback completes both
+        self.assertEqual((payout.status, self.intent.status), ('processing', 'processing'))
+        wise.return_value.create_transfer.assert_called_once_with(
+            'Q1', 'Ex Pert', '+254700000000', customer_transaction_id=payout.idempotency_key,
+        )
+        mpesa.return_value.initiate_b2c_payment.assert_called_once_with(
+            '+254700000000', 11610, mock.ANY, originator_conversation_id=payout.idempotency_key,
+        )
+
+    def test_repeated_delivery_of_a_step_changes_nothing(self, wise, mpesa, dispatch):
+        self.configure(wise, mpesa)
+        payout_create_quote.apply(args=[self.payout.pk])
+        payout_create_quote.apply(args=[self.payout.pk])
+
+        wise.return_value.create_quote.assert_called_once()
+        self.assertEqual(self.refresh().step, 'create_transfer')
+        self.assertEqual(dispatch.call_count, 1)
+
+    def test_resumes_a_stalled_step_without_funding_twice(self, wise, mpesa, dispatch):
+        # The worker died after Wise funded the transfer but before the step advanced
+        self.configure(wise, mpesa, transfer_status='processing')
+        ExpertPayout.objects.filter(pk=self.payout.pk).update(
+            step='fund_transfer', status='processing', wise_transfer_id='77',
+            step_updated_at=timezone.now() - timedelta(days=1),
+        )
+
+        self.assertEqual(resume_stalled_payouts(), 1)
+        dispatch.assert_called_once_with(self.payout.pk, 'fund_transfer')
+
+        payout_fund_transfer.apply(args=[self.payout.pk])
+        wise.return_value.fund_transfer.assert_not_called()
+        self.assertEqual(self.refresh().step, 'mpesa_b2c')
+
+    def test_recent_steps_are_not_resumed(self, wise, mpesa, dispatch):
+        ExpertPayout.objects.filter(pk=self.payout.pk).update(step='fund_transfer', status='processing')
+        self.assertEqual(resume_stalled_payouts(), 0)
+        dispatch.assert_not_called()
+
+    def test_rejected_b2c_fails_payout_and_intent(self, wise, mpesa, dispatch):
+        self.configure(wise, mpesa, response_code='1')
+        ExpertPayout.objects.filter(pk=self.payout.pk).update(step='mpesa_b2c', status='processing')
+
+        payout_mpesa_b2c.apply(args=[self.payout.pk])
+
+        payout = self.refresh()
+        self.assertEqual((payout.step, payout.status, self.intent.status), ('mpesa_b2c', 'failed', 'failed'))
+        self.assertIn('Rejected', payout.failure_reason)
+        dispatch.assert_not_called()
@@ -0,0 +1,197 @@
+import base64
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from unittest import mock
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.x509.oid import NameOID
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from payments.models import PaymentIntent, PaymentStatusLog, WebhookEvent
+from payments.webhooks import process_events
+
+from .helpers import make_intent, make_payout, make_user
+
+FIXTURES = Path(__file__).parent / 'fixtures' / 'webhooks'
+CERT_URL = 'https://api.sandbox.paypal.com/v1/notifications/certs/CERT-360caa42-fca2a594-1d93a270'
+MPESA_TOKEN = 'callback-secret'
+ORIGINATOR_ID = uuid.UUID('7c1c5e34-3f4b-4c55-9f43-1b0f4cf0a7d2')
+
+
+def fixture(name):
+    return (FIXTURES / f'{name}.json').read_bytes()
+
+
+def signing_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def sign(key, message):
+    return base64.b64encode(key.sign(message, padding.PKCS1v15(), hashes.SHA256())).decode()
+
+
+def certificate_pem(key):
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'messageverificationcerts.paypal.com')])
+    now = datetime.now(dt_timezone.utc)
+    certificate = x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(
+        key.public_key()
+    ).serial_number(x509.random_serial_number()).not_valid_before(now).not_valid_after(
+        now + timedelta(days=1)
+    ).sign(key, hashes.SHA256())
+    return certificate.public_bytes(serialization.Encoding.PEM)
+
+
+@override_settings(PAYPAL_WEBHOOK_ID='8PT597110X687430LKGECATA', MPESA_CALLBACK_TOKEN=MPESA_TOKEN)
+class WebhookTests(TestCase):
+    """Recorded gateway callbacks through the webhook endpoints and ``process_events``"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.paypal_key, cls.wise_key, cls.forged_key = signing_key(), signing_key(), signing_key()
+        cls.paypal_cert = certificate_pem(cls.paypal_key)
+        cls.wise_public_key = cls.wise_key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        ).decode()
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.client_user = make_user('client')
+        self.expert = make_user('expert', phone_number='+254700000000')
+        queue = mock.patch('payments.tasks.process_webhook_events.delay')
+        self.queued = queue.start()
+        self.addCleanup(queue.stop)
+        certificate = mock.patch('payments.webhooks.requests.get')
+        self.certificate_get = certificate.start()
+        self.certificate_get.return_value.content = self.paypal_cert
+        self.addCleanup(certificate.stop)
+        wise_key = override_settings(WISE_WEBHOOK_PUBLIC_KEY=self.wise_public_key)
+        wise_key.enable()
+        self.addCleanup(wise_key.disable)
+
+    def post_paypal(self, body, key=None, cert_url=CERT_URL, signed_body=None):
+        transmission_id, transmission_time = 'b2384410-f8d2-11ee-8cd3-39a5e8dfb53b', '2024-03-12T09:41:09Z'
+        crc = zlib.crc32(body if signed_body is None else signed_body)
+        message = f'{transmission_id}|{transmission_time}|8PT597110X687430LKGECATA|{crc}'
+        return self.api.generic(
+            'POST', '/api/payments/webhooks/paypal/', body, content_type='application/json',
+            HTTP_PAYPAL_TRANSMISSION_ID=transmission_id,
+            HTTP_PAYPAL_TRANSMISSION_TIME=transmission_time,
+            HTTP_PAYPAL_CERT_URL=cert_url,
+            HTTP_PAYPAL_AUTH_ALGO='SHA256withRSA',
+            HTTP_PAYPAL_TRANSMISSION_SIG=sign(key or self.paypal_key, message.encode()),
+        )
+
+    def post_wise(self, body, key=None):
+        return self.api.generic(
+            'POST', '/api/payments/webhooks/wise/', body, content_type='application/json',
+            HTTP_X_DELIVERY_ID='2f4b2c1e-1f0e-4a35-9a0a-3c9f2b5a7e11',
+            HTTP_X_SIGNATURE_SHA256=sign(key or self.wise_key, body),
+        )
+
+    def post_mpesa(self, body, kind='result', token=MPESA_TOKEN):
+        return self.api.generic(
+            'POST', f'/api/payments/webhooks/mpesa/{kind}/{token}/', body, content_type='application/json'
+        )
+
+    def process(self):
+        return sum(process_events(key) for key in set(WebhookEvent.objects.values_list('ordering_key', flat=True)))
+
+    def mpesa_payout(self):
+        intent = make_intent(self.client_user, self.expert, status='processing', payment_method='mpesa')
+        return make_payout(self.expert, intent, status='processing', step='mpesa_b2c',
+                           idempotency_key=ORIGINATOR_ID)
+
+    def assert_rejected(self, response, error):
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': error})
+        self.assertFalse(WebhookEvent.objects.exists())
+        self.queued.assert_not_called()
+
+    def test_paypal_rejects_a_bad_signature(self):
+        self.assert_rejected(self.post_paypal(fixture('paypal_capture_completed'), key=self.forged_key),
+                             'Invalid PayPal signature')
+
+    def test_paypal_rejects_an_untrusted_certificate_url(self):
+        self.assert_rejected(self.post_paypal(fixture('paypal_capture_completed'), cert_url='https://evil.test/c'),
+                             'Untrusted PayPal certificate URL')
+        self.certificate_get.assert_not_called()
+
+    def test_paypal_rejects_a_tampered_body(self):
+        body = fixture('paypal_capture_completed')
+        self.assert_rejected(self.post_paypal(body.replace(b'100.00', b'1.00'), signed_body=body),
+                             'Invalid PayPal signature')
+
+    def test_wise_rejects_a_bad_signature(self):
+        self.assert_rejected(self.post_wise(fixture('wise_transfer_state_change'), key=self.forged_key),
+                             'Invalid Wise signature')
+
+    def test_mpesa_rejects_a_wrong_token(self):
+        self.assert_rejected(self.post_mpesa(fixture('mpesa_b2c_result_success'), token='guess'),
+                             'Invalid M-PESA callback token')
+
+    def test_duplicate_delivery_is_applied_once(self):
+        intent = make_intent(self.client_user, self.expert, paypal_order_id='5O190127TN364715T',
+                             status='processing')
+        body = fixture('paypal_capture_completed')
+
+        for _ in range(2):
+            self.assertEqual(self.post_paypal(body).status_code, 200)
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+        self.assertEqual(self.process(), 1)
+
+        self.assertEqual(self.post_paypal(body).status_code, 200)
+        self.assertEqual(self.process(), 0)
+        self.certificate_get.assert_called_once()
+
+        intent.refresh_from_db()
+        self.assertEqual((intent.status, intent.paypal_capture_id), ('completed', '42311647XV020574X'))
+        self.assertEqual(PaymentStatusLog.objects.filter(payment_intent=intent).count(), 1)
+        self.assertEqual(WebhookEvent.objects.get().status, 'processed')
+
+    def test_wise_transfer_completes_its_payout(self):
+        payout = make_payout(self.expert, make_intent(self.client_user, self.expert), payout_method='wise',
+                             status='processing', payout_reference='111')
+        self.assertEqual(self.post_wise(fixture('wise_transfer_state_change')).status_code, 200)
+        self.process()
+        payout.refresh_from_db()
+        self.assertEqual(payout.status, 'completed')
+
+    def test_mpesa_success_completes_payout_and_intent(self):
+        payout = self.mpesa_payout()
+        response = self.post_mpesa(fixture('mpesa_b2c_result_success'))
+        self.assertEqual(response.data, {'ResultCode': 0, 'ResultDesc': 'Accepted'})
+        self.queued.assert_called_once_with(f'mpesa:{ORIGINATOR_ID}')
+        self.assertEqual(self.process(), 1)
+
+        payout.refresh_from_db()
+        self.assertEqual(payout.status, 'completed')
+        self.assertIsNotNone(payout.processed_at)
+        self.assertEqual(PaymentIntent.objects.get(pk=payout.payment_intent_id).status, 'completed')
+
+    def test_mpesa_failure_fails_payout_and_intent(self):
+        payout = self.mpesa_payout()
+        self.assertEqual(self.post_mpesa(fixture('mpesa_b2c_result_failure')).status_code, 200)
+        self.process()
+
+        payout.refresh_from_db()
+        self.assertEqual((payout.status, payout.failure_reason), ('failed', 'The initiator information is invalid.'))
+        self.assertEqual(PaymentIntent.objects.get(pk=payout.payment_intent_id).status, 'failed')
+
+    def test_mpesa_duplicate_result_is_applied_once(self):
+        payout = self.mpesa_payout()
+        for _ in range(2):
+            self.assertEqual(self.post_mpesa(fixture('mpesa_b2c_result_success')).status_code, 200)
+        self.assertEqual(self.process(), 1)
+
+        payout.refresh_from_db()
+        self.assertEqual(payout.status, 'completed')
+        # One log row for the payout and one for its intent
+        self.assertEqual(PaymentStatusLog.objects.filter(payment_intent_id=payout.payment_intent_id).count(), 2)
@@ -11,9 +11,14 @@
 
 
 from django.urls import path
-from .views import create_paypal_order
+from .views import create_paypal_order, fx_convert, gateway_stats, mpesa_webhook, paypal_webhook, wise_webhook
 
 urlpatterns = [
     path('paypal/order/create/', create_paypal_order, name='create_paypal_order'),
+    path('gateway-stats/', gateway_stats, name='payment_gateway_stats'),
+    path('fx/convert/', fx_convert, name='fx_convert'),
+    path('webhooks/paypal/', paypal_webhook, name='paypal_webhook'),
+    path('webhooks/wise/', wise_webhook, name='wise_webhook'),
+    path('webhooks/mpesa/<str:kind>/<str:token>/', mpesa_webhook, name='mpesa_webhook'),
 ]
 
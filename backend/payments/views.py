@@ -1,5 +1,7 @@
+from decimal import Decimal, InvalidOperation
+
 from rest_framework import viewsets, status, permissions
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.decorators import action, api_view, authentication_classes, permission_classes
 from rest_framework.response import Response
 from django.db import transaction
 from .models import PaymentIntent, ExpertPayout, ExpertPaymentMethod
@@ -11,11 +13,18 @@ from .serializers import (
 from .services.wise_service import WiseService
 from .services.mpesa_service import MPESAService
 from .services.paypal_service import PayPalService
+from .services.http import gateway_metrics
+from . import fx
+from .tasks import run_batch_payouts
+from . import webhooks
 from rest_framework.permissions import IsAuthenticated
+from marketplace.idempotency import idempotency_token, idempotent
+from marketplace.pagination import PageNumberOrKeysetPagination
 
 class PaymentIntentViewSet(viewsets.ModelViewSet):
     serializer_class = PaymentIntentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PageNumberOrKeysetPagination
 
     def get_queryset(self):
         user = self.request.user
@@ -24,6 +33,7 @@ class PaymentIntentViewSet(viewsets.ModelViewSet):
         return PaymentIntent.objects.filter(client=user)
 
     @action(detail=True, methods=['post'])
+    @idempotent
     def create_paypal_order(self, request, pk=None):
         payment_intent = self.get_object()
         if payment_intent.status != 'pending':
@@ -42,7 +52,8 @@ class PaymentIntentViewSet(viewsets.ModelViewSet):
             paypal_service = PayPalService()
             order = paypal_service.create_order(
                 amount=payment_intent.amount,
-                currency=payment_intent.currency
+                currency=payment_intent.currency,
+                request_id=idempotency_token(request)
             )
             
             # Store PayPal order ID
@@ -84,6 +95,7 @@ class PaymentIntentViewSet(viewsets.ModelViewSet):
             )
 
     @action(detail=True, methods=['post'])
+    @idempotent
     def process_mpesa_payment(self, request, pk=None):
         payment_intent = self.get_object()
         phone_number = request.data.get('phone_number')
@@ -122,6 +134,7 @@ class PaymentIntentViewSet(viewsets.ModelViewSet):
             )
 
     @action(detail=True, methods=['post'])
+    @idempotent
     def process_wise_payment(self, request, pk=None):
         payment_intent = self.get_object()
         
@@ -197,6 +210,17 @@ class ExpertPayoutViewSet(viewsets.ReadOnlyModelViewSet):
             return ExpertPayout.objects.all()
         return ExpertPayout.objects.filter(expert=user)
 
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAdminUser])
+    def process_batch(self, request):
+        """Queue a batch payout run over every pending payout"""
+        try:
+            limit = int(request.data['limit']) if request.data.get('limit') else None
+        except (TypeError, ValueError):
+            return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        pending = ExpertPayout.objects.filter(status='pending').exclude(payout_method='mpesa').count()
+        result = run_batch_payouts.delay(limit=limit)
+        return Response({"task_id": result.id, "pending_payouts": pending}, status=status.HTTP_202_ACCEPTED)
+
     @action(detail=True, methods=['post'])
     def process_payout(self, request, pk=None):
         payout = self.get_object()
@@ -284,6 +308,7 @@ class ExpertPaymentMethodViewSet(viewsets.ModelViewSet):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def create_paypal_order(request):
     """API endpoint to create a PayPal order"""
     try:
@@ -293,8 +318,112 @@ def create_paypal_order(request):
             return Response({'error': 'Amount is required', 'success': False}, status=status.HTTP_400_BAD_REQUEST)
 
         paypal_service = PayPalService()
-        order = paypal_service.create_order(amount=amount, currency=currency)
+        order = paypal_service.create_order(amount=amount, currency=currency, request_id=idempotency_token(request))
         return Response({'order_id': order['id'], 'links': order.get('links', []), 'success': True}, status=status.HTTP_201_CREATED)
     except Exception as e:
         return Response({'error': str(e), 'success': False}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def gateway_stats(request):
+    """Call counts, errors and latency of this worker's payment gateway calls"""
+    return Response(gateway_metrics.stats())
+
+
+MAX_FX_ITEMS = 500
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([permissions.IsAuthenticated])
+def fx_convert(request):
+    """
+    Indicative conversion at the cached display rate. GET takes ``amount``,
+    ``source`` and ``target``; POST takes ``{"items": [{...}, ...]}`` of the
+    same. Pairs must be in ``FX_RATE_PAIRS``. Never calls Wise; amounts
+    without a current rate come back null.
+    """
+    items = [request.query_params] if request.method == 'GET' else request.data.get('items')
+    if not isinstance(items, list) or not items or len(items) > MAX_FX_ITEMS:
+        return Response(
+            {"error": f"items must be a list of 1 to {MAX_FX_ITEMS} conversions"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        parsed = [(Decimal(str(item['amount'])), str(item['source']), str(item['target'])) for item in items]
+        if not all(amount.is_finite() for amount, _, _ in parsed):
+            raise InvalidOperation
+    except (KeyError, TypeError, InvalidOperation):
+        return Response(
+            {"error": "Each conversion needs a numeric amount, a source and a target currency"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    unsupported = sorted({f'{s.upper()}/{t.upper()}' for _, s, t in parsed if not fx.is_supported(s, t)})
+    if unsupported:
+        return Response(
+            {"error": f"Unsupported currency pairs: {', '.join(unsupported[:10])}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    results = [
+        {
+            'amount': str(amount), 'source': source.upper(), 'target': target.upper(),
+            'converted': None if converted is None else str(converted),
+        }
+        for (amount, source, target), converted in zip(parsed, fx.convert_many(parsed))
+    ]
+    return Response(results[0] if request.method == 'GET' else {'results': results})
+
+
+def webhook_response(provider, request, verify, parse):
+    """Verify, store and acknowledge a gateway callback; processing happens in a worker"""
+    body = request.body
+    try:
+        verify()
+        payload = webhooks.load_payload(body)
+        event_id, event_type, ordering_key = parse(payload)
+        webhooks.ingest(provider, payload, event_id, event_type, ordering_key)
+    except webhooks.WebhookError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({"received": True})
+
+
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([permissions.AllowAny])
+def paypal_webhook(request):
+    """PayPal webhook events"""
+    return webhook_response(
+        'paypal', request,
+        lambda: webhooks.verify_paypal(request.headers, request.body),
+        lambda payload: webhooks.parse_paypal(payload, request.headers),
+    )
+
+
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([permissions.AllowAny])
+def wise_webhook(request):
+    """Wise webhook events"""
+    return webhook_response(
+        'wise', request,
+        lambda: webhooks.verify_wise(request.headers, request.body),
+        lambda payload: webhooks.parse_wise(payload, request.headers),
+    )
+
+
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([permissions.AllowAny])
+def mpesa_webhook(request, kind, token):
+    """M-PESA B2C ``result`` and ``timeout`` callbacks"""
+    if kind not in ('result', 'timeout'):
+        return Response({"error": "Unknown callback"}, status=status.HTTP_404_NOT_FOUND)
+    # Safaricom expects this acknowledgement body
+    response = webhook_response(
+        'mpesa', request,
+        lambda: webhooks.verify_mpesa(token),
+        lambda payload: webhooks.parse_mpesa(payload, kind),
+    )
+    if response.status_code == status.HTTP_200_OK:
+        response.data = {"ResultCode": 0, "ResultDesc": "Accepted"}
+    return response
@@ -0,0 +1,416 @@
+"""
+Payment gateway webhooks
+
+Receiving a callback does only constant-time work: check the signature (or
+the secret M-PESA callback token), insert one raw ``WebhookEvent`` row and
+queue its ordering key. The insert ignores conflicts on (provider,
+event_id), so a redelivered event is dropped right there.
+
+``process_events`` applies the pending events of one ordering key (one
+payment or payout) in arrival order. A per-key lock in the shared cache
+keeps two workers off the same key. The lock holds a random token, is
+extended before each batch and is only released by the worker whose token
+it still holds. The resulting PaymentIntent and
+ExpertPayout changes, their ``PaymentStatusLog`` rows and the event
+statuses are written in bulk in one short transaction. A status that is
+already set is not applied again, and a finished payment or payout never
+moves back to pending or processing. Keys whose task was lost or skipped
+are picked up by the periodic ``pending_ordering_keys`` sweep.
+"""
+import base64
+import json
+import logging
+import uuid
+import zlib
+from datetime import timedelta
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import requests
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+from .models import ExpertPayout, PaymentIntent, PaymentStatusLog, WebhookEvent
+
+logger = logging.getLogger(__name__)
+
+LOCK_PREFIX = 'payments:webhook_lock'
+CERT_CACHE_PREFIX = 'payments:paypal_cert'
+LOCK_TIMEOUT = 5 * 60
+TERMINAL_STATUSES = {'completed', 'failed', 'cancelled', 'refunded'}
+
+
+class WebhookError(Exception):
+    """The callback is not authentic or cannot be parsed"""
+
+
+# Verification
+
+def verify_paypal(headers, body: bytes):
+    """
+    Offline check of PayPal's transmission signature over
+    ``<transmission id>|<time>|<webhook id>|<crc32 of body>``
+    """
+    transmission_id = headers.get('PAYPAL-TRANSMISSION-ID')
+    transmission_time = headers.get('PAYPAL-TRANSMISSION-TIME')
+    cert_url = headers.get('PAYPAL-CERT-URL', '')
+    signature = headers.get('PAYPAL-TRANSMISSION-SIG')
+    if not (transmission_id and transmission_time and signature and settings.PAYPAL_WEBHOOK_ID):
+        raise WebhookError('Missing PayPal transmission headers')
+    url = urlparse(cert_url)
+    if url.scheme != 'https' or not (url.hostname or '').endswith('.paypal.com'):
+        raise WebhookError('Untrusted PayPal certificate URL')
+
+    message = f'{transmission_id}|{transmission_time}|{settings.PAYPAL_WEBHOOK_ID}|{zlib.crc32(body)}'
+    certificate = x509.load_pem_x509_certificate(paypal_certificate(cert_url))
+    try:
+        certificate.public_key().verify(
+            base64.b64decode(signature), message.encode(), padding.PKCS1v15(), hashes.SHA256()
+        )
+    except (InvalidSignature, ValueError):
+        raise WebhookError('Invalid PayPal signature')
+
+
+def paypal_certificate(cert_url: str) -> bytes:
+    """PayPal's signing certificate, cached so only the first callback fetches it"""
+    key = f'{CERT_CACHE_PREFIX}:{zlib.crc32(cert_url.encode())}'
+    pem = cache.get(key)
+    if pem is None:
+        response = requests.get(cert_url, timeout=settings.PAYMENT_GATEWAY_READ_TIMEOUT)
+        response.raise_for_status()
+        pem = response.content
+        cache.set(key, pem, timeout=24 * 60 * 60)
+    return pem
+
+
+def verify_wise(headers, body: bytes):
+    """RSA-SHA256 signature of the raw body in ``X-Signature-SHA256``"""
+    signature = headers.get('X-Signature-SHA256')
+    if not signature or not settings.WISE_WEBHOOK_PUBLIC_KEY:
+        raise WebhookError('Missing Wise signature')
+    public_key = serialization.load_pem_public_key(settings.WISE_WEBHOOK_PUBLIC_KEY.encode())
+    try:
+        public_key.verify(base64.b64decode(signature), body, padding.PKCS1v15(), hashes.SHA256())
+    except (InvalidSignature, ValueError):
+        raise WebhookError('Invalid Wise signature')
+
+
+def verify_mpesa(token: str):
+    if not settings.MPESA_CALLBACK_TOKEN or not constant_time_compare(token, settings.MPESA_CALLBACK_TOKEN):
+        raise WebhookError('Invalid M-PESA callback token')
+
+
+# Parsing: (event_id, event_type, ordering_key) without touching the database
+
+def parse_paypal(payload: Dict, headers) -> tuple:
+    resource = payload.get('resource') or {}
+    event_type = payload.get('event_type', '')
+    if event_type.startswith('PAYMENT.PAYOUTS-ITEM'):
+        key = f"paypal:payout:{resource.get('payout_item', {}).get('sender_item_id') or resource.get('payout_item_id')}"
+    else:
+        order_id = (resource.get('supplementary_data') or {}).get('related_ids', {}).get('order_id')
+        key = f"paypal:order:{order_id or resource.get('id')}"
+    return payload.get('id'), event_type, key
+
+
+def parse_wise(payload: Dict, headers) -> tuple:
+    resource = (payload.get('data') or {}).get('resource') or {}
+    event_id = headers.get('X-Delivery-Id') or (
+        f"{payload.get('subscription_id')}:{resource.get('id')}:{payload.get('sent_at')}"
+    )
+    return event_id, payload.get('event_type', ''), f"wise:transfer:{resource.get('id')}"
+
+
+def parse_mpesa(payload: Dict, kind: str) -> tuple:
+    result = payload.get('Result') or {}
+    originator_id = result.get('OriginatorConversationID')
+    event_id = f"{kind}:{result.get('ConversationID') or originator_id}"
+    return event_id, f'b2c.{kind}', f'mpesa:{originator_id}'
+
+
+def ingest(provider: str, payload: Dict, event_id: str, event_type: str, ordering_key: str) -> str:
+    """Store the event (a no-op for duplicates) and queue its key"""
+    if not event_id:
+        raise WebhookError('Event has no id')
+    WebhookEvent.objects.bulk_create([WebhookEvent(
+        provider=provider,
+        event_id=str(event_id)[:255],
+        event_type=event_type[:100],
+        ordering_key=ordering_key[:255],
+        payload=payload,
+    )], ignore_conflicts=True)
+
+    from .tasks import process_webhook_events
+    try:
+        process_webhook_events.delay(ordering_key[:255])
+    except Exception as e:
+        # The sweep will pick the event up; never fail the callback for this
+        logger.warning(f"Could not queue webhook key {ordering_key}: {str(e)}")
+    return ordering_key
+
+
+def load_payload(body: bytes) -> Dict:
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise WebhookError('Body is not JSON')
+    if not isinstance(payload, dict):
+        raise WebhookError('Body is not a JSON object')
+    return payload
+
+
+def as_uuid(value) -> Optional[uuid.UUID]:
+    """``value`` as a UUID, or None when the gateway sent something else"""
+    try:
+        return uuid.UUID(str(value))
+    except (TypeError, ValueError):
+        return None
+
+
+# Processing
+
+class EventApplier:
+    """Collects the state changes of a run of events so they can be saved in bulk"""
+
+    def __init__(self):
+        self._objects = {}
+        self.intents = {}
+        self.payouts = {}
+        self.logs = []
+
+    def get(self, model, **lookup):
+        key = (model, tuple(sorted(lookup.items())))
+        if key not in self._objects:
+            obj = model.objects.filter(**lookup).first()
+            if obj is not None:
+                # One instance per row, whichever field it was found by
+                obj = self._objects.setdefault((model, obj.pk), obj)
+            self._objects[key] = obj
+        return self._objects[key]
+
+    def _moves(self, current: str, new_status: str) -> bool:
+        if current == new_status:
+            return False
+        if current in TERMINAL_STATUSES and new_status not in TERMINAL_STATUSES:
+            return False
+        return current != 'refunded'
+
+    def set_intent(self, intent: Optional[PaymentIntent], new_status: str, event: WebhookEvent, **fields):
+        if intent is None:
+            return False
+        for name, value in fields.items():
+            setattr(intent, name, value)
+        if fields:
+            self.intents[intent.pk] = intent
+        if not self._moves(intent.status, new_status):
+            return bool(fields)
+        self.logs.append(PaymentStatusLog(
+            payment_intent_id=intent.pk, previous_status=intent.status, new_status=new_status,
+            notes=f'{event.provider} {event.event_type} {event.event_id}',
+        ))
+        intent.status = new_status
+        if new_status == 'completed':
+            intent.completed_at = timezone.now()
+        self.intents[intent.pk] = intent
+        return True
+
+    def set_payout(self, payout: Optional[ExpertPayout], new_status: str, event: WebhookEvent,
+                   failure_reason: str = ''):
+        if payout is None:
+            return False
+        payout.gateway_response = {**payout.gateway_response, f'webhook:{event.event_type}': event.payload}
+        self.payouts[payout.pk] = payout
+        if not self._moves(payout.status, new_status):
+            return True
+        self.logs.append(PaymentStatusLog(
+            payment_intent_id=payout.payment_intent_id, previous_status=payout.status, new_status=new_status,
+            notes=f'Expert payout {payout.pk}: {event.provider} {event.event_type} {event.event_id}',
+        ))
+        payout.status = new_status
+        if new_status == 'completed':
+            payout.processed_at = timezone.now()
+        if failure_reason:
+            payout.failure_reason = failure_reason
+        return True
+
+    def save(self):
+        now = timezone.now()
+        for obj in list(self.intents.values()) + list(self.payouts.values()):
+            obj.updated_at = now
+        if self.intents:
+            PaymentIntent.objects.bulk_update(
+                self.intents.values(), ['status', 'completed_at', 'paypal_capture_id', 'updated_at']
+            )
+        if self.payouts:
+            ExpertPayout.objects.bulk_update(
+                self.payouts.values(),
+                ['status', 'processed_at', 'failure_reason', 'gateway_response', 'updated_at']
+            )
+        PaymentStatusLog.objects.bulk_create(self.logs)
+
+
+PAYPAL_INTENT_STATUS = {
+    'PAYMENT.CAPTURE.COMPLETED': 'completed',
+    'PAYMENT.CAPTURE.DENIED': 'failed',
+    'PAYMENT.CAPTURE.DECLINED': 'failed',
+    'PAYMENT.CAPTURE.REFUNDED': 'refunded',
+    'PAYMENT.CAPTURE.REVERSED': 'refunded',
+    'CHECKOUT.ORDER.APPROVED': 'processing',
+}
+PAYPAL_PAYOUT_STATUS = {
+    'PAYMENT.PAYOUTS-ITEM.SUCCEEDED': 'completed',
+    'PAYMENT.PAYOUTS-ITEM.FAILED': 'failed',
+    'PAYMENT.PAYOUTS-ITEM.BLOCKED': 'failed',
+    'PAYMENT.PAYOUTS-ITEM.DENIED': 'failed',
+    'PAYMENT.PAYOUTS-ITEM.RETURNED': 'failed',
+    'PAYMENT.PAYOUTS-ITEM.REFUNDED': 'failed',
+    'PAYMENT.PAYOUTS-ITEM.CANCELED': 'failed',
+}
+WISE_TRANSFER_STATUS = {
+    'processing': 'processing',
+    'funds_converted': 'processing',
+    'outgoing_payment_sent': 'completed',
+    'cancelled': 'failed',
+    'funds_refunded': 'failed',
+    'bounced_back': 'failed',
+    'charged_back': 'failed',
+}
+
+
+def apply_paypal(applier: EventApplier, event: WebhookEvent) -> bool:
+    resource = event.payload.get('resource') or {}
+    if event.event_type in PAYPAL_PAYOUT_STATUS:
+        sender_item_id = as_uuid((resource.get('payout_item') or {}).get('sender_item_id'))
+        payout = applier.get(ExpertPayout, idempotency_key=sender_item_id) if sender_item_id else None
+        errors = resource.get('errors') or {}
+        return applier.set_payout(payout, PAYPAL_PAYOUT_STATUS[event.event_type], event, errors.get('message', ''))
+
+    new_status = PAYPAL_INTENT_STATUS.get(event.event_type)
+    if new_status is None:
+        return False
+    if event.event_type.startswith('CHECKOUT.ORDER'):
+        intent = applier.get(PaymentIntent, paypal_order_id=resource.get('id'))
+        return applier.set_intent(intent, new_status, event)
+    order_id = (resource.get('supplementary_data') or {}).get('related_ids', {}).get('order_id')
+    if order_id:
+        intent = applier.get(PaymentIntent, paypal_order_id=order_id)
+    else:
+        intent = applier.get(PaymentIntent, paypal_capture_id=resource.get('id'))
+    fields = {}
+    if intent is not None and new_status == 'completed' and not intent.paypal_capture_id:
+        fields['paypal_capture_id'] = resource.get('id')
+    return applier.set_intent(intent, new_status, event, **fields)
+
+
+def apply_wise(applier: EventApplier, event: WebhookEvent) -> bool:
+    data = event.payload.get('data') or {}
+    transfer_id = str((data.get('resource') or {}).get('id') or '')
+    new_status = WISE_TRANSFER_STATUS.get(data.get('current_state'))
+    if not transfer_id or new_status is None:
+        return False
+    payout = applier.get(ExpertPayout, wise_transfer_id=transfer_id) or applier.get(
+        ExpertPayout, payout_reference=transfer_id
+    )
+    if payout is not None:
+        # The M-PESA leg still has to run after Wise settles a pipeline payout
+        if payout.payout_method == 'mpesa' and new_status == 'completed':
+            new_status = payout.status
+        return applier.set_payout(payout, new_status, event, f"Wise transfer {data.get('current_state')}")
+    intent = applier.get(PaymentIntent, wise_transfer_id=transfer_id)
+    return applier.set_intent(intent, new_status, event)
+
+
+def apply_mpesa(applier: EventApplier, event: WebhookEvent) -> bool:
+    result = event.payload.get('Result') or {}
+    originator_id = as_uuid(result.get('OriginatorConversationID'))
+    payout = applier.get(ExpertPayout, idempotency_key=originator_id) if originator_id else None
+    if payout is None and result.get('ConversationID'):
+        payout = applier.get(ExpertPayout, mpesa_conversation_id=result['ConversationID'])
+    if payout is None:
+        return False
+    # The B2C step leaves the payout and its intent processing until this result arrives
+    if event.event_type == 'b2c.timeout':
+        new_status, reason = 'failed', 'M-PESA request timed out in the queue'
+    elif str(result.get('ResultCode')) == '0':
+        new_status, reason = 'completed', ''
+    else:
+        new_status, reason = 'failed', result.get('ResultDesc', 'M-PESA payment failed')
+    applier.set_intent(applier.get(PaymentIntent, pk=payout.payment_intent_id), new_status, event)
+    return applier.set_payout(payout, new_status, event, reason)
+
+
+APPLIERS = {
+    'paypal': apply_paypal,
+    'wise': apply_wise,
+    'mpesa': apply_mpesa,
+}
+
+
+def lock_key(ordering_key: str) -> str:
+    return f'{LOCK_PREFIX}:{zlib.crc32(ordering_key.encode())}:{ordering_key[:150]}'
+
+
+def holds_lock(lock: str, token: str) -> bool:
+    """Whether ``token`` still holds ``lock``; extends it when it does"""
+    return cache.get(lock) == token and cache.touch(lock, LOCK_TIMEOUT)
+
+
+def release_lock(lock: str, token: str):
+    """Delete ``lock`` unless it expired and another worker took it"""
+    if cache.get(lock) == token:
+        cache.delete(lock)
+
+
+def process_events(ordering_key: str) -> int:
+    """
+    Apply the pending events of one ordering key in arrival order.
+
+    Returns the number of events handled, or 0 when another worker holds
+    the key.
+    """
+    lock = lock_key(ordering_key)
+    token = uuid.uuid4().hex
+    if not cache.add(lock, token, timeout=LOCK_TIMEOUT):
+        return 0
+    handled = 0
+    try:
+        while True:
+            if not holds_lock(lock, token):
+                logger.warning(f"Lost the webhook lock for {ordering_key} after {handled} events")
+                return handled
+            events = list(WebhookEvent.objects.filter(
+                ordering_key=ordering_key, status='pending'
+            ).order_by('id')[:settings.WEBHOOK_BATCH_SIZE])
+            if not events:
+                return handled
+            applier = EventApplier()
+            now = timezone.now()
+            for event in events:
+                try:
+                    applied = APPLIERS[event.provider](applier, event)
+                    event.status = 'processed' if applied else 'ignored'
+                except Exception as e:
+                    logger.exception(f"Webhook event {event.pk} failed")
+                    event.status, event.error = 'failed', str(e)
+                event.processed_at = now
+            with transaction.atomic():
+                applier.save()
+                WebhookEvent.objects.bulk_update(events, ['status', 'error', 'processed_at'])
+            handled += len(events)
+    finally:
+        release_lock(lock, token)
+
+
+def pending_ordering_keys(older_than: int = 0, limit: int = 1000) -> List[str]:
+    """Keys with events still pending after ``older_than`` seconds"""
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    return list(WebhookEvent.objects.filter(
+        status='pending', received_at__lte=cutoff
+    ).order_by().values_list('ordering_key', flat=True).distinct()[:limit])
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class RealtimeConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'realtime'
+    verbose_name = 'Real-time Delivery'
+
+    def ready(self):
+        # Import signals
+        from . import signals  # noqa: F401
@@ -0,0 +1,131 @@
+"""
+WebSocket consumer pushing a user's events
+
+Connect to ``/ws/events/?token=<JWT access token>``. Add ``&cursor=<id>``
+to resume after the last event id the client saw. Frames are JSON.
+
+Server to client:
+
+- ``{"type": "event", "id": <id>, "kind": ..., "data": {...}}``. The
+  kind is ``message``, ``task_message``, ``notification`` or
+  ``task_status``. Ids mostly increase, but an event whose transaction
+  committed late can arrive after a higher id. Delivery is at least once,
+  so skip ids already handled.
+- ``{"type": "ready", "cursor": <id>}``: the replay is done (``cursor``
+  is the highest id sent), and live
+  events follow. A new session (no cursor) should load its state over
+  REST after this.
+- ``{"type": "resync", "cursor": <id>}``: events were missed that cannot
+  be replayed. Reload over REST and continue from this cursor.
+- ``{"type": "pong"}``.
+
+Client to server:
+
+- ``{"type": "ack", "cursor": <id>}``: every event received with an id
+  up to ``id`` has been handled.
+- ``{"type": "ping"}``.
+
+Backpressure: at most ``REALTIME_MAX_UNACKED`` events are in flight per
+connection. Beyond that, live events are not sent. Once acks bring the
+window below half, the client is caught up from the event log in order
+(see realtime.events). A slow tab therefore costs bounded memory, and it
+does not miss events.
+"""
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
+
+from .events import events_after, latest_cursor, user_group
+
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_BAD_REQUEST = 4400
+SEEN_WINDOW = 1000  # ids remembered per connection to drop repeats
+
+
+class UserEventsConsumer(AsyncJsonWebsocketConsumer):
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=CLOSE_UNAUTHORIZED)
+            return
+        params = parse_qs(self.scope.get('query_string', b'').decode())
+        cursor = (params.get('cursor') or [None])[0]
+        if cursor is not None and not cursor.isdigit():
+            await self.close(code=CLOSE_BAD_REQUEST)
+            return
+
+        self.user_id = user.pk
+        self.group = user_group(user.pk)
+        self.unacked = set()
+        self.seen = OrderedDict()
+        self.paused = False
+        # Join before reading the log so nothing published in between is lost
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        await self.accept()
+
+        if cursor is None:
+            self.cursor = await database_sync_to_async(latest_cursor)(self.user_id)
+            await self.send_json({'type': 'ready', 'cursor': self.cursor})
+        else:
+            self.cursor = int(cursor)
+            await self.catch_up()
+
+    async def disconnect(self, code):
+        if hasattr(self, 'group'):
+            await self.channel_layer.group_discard(self.group, self.channel_name)
+
+    @property
+    def window(self) -> int:
+        return settings.REALTIME_MAX_UNACKED - len(self.unacked)
+
+    async def catch_up(self):
+        """Replay the log after ``self.cursor`` as far as the window allows"""
+        events = await database_sync_to_async(events_after)(self.user_id, self.cursor)
+        if events is None:
+            self.cursor = await database_sync_to_async(latest_cursor)(self.user_id)
+            self.unacked.clear()
+            self.paused = False
+            await self.send_json({'type': 'resync', 'cursor': self.cursor})
+            return
+        room = max(self.window, 0)
+        events = [event for event in events if event.pk not in self.seen]
+        for event in events[:room]:
+            await self.send_event(event.as_message())
+        self.paused = len(events) > room
+        if not self.paused:
+            await self.send_json({'type': 'ready', 'cursor': self.cursor})
+
+    async def send_event(self, message):
+        await self.send_json(message)
+        self.cursor = max(self.cursor, message['id'])
+        self.unacked.add(message['id'])
+        self.seen[message['id']] = None
+        if len(self.seen) > SEEN_WINDOW:
+            self.seen.popitem(last=False)
+
+    async def user_event(self, event):
+        """Live event from ``realtime.events.fan_out``"""
+        # An id below the cursor is a late commit, not a repeat, unless it was sent
+        if event['id'] in self.seen or self.paused:
+            return  # already sent, or will be replayed from the log
+        if self.window <= 0:
+            self.paused = True
+            return
+        await self.send_event({'type': 'event', 'id': event['id'], 'kind': event['kind'], 'data': event['data']})
+
+    async def receive_json(self, content, **kwargs):
+        kind = content.get('type') if isinstance(content, dict) else None
+        if kind == 'ping':
+            await self.send_json({'type': 'pong'})
+        elif kind == 'ack':
+            try:
+                acked = int(content.get('cursor'))
+            except (TypeError, ValueError):
+                return
+            self.unacked = {pk for pk in self.unacked if pk > acked}
+            if self.paused and len(self.unacked) <= settings.REALTIME_MAX_UNACKED // 2:
+                await self.catch_up()
@@ -0,0 +1,102 @@
+"""
+Per-user event log and fan-out
+
+``publish`` writes one ``UserEvent`` per recipient. After the transaction
+commits it sends each event to the recipient's channel-layer group
+(``user.<id>``), where every open ``UserEventsConsumer`` of that user
+forwards it. The id of the row is the event's cursor.
+
+The table makes delivery resumable. A client that reconnects with the
+last cursor it saw is replayed everything after it, as long as that
+cursor is still retained and the gap is at most ``REALTIME_RESUME_LIMIT``
+events. Otherwise the client is told to resync through the REST API.
+Events pushed to a client that is not keeping up are recovered the same
+way, so nothing depends on the channel layer never dropping a message.
+
+Ids are given at INSERT, but events go out when their transaction
+commits. An event can therefore commit after one with a higher id. So a
+replay also includes events created up to
+``REALTIME_REPLAY_GRACE_SECONDS`` before the cursor event. Delivery is
+at least once, and clients skip ids they have already handled.
+"""
+import logging
+from datetime import timedelta
+from typing import Iterable, List, Optional
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .models import UserEvent
+
+logger = logging.getLogger(__name__)
+
+PRUNE_BATCH_SIZE = 5000
+
+
+def user_group(user_id: int) -> str:
+    return f'user.{user_id}'
+
+
+def publish(user_ids: Iterable[Optional[int]], kind: str, data: dict) -> List[UserEvent]:
+    """Record ``kind`` for each user and push it to their open connections after commit"""
+    events = [
+        UserEvent.objects.create(user_id=user_id, kind=kind, data=data)
+        for user_id in sorted({user_id for user_id in user_ids if user_id})
+    ]
+    if events:
+        transaction.on_commit(lambda: fan_out(events))
+    return events
+
+
+def fan_out(events: List[UserEvent]):
+    """Send events to their users' groups; failures only cost latency, clients resume from the log"""
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    send = async_to_sync(layer.group_send)
+    for event in events:
+        try:
+            send(user_group(event.user_id), {
+                'type': 'user.event', 'id': event.pk, 'kind': event.kind, 'data': event.data,
+            })
+        except Exception:
+            logger.exception("Could not push event %s to user %s", event.pk, event.user_id)
+
+
+def latest_cursor(user_id: int) -> int:
+    return UserEvent.objects.filter(user_id=user_id).aggregate(latest=Max('id'))['latest'] or 0
+
+
+def events_after(user_id: int, cursor: int, limit: Optional[int] = None) -> Optional[List[UserEvent]]:
+    """
+    The user's events after ``cursor``, plus those created within the
+    replay grace before it (they may have committed late), oldest first.
+    None when the client has to resync: the cursor is no longer retained
+    (or was never theirs), or more than ``limit`` events are missing
+    """
+    limit = limit or settings.REALTIME_RESUME_LIMIT
+    after = Q(pk__gt=cursor)
+    if cursor:
+        anchor = UserEvent.objects.filter(user_id=user_id, pk=cursor).values_list('created_at', flat=True).first()
+        if anchor is None:
+            return None
+        after |= Q(created_at__gte=anchor - timedelta(seconds=settings.REALTIME_REPLAY_GRACE_SECONDS)) & ~Q(pk=cursor)
+    events = list(UserEvent.objects.filter(after, user_id=user_id).order_by('id')[:limit + 1])
+    if len(events) > limit:
+        return None
+    return events
+
+
+def prune_events() -> int:
+    """Delete events older than ``REALTIME_EVENT_RETENTION_HOURS`` in batches"""
+    cutoff = timezone.now() - timedelta(hours=settings.REALTIME_EVENT_RETENTION_HOURS)
+    deleted = 0
+    while True:
+        ids = list(UserEvent.objects.filter(created_at__lt=cutoff).order_by('id').values_list('id', flat=True)[:PRUNE_BATCH_SIZE])
+        if not ids:
+            return deleted
+        deleted += UserEvent.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,29 @@
+"""
+Models for real-time delivery
+"""
+from django.db import models
+from accounts.models import User
+
+
+class UserEvent(models.Model):
+    """
+    One event pushed to one user. The id is the cursor clients resume from,
+    so rows are kept for ``REALTIME_EVENT_RETENTION_HOURS`` (see realtime.events)
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='realtime_events')
+    kind = models.CharField(max_length=30)
+    data = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['user', 'id'], name='user_event_cursor_idx'),
+            models.Index(fields=['created_at'], name='user_event_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} for {self.user_id} (#{self.pk})"
+    
+    def as_message(self):
+        return {'type': 'event', 'id': self.pk, 'kind': self.kind, 'data': self.data}
@@ -0,0 +1,113 @@
+"""
+Signals that publish new messages, notifications and task status changes,
+and keep the unread counters (realtime.unread) in step with ``is_read``
+
+Only ``save()`` and ``delete()`` go through these; ``QuerySet.update`` and
+``bulk_create`` callers publish for themselves, and their counters are
+fixed by the repair job.
+"""
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from accounts.models import Notification
+from messages.models import Message
+from tasks.models import Task, TaskMessage
+
+from . import unread
+from .events import publish
+
+PREVIEW_LENGTH = 500
+
+
+def isoformat(value):
+    return value.isoformat() if value else None
+
+
+@receiver(post_save, sender=Message)
+def publish_message(sender, instance: Message, created, **kwargs):
+    if not created:
+        return
+    publish([instance.sender_id, instance.recipient_id], 'message', {
+        'id': instance.pk,
+        'sender': instance.sender_id,
+        'recipient': instance.recipient_id,
+        'subject': instance.subject,
+        'content': instance.content[:PREVIEW_LENGTH],
+        'message_type': instance.message_type,
+        'task': instance.task_id,
+        'parent_message': instance.parent_message_id,
+        'created_at': isoformat(instance.created_at),
+    })
+
+
+@receiver(post_save, sender=TaskMessage)
+def publish_task_message(sender, instance: TaskMessage, created, **kwargs):
+    if not created:
+        return
+    publish([instance.sender_id, instance.recipient_id], 'task_message', {
+        'id': instance.pk,
+        'task': instance.task_id,
+        'sender': instance.sender_id,
+        'recipient': instance.recipient_id,
+        'message': instance.message[:PREVIEW_LENGTH],
+        'message_type': instance.message_type,
+        'sent_at': isoformat(instance.sent_at),
+    })
+
+
+@receiver(post_save, sender=Notification)
+def publish_notification(sender, instance: Notification, created, **kwargs):
+    if not created:
+        return
+    publish([instance.user_id], 'notification', {
+        'id': instance.pk,
+        'notification_type': instance.notification_type,
+        'title': instance.title,
+        'message': instance.message[:PREVIEW_LENGTH],
+        'related_object_id': instance.related_object_id,
+        'related_object_type': instance.related_object_type,
+        'created_at': isoformat(instance.created_at),
+    })
+
+
+@receiver(post_init, sender=Task)
+def remember_task_status(sender, instance: Task, **kwargs):
+    # __dict__ so a deferred status is not loaded just for this
+    instance._published_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=Task)
+def publish_task_status(sender, instance: Task, created, **kwargs):
+    previous = getattr(instance, '_published_status', None)
+    instance._published_status = instance.status
+    if created or previous is None or previous == instance.status:
+        return
+    publish([instance.client_id, instance.assigned_expert_id], 'task_status', {
+        'id': instance.pk,
+        'title': instance.title,
+        'status': instance.status,
+        'previous_status': previous,
+        'progress_percentage': instance.progress_percentage,
+        'updated_at': isoformat(instance.updated_at),
+    })
+
+
+@receiver(post_init, sender=Message)
+@receiver(post_init, sender=TaskMessage)
+@receiver(post_init, sender=Notification)
+def remember_unread(sender, instance, **kwargs):
+    unread.remember(instance)
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_save, sender=TaskMessage)
+@receiver(post_save, sender=Notification)
+def count_unread(sender, instance, created, **kwargs):
+    unread.saved(instance, created)
+
+
+@receiver(post_delete, sender=Message)
+@receiver(post_delete, sender=TaskMessage)
+@receiver(post_delete, sender=Notification)
+def uncount_unread(sender, instance, **kwargs):
+    unread.deleted(instance)
@@ -0,0 +1,26 @@
+"""
+Celery tasks for the realtime app
+"""
+import logging
+
+from celery import shared_task
+
+from .events import prune_events
+from .unread import repair_counters
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name='realtime.tasks.prune_user_events')
+def prune_user_events():
+    """Drop events older than the resume window"""
+    deleted = prune_events()
+    if deleted:
+        logger.info("Pruned %s realtime events", deleted)
+    return deleted
+
+
+@shared_task(name='realtime.tasks.repair_unread_counters')
+def repair_unread_counters():
+    """Recompute unread counters and fix the ones that drifted"""
+    return repair_counters()
@@ -0,0 +1,111 @@
+from asgiref.sync import sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.test import TransactionTestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import User
+from marketplace.asgi import application
+
+from .consumers import CLOSE_UNAUTHORIZED
+from .events import publish
+from .models import UserEvent
+
+IN_MEMORY_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS, REALTIME_REPLAY_GRACE_SECONDS=0)
+class UserEventsConsumerTests(TransactionTestCase):
+    """``/ws/events/`` end to end: JWT handshake, live push, resume and backpressure"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='expert', email='expert@example.com', password='x')
+        self.token = str(AccessToken.for_user(self.user))
+
+    def communicator(self, **params):
+        query = '&'.join(f'{name}={value}' for name, value in {'token': self.token, **params}.items())
+        return WebsocketCommunicator(application, f'/ws/events/?{query}')
+
+    async def connect(self, **params):
+        communicator = self.communicator(**params)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def publish(self, count=1):
+        """Publish ``count`` notifications to the user; returns their ids"""
+        def create():
+            return [publish([self.user.pk], 'notification', {'n': n})[0].pk for n in range(count)]
+        return await sync_to_async(create)()
+
+    async def drain(self, communicator):
+        """Every frame sent until the connection goes quiet"""
+        frames = []
+        while not await communicator.receive_nothing(0.2):
+            frames.append(await communicator.receive_json_from())
+        return frames
+
+    async def test_rejects_missing_and_invalid_tokens(self):
+        for query in ('', 'token=not-a-jwt'):
+            communicator = WebsocketCommunicator(application, f'/ws/events/?{query}')
+            connected, code = await communicator.connect()
+            self.assertFalse(connected)
+            self.assertEqual(code, CLOSE_UNAUTHORIZED)
+
+    async def test_delivers_live_events(self):
+        communicator = await self.connect()
+        self.assertEqual(await communicator.receive_json_from(), {'type': 'ready', 'cursor': 0})
+        ids = await self.publish(2)
+        frames = await self.drain(communicator)
+        self.assertEqual([frame['id'] for frame in frames], ids)
+        self.assertEqual(frames[0], {'type': 'event', 'id': ids[0], 'kind': 'notification', 'data': {'n': 0}})
+        await communicator.disconnect()
+
+    async def test_resumes_after_cursor(self):
+        cursor, *missed = await self.publish(4)
+        communicator = await self.connect(cursor=cursor)
+        frames = await self.drain(communicator)
+        self.assertEqual([frame.get('id') for frame in frames[:-1]], missed)
+        self.assertEqual(frames[-1], {'type': 'ready', 'cursor': missed[-1]})
+        await communicator.disconnect()
+
+    @override_settings(REALTIME_REPLAY_GRACE_SECONDS=60)
+    async def test_resume_replays_late_commits_below_cursor(self):
+        late, cursor = await self.publish(2)
+        communicator = await self.connect(cursor=cursor)
+        frames = await self.drain(communicator)
+        self.assertEqual([frame.get('id') for frame in frames], [late, None])
+        self.assertEqual(frames[-1]['type'], 'ready')
+        await communicator.disconnect()
+
+    async def test_resyncs_when_cursor_was_pruned(self):
+        cursor, latest = await self.publish(2)
+        await sync_to_async(UserEvent.objects.filter(pk=cursor).delete)()
+        communicator = await self.connect(cursor=cursor)
+        self.assertEqual(await self.drain(communicator), [{'type': 'resync', 'cursor': latest}])
+        await communicator.disconnect()
+
+    @override_settings(REALTIME_RESUME_LIMIT=3)
+    async def test_resyncs_when_gap_is_too_large(self):
+        ids = await self.publish(5)
+        communicator = await self.connect(cursor=ids[0])
+        self.assertEqual(await self.drain(communicator), [{'type': 'resync', 'cursor': ids[-1]}])
+        await communicator.disconnect()
+
+    @override_settings(REALTIME_MAX_UNACKED=4)
+    async def test_pauses_until_acked(self):
+        communicator = await self.connect()
+        await communicator.receive_json_from()
+        ids = await self.publish(10)
+
+        frames = await self.drain(communicator)
+        self.assertEqual([frame['id'] for frame in frames], ids[:4])
+
+        await communicator.send_json_to({'type': 'ack', 'cursor': ids[3]})
+        frames = await self.drain(communicator)
+        self.assertEqual([frame['id'] for frame in frames], ids[4:8])
+
+        await communicator.send_json_to({'type': 'ack', 'cursor': ids[7]})
+        frames = await self.drain(communicator)
+        self.assertEqual([frame.get('id') for frame in frames[:-1]], ids[8:])
+        self.assertEqual(frames[-1], {'type': 'ready', 'cursor': ids[-1]})
+        await communicator.disconnect()
@@ -0,0 +1,165 @@
+"""
+Per-user unread counters
+
+Unread counts for notifications, messages and task messages are kept in
+the cache (Redis in production) under ``unread:<user>:<kind>``, so reading
+a badge is one ``get_many`` instead of three ``COUNT(*)`` queries.
+
+- Counters change by ``incr`` and ``decr``, after the transaction commits.
+  Changes come from ``save()`` and ``delete()`` through the signals in
+  realtime.signals. The read endpoints use a conditional ``UPDATE ...
+  WHERE is_read = false`` and adjust by the number of rows it changed, so
+  two concurrent "mark read" requests decrement only once.
+- A counter that is missing is computed with ``COUNT(*)`` on its first
+  read and then cached without expiry. If the cache is unreachable, reads
+  fall back to the database.
+- ``repair_counters`` (hourly beat task) recomputes every count with one
+  grouped query per kind. It rewrites cached counters that drifted, for
+  example through ``QuerySet.update`` calls that bypass the signals.
+"""
+import logging
+from typing import Dict, Iterable, Optional
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = 'unread'
+REPAIR_BATCH_SIZE = 1000
+
+# kind -> (model label, user id field, row filter); task messages share the
+# messages table and are told apart by channel
+COUNTERS = {
+    'notifications': ('accounts.Notification', 'user_id', {}),
+    'messages': ('messaging.Message', 'recipient_id', {'channel': 'direct'}),
+    'task_messages': ('messaging.Message', 'recipient_id', {'channel': 'task'}),
+}
+TRACKED_ATTR = '_unread_tracked'
+
+
+def cache_key(user_id: int, kind: str) -> str:
+    return f'{CACHE_PREFIX}:{user_id}:{kind}'
+
+
+def rows_for(kind: str):
+    """The counted rows of ``kind`` and their user id field"""
+    label, field, filters = COUNTERS[kind]
+    return apps.get_model(label)._base_manager.filter(**filters), field
+
+
+def kind_for(instance) -> str:
+    if instance._meta.concrete_model._meta.label == 'messaging.Message':
+        return 'task_messages' if instance.channel == 'task' else 'messages'
+    return 'notifications'
+
+
+def adjust(user_id: Optional[int], kind: str, delta: int):
+    """Move a counter by ``delta`` once the current transaction commits"""
+    if user_id and delta:
+        transaction.on_commit(lambda: _incr(user_id, kind, delta))
+
+
+def _incr(user_id: int, kind: str, delta: int):
+    try:
+        cache.incr(cache_key(user_id, kind), delta)
+    except ValueError:
+        pass  # not cached yet; the next read counts it
+    except Exception:
+        logger.warning("Could not update the %s unread counter of user %s", kind, user_id, exc_info=True)
+
+
+def count_from_db(user_id: int, kind: str) -> int:
+    rows, field = rows_for(kind)
+    return rows.filter(**{field: user_id, 'is_read': False}).count()
+
+
+def unread_counts(user_id: int) -> Dict[str, int]:
+    """Unread count per kind for one user"""
+    keys = {cache_key(user_id, kind): kind for kind in COUNTERS}
+    try:
+        cached = cache.get_many(list(keys))
+    except Exception:
+        logger.warning("Unread counters unavailable, counting in the database", exc_info=True)
+        return {kind: count_from_db(user_id, kind) for kind in COUNTERS}
+
+    counts = {}
+    for key, kind in keys.items():
+        if key in cached:
+            counts[kind] = max(int(cached[key]), 0)
+        else:
+            counts[kind] = count_from_db(user_id, kind)
+            cache.add(key, counts[kind], timeout=None)
+    return counts
+
+
+def mark_read(queryset, kind: str, user_id: int, **changes) -> int:
+    """
+    Mark the unread rows of ``queryset`` (all belonging to ``user_id``) as
+    read with one conditional UPDATE, and move the counter by exactly the
+    rows that changed
+    """
+    changed = queryset.filter(is_read=False).update(is_read=True, **changes)
+    adjust(user_id, kind, -changed)
+    return changed
+
+
+# Bookkeeping for save() and delete(), called from realtime.signals
+
+def remember(instance):
+    """Note whether a loaded row is unread; None when ``is_read`` was deferred"""
+    is_read = instance.__dict__.get('is_read')
+    setattr(instance, TRACKED_ATTR, None if is_read is None else not is_read)
+
+
+def saved(instance, created: bool):
+    kind = kind_for(instance)
+    now_unread = not instance.is_read
+    was_unread = False if created else getattr(instance, TRACKED_ATTR, None)
+    setattr(instance, TRACKED_ATTR, now_unread)
+    if was_unread is not None:
+        adjust(getattr(instance, COUNTERS[kind][1]), kind, int(now_unread) - int(was_unread))
+
+
+def deleted(instance):
+    if getattr(instance, TRACKED_ATTR, None):
+        kind = kind_for(instance)
+        adjust(getattr(instance, COUNTERS[kind][1]), kind, -1)
+
+
+def _batches(values: Iterable[int], size: int):
+    batch = []
+    for value in values:
+        batch.append(value)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def repair_counters(batch_size: int = REPAIR_BATCH_SIZE) -> int:
+    """Rewrite cached counters that disagree with the database; returns how many were fixed"""
+    totals = {}
+    for kind in COUNTERS:
+        rows, field = rows_for(kind)
+        totals[kind] = dict(rows.filter(is_read=False).order_by().values_list(field).annotate(unread=Count('id')))
+
+    fixed = 0
+    user_ids = get_user_model().objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=batch_size)
+    for batch in _batches(user_ids, batch_size):
+        expected = {
+            cache_key(user_id, kind): totals[kind].get(user_id, 0)
+            for user_id in batch for kind in COUNTERS
+        }
+        current = cache.get_many(list(expected))
+        drifted = {key: expected[key] for key, value in current.items() if int(value) != expected[key]}
+        if drifted:
+            cache.set_many(drifted, timeout=None)
+            fixed += len(drifted)
+    if fixed:
+        logger.info("Repaired %s unread counters", fixed)
+    return fixed
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, post_save
 
 
 class TasksConfig(AppConfig):
@@ -8,4 +9,9 @@ class TasksConfig(AppConfig):
 
     def ready(self):
         # Import signals
-        from . import signals  # noqa: F401
+        from . import signals
+        from .search import InvertedIndexBackend, ensure_fulltext_index, get_search_backend
+        post_migrate.connect(ensure_fulltext_index, sender=self)
+        # MySQL's FULLTEXT index maintains itself; only the inverted index needs writes on save
+        if isinstance(get_search_backend(), InvertedIndexBackend):
+            post_save.connect(signals.update_search_index, sender='tasks.Task')
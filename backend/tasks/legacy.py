@@ -0,0 +1,77 @@
+"""
+Move rows from the old task message and review tables into the unified ones
+
+``TaskMessage`` and ``TaskReview`` used to have their own tables. They
+are now proxies of ``messages.Message`` (task channel) and
+``messages.Review``. The functions here copy the old rows across in
+chunks. Each chunk is inserted with ``INSERT ... SELECT`` and then
+deleted from the old table in the same transaction, so a run can be
+interrupted and started again.
+
+Run them before the migration that drops the old tables, either with
+``manage.py merge_legacy_messages`` or from a ``RunPython`` operation
+with ``schema_editor.connection``. A review that already exists in
+``messages.Review`` for the same task and client wins over the old one.
+"""
+import logging
+from typing import Optional
+
+from django.db import connection as default_connection, transaction
+
+from messages.models import Message, Review
+
+logger = logging.getLogger(__name__)
+
+LEGACY_MESSAGE_TABLE = 'tasks_taskmessage'
+LEGACY_REVIEW_TABLE = 'tasks_taskreview'
+BATCH_SIZE = 5000
+
+
+def _move(connection, table: str, insert_sql: str, params: list, batch_size: int) -> int:
+    """Move ``table`` in id order, ``batch_size`` rows per transaction; returns rows inserted"""
+    if table not in connection.introspection.table_names():
+        return 0
+    qn = connection.ops.quote_name
+    inserted = 0
+    while True:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(f'SELECT id FROM {qn(table)} ORDER BY id LIMIT %s', [batch_size])
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                return inserted
+            placeholders = ', '.join(['%s'] * len(ids))
+            cursor.execute(insert_sql.format(ids=placeholders), params + ids)
+            inserted += max(cursor.rowcount, 0)
+            cursor.execute(f'DELETE FROM {qn(table)} WHERE id IN ({placeholders})', ids)
+        logger.info("Moved %s rows out of %s", len(ids), table)
+
+
+def move_task_messages(connection=None, batch_size: int = BATCH_SIZE) -> int:
+    connection = connection or default_connection
+    qn = connection.ops.quote_name
+    sql = (
+        f'INSERT INTO {qn(Message._meta.db_table)} '
+        '(sender_id, recipient_id, subject, content, message_type, channel, is_read, archived_at, created_at, task_id) '
+        'SELECT sender_id, recipient_id, %s, message, message_type, %s, is_read, NULL, sent_at, task_id '
+        f'FROM {qn(LEGACY_MESSAGE_TABLE)} WHERE id IN ({{ids}}) ORDER BY id'
+    )
+    return _move(connection, LEGACY_MESSAGE_TABLE, sql, ['', Message.CHANNEL_TASK], batch_size)
+
+
+def move_task_reviews(connection=None, batch_size: int = BATCH_SIZE) -> int:
+    connection = connection or default_connection
+    qn = connection.ops.quote_name
+    reviews = qn(Review._meta.db_table)
+    sql = (
+        f'INSERT INTO {reviews} (task_id, client_id, expert_id, rating, comment, is_public, created_at, updated_at) '
+        'SELECT l.task_id, l.client_id, l.expert_id, l.rating, l.comment, %s, l.created_at, l.created_at '
+        f'FROM {qn(LEGACY_REVIEW_TABLE)} l WHERE l.id IN ({{ids}}) AND NOT EXISTS ('
+        f'SELECT 1 FROM {reviews} r WHERE r.task_id = l.task_id AND r.client_id = l.client_id)'
+    )
+    return _move(connection, LEGACY_REVIEW_TABLE, sql, [True], batch_size)
+
+
+def move_legacy_rows(connection=None, batch_size: Optional[int] = None):
+    """Move both legacy tables; returns (messages inserted, reviews inserted)"""
+    batch_size = batch_size or BATCH_SIZE
+    return move_task_messages(connection, batch_size), move_task_reviews(connection, batch_size)
@@ -0,0 +1,135 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from accounts.models import User, Notification
+from ai.models import ChatSession, ChatMessage
+from messages.models import Message
+from tasks.models import Task
+
+
+BATCH_SIZE = 2000
+USERNAME_PREFIX = 'bench_'
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic dataset and print EXPLAIN plans and timings for the "
+        "querysets behind the task, notification, message and chat endpoints"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=100000, help='Number of tasks to seed')
+        parser.add_argument('--users', type=int, default=500, help='Number of clients and experts to seed')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per queryset')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded rows instead of rolling back')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            clients, experts, sessions = self.seed(options['tasks'], options['users'])
+            self.run_benchmarks(clients[0], experts[0], sessions[0], options['repeat'])
+            if not options['keep']:
+                transaction.set_rollback(True)
+                self.stdout.write(self.style.WARNING('Rolled back seeded data (use --keep to retain it)'))
+
+    def seed(self, task_count, user_count):
+        self.stdout.write(f'Seeding {user_count} clients, {user_count} experts and {task_count} tasks...')
+        now = timezone.now()
+        rng = random.Random(42)
+        run_id = int(time.time())
+
+        users = []
+        for role in ('client', 'expert'):
+            for i in range(user_count):
+                name = f'{USERNAME_PREFIX}{run_id}_{role}_{i}'
+                users.append(User(username=name, email=f'{name}@example.com', role=role))
+        User.objects.bulk_create(users, batch_size=BATCH_SIZE)
+        created = User.objects.filter(username__startswith=f'{USERNAME_PREFIX}{run_id}_')
+        clients = list(created.filter(role='client'))
+        experts = list(created.filter(role='expert'))
+
+        categories = [c[0] for c in Task.CATEGORY_CHOICES]
+        complexities = [c[0] for c in Task.COMPLEXITY_CHOICES]
+        budgets = [c[0] for c in Task.BUDGET_RANGE_CHOICES]
+        statuses = [c[0] for c in Task.STATUS_CHOICES]
+
+        tasks = []
+        for i in range(task_count):
+            status = rng.choice(statuses)
+            tasks.append(Task(
+                title=f'Benchmark task {i}',
+                description='Synthetic benchmark task',
+                category=rng.choice(categories),
+                complexity=rng.choice(complexities),
+                budget_range=rng.choice(budgets),
+                deadline=now + timedelta(days=rng.randint(-30, 60)),
+                client=rng.choice(clients),
+                assigned_expert=None if status == 'pending' else rng.choice(experts),
+                status=status,
+            ))
+        Task.objects.bulk_create(tasks, batch_size=BATCH_SIZE)
+
+        everyone = clients + experts
+        Notification.objects.bulk_create([
+            Notification(
+                user=rng.choice(everyone),
+                notification_type='system_update',
+                title='Benchmark notification',
+                message='Synthetic',
+                is_read=rng.random() < 0.8,
+            )
+            for _ in range(task_count)
+        ], batch_size=BATCH_SIZE)
+        Message.objects.bulk_create([
+            Message(
+                sender=rng.choice(everyone),
+                recipient=rng.choice(everyone),
+                content='Synthetic',
+                is_read=rng.random() < 0.8,
+            )
+            for _ in range(task_count)
+        ], batch_size=BATCH_SIZE)
+
+        ChatSession.objects.bulk_create([
+            ChatSession(user=client, session_type='general_inquiry', session_id=f'{USERNAME_PREFIX}{run_id}_{client.pk}')
+            for client in clients
+        ], batch_size=BATCH_SIZE)
+        sessions = list(ChatSession.objects.filter(session_id__startswith=f'{USERNAME_PREFIX}{run_id}_'))
+        ChatMessage.objects.bulk_create([
+            ChatMessage(session=rng.choice(sessions), role=rng.choice(['user', 'assistant']), content='Synthetic')
+            for _ in range(task_count)
+        ], batch_size=BATCH_SIZE)
+
+        return clients, experts, sessions
+
+    def querysets(self, client, expert, session):
+        tasks = Task.objects.for_listing()
+        return [
+            ('tasks: client list', tasks.filter(client=client)[:20]),
+            ('tasks: expert list', tasks.filter(assigned_expert=expert)[:20]),
+            ('tasks: status filter', tasks.filter(status='pending')[:20]),
+            ('tasks: category + status filter', tasks.filter(category='ai_ml', status='in_progress')[:20]),
+            ('tasks: complexity + budget filter', tasks.filter(complexity='complex', budget_range='above_2000')[:20]),
+            ('notifications: unread for user', Notification.objects.filter(user=client, is_read=False)[:20]),
+            ('messages: unread for recipient', Message.objects.filter(recipient=client, is_read=False)[:20]),
+            ('chat: recent session history', ChatMessage.objects.filter(session=session).order_by('-timestamp')[:10]),
+        ]
+
+    def run_benchmarks(self, client, expert, session, repeat):
+        self.stdout.write(f'Database vendor: {connection.vendor}\n')
+        for label, queryset in self.querysets(client, expert, session):
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - start) * 1000)
+            self.stdout.write(self.style.SUCCESS(
+                f'== {label}: median {statistics.median(timings):.2f} ms, max {max(timings):.2f} ms'
+            ))
+            self.stdout.write(queryset.explain())
+            self.stdout.write('')
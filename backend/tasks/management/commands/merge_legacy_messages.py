@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from realtime.unread import repair_counters
+from tasks.legacy import BATCH_SIZE, move_legacy_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Move rows from the old tasks_taskmessage and tasks_taskreview tables into "
+        "messages.Message and messages.Review; run before migrating the tables away"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows per transaction')
+
+    def handle(self, *args, **options):
+        messages, reviews = move_legacy_rows(batch_size=options['batch_size'])
+        self.stdout.write(f"Inserted {messages} task messages and {reviews} task reviews")
+        fixed = repair_counters()
+        self.stdout.write(self.style.SUCCESS(f'Done; {fixed} unread counters corrected'))
@@ -3,8 +3,49 @@ Task and Project models for Mai-Guru platform
 """
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models import Case, ExpressionWrapper, F, Prefetch, Q, Value, When
 from django.utils import timezone
 from accounts.models import User
+from messages.models import Message, Review
+
+
+CLOSED_STATUSES = ['completed', 'cancelled']
+
+
+class TaskQuerySet(models.QuerySet):
+    """
+    Query helpers for task listings
+    """
+
+    def with_deadline_annotations(self):
+        """Compute is_overdue / time_to_deadline in the database"""
+        now = timezone.now()
+        is_open = ~Q(status__in=CLOSED_STATUSES)
+        return self.annotate(
+            overdue=Case(
+                When(is_open & Q(deadline__lt=now), then=Value(True)),
+                default=Value(False),
+                output_field=models.BooleanField(),
+            ),
+            deadline_delta=Case(
+                When(is_open, then=ExpressionWrapper(
+                    F('deadline') - Value(now, output_field=models.DateTimeField()),
+                    output_field=models.DurationField(),
+                )),
+                default=None,
+                output_field=models.DurationField(),
+            ),
+        )
+
+    def for_listing(self):
+        """
+        Queryset shape used by every task list endpoint: related users are
+        joined, files are prefetched with their uploader and deadline fields
+        are annotated, so serializing a page costs a fixed number of queries.
+        """
+        return self.select_related('client', 'assigned_expert').prefetch_related(
+            Prefetch('files', queryset=TaskFile.objects.select_related('uploaded_by'))
+        ).with_deadline_annotations()
 
 
 class Task(models.Model):
@@ -75,19 +116,36 @@ class Task(models.Model):
     client_requirements = models.JSONField(default=dict, blank=True)
     expert_notes = models.TextField(blank=True)
     
+    objects = TaskQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
+        # Mirror TaskViewSet access paths: one filter column, newest first
+        indexes = [
+            models.Index(fields=['client', '-created_at'], name='task_client_created_idx'),
+            models.Index(fields=['assigned_expert', '-created_at'], name='task_expert_created_idx'),
+            models.Index(fields=['status', '-created_at'], name='task_status_created_idx'),
+            models.Index(fields=['category', 'status', '-created_at'], name='task_cat_status_created_idx'),
+            models.Index(fields=['complexity', 'budget_range', '-created_at'], name='task_cplx_budget_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.client.username}"
     
     def is_overdue(self):
-        return self.deadline < timezone.now() and self.status not in ['completed', 'cancelled']
+        if self.status in CLOSED_STATUSES:
+            return False
+        # Prefer the value annotated by TaskQuerySet.with_deadline_annotations()
+        if getattr(self, 'overdue', None) is not None:
+            return self.overdue
+        return self.deadline < timezone.now()
     
     def time_to_deadline(self):
-        if self.status in ['completed', 'cancelled']:
+        if self.status in CLOSED_STATUSES:
             return None
-        delta = self.deadline - timezone.now()
+        delta = getattr(self, 'deadline_delta', None)
+        if delta is None:
+            delta = self.deadline - timezone.now()
         if delta.total_seconds() < 0:
             return "Overdue"
         return delta
@@ -148,6 +206,24 @@ class TaskFile(models.Model):
         return f"{self.original_filename} - {self.task.title}"
 
 
+class TaskSearchTerm(models.Model):
+    """
+    Inverted index entry: one row per (task, term), maintained by tasks.search
+    """
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='search_terms')
+    term = models.CharField(max_length=64)
+    weight = models.PositiveIntegerField(default=1)
+    
+    class Meta:
+        unique_together = ['task', 'term']
+        indexes = [
+            models.Index(fields=['term', 'task', 'weight'], name='tasksearch_term_task_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.term} -> task {self.task_id} ({self.weight})"
+
+
 class TaskSubmission(models.Model):
     """
     Expert submissions for tasks
@@ -169,48 +245,59 @@ class TaskSubmission(models.Model):
         return f"Submission for {self.task.title} by {self.expert.username}"
 
 
-class TaskMessage(models.Model):
+class TaskMessageManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().filter(channel=Message.CHANNEL_TASK)
+
+
+class TaskMessage(Message):
     """
     Messages between clients and experts for tasks
+
+    Stored as ``messages.Message`` rows on the task channel, so a task's
+    thread is one range scan of ``msg_task_thread_idx``. ``message`` and
+    ``sent_at`` are the fields this model used to have, kept as aliases of
+    ``content`` and ``created_at``.
     """
-    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='messages')
-    sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
-    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_messages')
-    message = models.TextField()
-    is_read = models.BooleanField(default=False)
-    sent_at = models.DateTimeField(auto_now_add=True)
-    message_type = models.CharField(max_length=20, choices=[
+    TASK_MESSAGE_TYPES = [
         ('general', 'General'),
         ('question', 'Question'),
         ('update', 'Update'),
         ('feedback', 'Feedback'),
         ('urgent', 'Urgent'),
-    ], default='general')
-    
+    ]
+
+    objects = TaskMessageManager()
+
     class Meta:
-        ordering = ['sent_at']
-    
-    def __str__(self):
-        return f"Message from {self.sender.username} to {self.recipient.username}"
+        proxy = True
+        ordering = ['created_at']
 
+    def save(self, *args, **kwargs):
+        self.channel = Message.CHANNEL_TASK
+        super().save(*args, **kwargs)
 
-class TaskReview(models.Model):
+    @property
+    def message(self):
+        return self.content
+
+    @message.setter
+    def message(self, value):
+        self.content = value
+
+    @property
+    def sent_at(self):
+        return self.created_at
+
+
+class TaskReview(Review):
     """
-    Client reviews for completed tasks
+    Client reviews for completed tasks, stored as ``messages.Review`` rows
     """
-    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='reviews')
-    client = models.ForeignKey(User, on_delete=models.CASCADE, related_name='given_reviews')
-    expert = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_reviews')
-    rating = models.PositiveIntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
-    comment = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
-    
+
     class Meta:
-        unique_together = ['task', 'client']
+        proxy = True
         ordering = ['-created_at']
-    
-    def __str__(self):
-        return f"Review for {self.task.title} - {self.rating} stars"
 
 
 class TaskDispute(models.Model):
@@ -0,0 +1,230 @@
+"""
+Full-text search for tasks
+
+Two backends share one DRF filter:
+
+* ``InvertedIndexBackend`` reads the ``TaskSearchTerm`` table, which is kept
+  up to date incrementally whenever a task's title or description changes
+  (the signal is only connected when this backend is in use). It works on
+  every database and is what the SQLite dev setup uses.
+* ``MySQLFullTextBackend`` uses a FULLTEXT index on (title, description),
+  created after ``migrate`` by ``ensure_fulltext_index``.
+
+Both return matches ranked by relevance, with the last query word treated as
+a prefix so results keep up with the frontend search box as the user types.
+"""
+import logging
+import math
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Task, TaskSearchTerm
+
+logger = logging.getLogger(__name__)
+
+TITLE_WEIGHT = 3
+DESCRIPTION_WEIGHT = 1
+MAX_TERM_LENGTH = 64
+MAX_QUERY_TERMS = 8
+TASK_COUNT_CACHE_KEY = 'task_search:task_count'
+FULLTEXT_INDEX_NAME = 'task_title_desc_ft'
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have i in into is it its me my of on or
+our so that the their this to was we will with you your
+""".split())
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    """Lower-case word tokens with stopwords and 1-character noise removed"""
+    return [
+        token[:MAX_TERM_LENGTH]
+        for token in TOKEN_RE.findall((text or '').lower())
+        if len(token) > 1 and token not in STOPWORDS
+    ]
+
+
+def term_weights(task):
+    """Map each indexed term of a task to its weighted frequency"""
+    weights = {}
+    for token in tokenize(task.title):
+        weights[token] = weights.get(token, 0) + TITLE_WEIGHT
+    for token in tokenize(task.description):
+        weights[token] = weights.get(token, 0) + DESCRIPTION_WEIGHT
+    return weights
+
+
+def parse_query(query):
+    """
+    Split a search string into whole terms and an optional trailing prefix.
+    The prefix is only used when the user has not finished typing the word.
+    """
+    tokens = TOKEN_RE.findall((query or '').lower())[:MAX_QUERY_TERMS]
+    if not tokens:
+        return [], None
+    prefix = None
+    if not query[-1:].isspace():
+        prefix = tokens.pop()[:MAX_TERM_LENGTH]
+        if len(prefix) < 2:
+            prefix = None
+    terms = [t[:MAX_TERM_LENGTH] for t in tokens if len(t) > 1 and t not in STOPWORDS]
+    return list(dict.fromkeys(terms)), prefix
+
+
+@transaction.atomic
+def index_task(task):
+    """Bring the inverted index for one task in line with its current text"""
+    wanted = term_weights(task)
+    existing = {
+        row.term: row
+        for row in TaskSearchTerm.objects.filter(task=task)
+    }
+
+    stale = [term for term in existing if term not in wanted]
+    if stale:
+        TaskSearchTerm.objects.filter(task=task, term__in=stale).delete()
+
+    changed = []
+    for term, weight in wanted.items():
+        row = existing.get(term)
+        if row is not None and row.weight != weight:
+            row.weight = weight
+            changed.append(row)
+    if changed:
+        TaskSearchTerm.objects.bulk_update(changed, ['weight'])
+
+    added = [
+        TaskSearchTerm(task=task, term=term, weight=weight)
+        for term, weight in wanted.items()
+        if term not in existing
+    ]
+    if added:
+        TaskSearchTerm.objects.bulk_create(added)
+
+
+def rebuild_index(batch_size=500):
+    """Re-index every task; returns the number of tasks processed"""
+    count = 0
+    for task in Task.objects.only('id', 'title', 'description').iterator(chunk_size=batch_size):
+        index_task(task)
+        count += 1
+    cache.delete(TASK_COUNT_CACHE_KEY)
+    return count
+
+
+def ensure_fulltext_index(sender=None, using='default', **kwargs):
+    """post_migrate hook: create the MySQL FULLTEXT index if it is missing"""
+    if connection.vendor != 'mysql':
+        return
+    table = Task._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s",
+            [table, FULLTEXT_INDEX_NAME],
+        )
+        if cursor.fetchone()[0]:
+            return
+        logger.info("Creating FULLTEXT index %s on %s", FULLTEXT_INDEX_NAME, table)
+        cursor.execute(f"CREATE FULLTEXT INDEX {FULLTEXT_INDEX_NAME} ON {table} (title, description)")
+
+
+class InvertedIndexBackend:
+    """TF-IDF style ranking over the TaskSearchTerm table"""
+
+    def search(self, queryset, query):
+        terms, prefix = parse_query(query)
+        if not terms and not prefix:
+            return queryset
+
+        match = Q(term__in=terms)
+        if prefix:
+            match |= Q(term__startswith=prefix)
+
+        score = self.score_expression(terms, prefix)
+        rank = TaskSearchTerm.objects.filter(match, task=OuterRef('pk')).values('task').annotate(
+            rank=Sum(score)
+        ).values('rank')
+
+        matched_ids = TaskSearchTerm.objects.filter(match).values('task')
+        return queryset.filter(pk__in=matched_ids).annotate(
+            search_rank=Subquery(rank, output_field=FloatField())
+        )
+
+    def score_expression(self, terms, prefix):
+        total = self.task_count()
+        frequencies = dict(
+            TaskSearchTerm.objects.filter(term__in=terms).values_list('term').annotate(df=Count('task'))
+        ) if terms else {}
+
+        def idf(df):
+            return math.log(1 + total / max(df, 1))
+
+        whens = [
+            When(term=term, then=F('weight') * Value(idf(frequencies.get(term, 0))))
+            for term in terms
+        ]
+        if prefix:
+            # Prefix matches get a flat, low weight so completed words rank higher
+            whens.append(When(term__startswith=prefix, then=F('weight') * Value(idf(total) + 0.5)))
+        return Case(*whens, default=Value(0.0), output_field=FloatField())
+
+    def task_count(self):
+        total = cache.get(TASK_COUNT_CACHE_KEY)
+        if total is None:
+            total = Task.objects.count()
+            cache.set(TASK_COUNT_CACHE_KEY, total, 300)
+        return max(total, 1)
+
+
+class MySQLFullTextBackend:
+    """MATCH ... AGAINST over the FULLTEXT(title, description) index"""
+
+    def search(self, queryset, query):
+        terms, prefix = parse_query(query)
+        if not terms and not prefix:
+            return queryset
+        words = terms + ([f'{prefix}*'] if prefix else [])
+        expression = ' '.join(words)
+        table = Task._meta.db_table
+        match_sql = f"MATCH({table}.title, {table}.description) AGAINST (%s IN BOOLEAN MODE)"
+        # Filtering on the annotation puts MATCH(...) > 0 in the WHERE clause, which uses the index
+        return queryset.annotate(
+            search_rank=RawSQL(match_sql, (expression,), output_field=FloatField())
+        ).filter(search_rank__gt=0)
+
+
+def get_search_backend():
+    """Pick the backend from TASK_SEARCH_BACKEND or the database vendor"""
+    name = getattr(settings, 'TASK_SEARCH_BACKEND', None)
+    if name is None:
+        name = 'mysql' if connection.vendor == 'mysql' else 'inverted_index'
+    if name == 'mysql':
+        return MySQLFullTextBackend()
+    return InvertedIndexBackend()
+
+
+class TaskSearchFilter(BaseFilterBackend):
+    """
+    Relevance-ranked task search driven by the ``search`` query parameter.
+    Results are ordered by rank unless the request sets ``ordering``.
+    """
+    search_param = 'search'
+    ordering_param = 'ordering'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        queryset = get_search_backend().search(queryset, query)
+        if 'search_rank' in queryset.query.annotations and not request.query_params.get(self.ordering_param):
+            queryset = queryset.order_by('-search_rank', '-created_at')
+        return queryset
@@ -89,14 +89,34 @@ class TaskMessageSerializer(serializers.ModelSerializer):
     sender_name = serializers.CharField(source='sender.get_full_name', read_only=True)
     recipient_name = serializers.CharField(source='recipient.get_full_name', read_only=True)
     message_type_display = serializers.CharField(source='get_message_type_display', read_only=True)
+    message = serializers.CharField(source='content')
+    sent_at = serializers.DateTimeField(source='created_at', read_only=True)
+    message_type = serializers.ChoiceField(choices=TaskMessage.TASK_MESSAGE_TYPES, default='general')
     
     class Meta:
         model = TaskMessage
         fields = [
             'id', 'task', 'sender', 'sender_name', 'recipient', 'recipient_name',
-            'message', 'is_read', 'sent_at', 'message_type', 'message_type_display'
+            'message', 'is_read', 'read_at', 'archived_at', 'sent_at', 'message_type', 'message_type_display'
         ]
-        read_only_fields = ['id', 'sender', 'sent_at']
+        read_only_fields = ['id', 'sender', 'is_read', 'read_at', 'archived_at']
+        extra_kwargs = {'task': {'required': True, 'allow_null': False}}
+
+    def validate(self, attrs):
+        # Only the client and the assigned expert can write on a task, and only to each other
+        user = self.context['request'].user
+        if self.instance is not None and self.instance.sender_id != user.pk:
+            raise serializers.ValidationError("You can only edit messages you sent")
+        task = attrs.get('task', getattr(self.instance, 'task', None))
+        recipient = attrs.get('recipient', getattr(self.instance, 'recipient', None))
+        if task is None:
+            raise serializers.ValidationError({'task': 'This field is required.'})
+        if user.pk not in (task.client_id, task.assigned_expert_id):
+            raise serializers.ValidationError({'task': "You are not a party to this task"})
+        other = task.assigned_expert_id if user.pk == task.client_id else task.client_id
+        if recipient is None or other is None or recipient.pk != other:
+            raise serializers.ValidationError({'recipient': "Recipient must be the other party on the task"})
+        return attrs
 
 
 class TaskReviewSerializer(serializers.ModelSerializer):
@@ -3,18 +3,9 @@ from django.dispatch import receiver
 from django.utils import timezone
 
 from .models import Task
+from .search import index_task
 from payments.models import Invoice
-
-
-def budget_to_amount(budget_range: str) -> float:
-    mapping = {
-        'less_100': 75,
-        '100_500': 300,
-        '501_1000': 750,
-        '1001_2000': 1500,
-        'above_2000': 2500,
-    }
-    return float(mapping.get(budget_range, 300))
+from payments.money import budget_amount, quantize
 
 
 @receiver(post_save, sender=Task)
@@ -25,7 +16,8 @@ def create_invoice_on_completion(sender, instance: Task, created, **kwargs):
 
     # Generate invoice when a task transitions to completed and no invoice exists
     if instance.status == 'completed' and not hasattr(instance, 'invoice'):
-        amount = instance.final_price or instance.estimated_price or instance.ai_suggested_price or budget_to_amount(instance.budget_range)
+        amount = instance.final_price or instance.estimated_price or instance.ai_suggested_price or budget_amount(instance.budget_range)
+        amount = quantize(amount, 'USD')
         due_date = instance.deadline if instance.deadline else timezone.now() + timezone.timedelta(days=7)
 
         Invoice.objects.create(
@@ -38,3 +30,11 @@ def create_invoice_on_completion(sender, instance: Task, created, **kwargs):
             description=f"Invoice for task '{instance.title}'",
             line_items=[{"description": instance.title, "amount": float(amount)}],
         )
+
+
+def update_search_index(sender, instance: Task, created, update_fields=None, **kwargs):
+    """Connected in TasksConfig.ready only when the inverted index is the search backend"""
+    # Status/progress updates pass update_fields and never touch the text
+    if update_fields is not None and not {'title', 'description'} & set(update_fields):
+        return
+    index_task(instance)
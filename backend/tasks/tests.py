@@ -0,0 +1,63 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from .models import Task, TaskFile
+
+
+class TaskListQueryCountTests(TestCase):
+    """Listing tasks costs the same number of queries whatever the page holds"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = User.objects.create_user(
+            username='client', email='client@example.com', password='x', first_name='Cli', last_name='Ent'
+        )
+        cls.expert = User.objects.create_user(
+            username='expert', email='expert@example.com', password='x', first_name='Ex', last_name='Pert'
+        )
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(self.client_user)
+
+    def create_tasks(self, count):
+        now = timezone.now()
+        for i in range(Task.objects.count(), count):
+            task = Task.objects.create(
+                title=f'Task {i}', description='d', category='ai_ml', complexity='simple',
+                budget_range='100_500', deadline=now + timedelta(days=i - 3),
+                client=self.client_user, assigned_expert=self.expert,
+            )
+            TaskFile.objects.create(
+                task=task, file='task_files/brief.pdf', original_filename='brief.pdf', file_size=1,
+                file_type='application/pdf', uploaded_by=self.expert,
+            )
+
+    def list_queries(self, count):
+        self.create_tasks(count)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.get('/api/tasks/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], count)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.assertEqual(self.list_queries(5), self.list_queries(25))
+
+    def test_page_is_fully_serialized(self):
+        queries = self.list_queries(1)
+        self.create_tasks(25)
+        with self.assertNumQueries(queries):
+            response = self.api.get('/api/tasks/')
+        row = response.data['results'][0]
+        self.assertEqual(row['client_name'], 'Cli Ent')
+        self.assertEqual(row['assigned_expert_name'], 'Ex Pert')
+        self.assertEqual(row['files'][0]['uploaded_by_name'], 'Ex Pert')
+        self.assertIsNotNone(row['is_overdue'])
+        self.assertIsNotNone(row['time_to_deadline'])
@@ -1,26 +1,33 @@
 # tasks/views.py
 
-from rest_framework import generics, permissions, filters, status
+from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.permissions import IsAdminUser
 from rest_framework.viewsets import ModelViewSet
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.filters import OrderingFilter
 from django.contrib.auth import get_user_model
 from django.db import models
-from .serializers import TaskSerializer
-from .models import Task
+from marketplace.pagination import PageNumberOrKeysetPagination
+from messages import bulk
+from messages.views import BulkMessageActionsMixin
+from .serializers import TaskMessageSerializer, TaskSerializer
+from .models import Task, TaskMessage
+from .search import TaskSearchFilter
 
 # Add TaskListView and its filters
 class TaskListView(generics.ListAPIView):
     queryset = Task.objects.all().order_by('-created_at')
     serializer_class = TaskSerializer
-    filter_backends = [DjangoFilterBackend, OrderingFilter, SearchFilter]
+    filter_backends = [DjangoFilterBackend, TaskSearchFilter, OrderingFilter]
     filterset_fields = ['category', 'budget_range', 'complexity']
-    search_fields = ['description', 'client']
     ordering_fields = ['created_at', 'budget_range', 'complexity']
 
+    def get_queryset(self):
+        # Built per request: the deadline annotations depend on "now"
+        return Task.objects.for_listing().order_by('-created_at')
+
 # Add the bulk_delete_tasks view
 @api_view(['POST'])
 @permission_classes([IsAdminUser])
@@ -47,35 +54,40 @@ class ClientTaskListView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Task.objects.filter(client=self.request.user)
+        return Task.objects.for_listing().filter(client=self.request.user)
 
 # Admin view: filter by category
 class AdminTaskListView(generics.ListAPIView):
     serializer_class = TaskSerializer
     permission_classes = [permissions.IsAdminUser]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    pagination_class = PageNumberOrKeysetPagination
+    filter_backends = [DjangoFilterBackend, TaskSearchFilter]
     filterset_fields = ["category","status"]
     queryset = Task.objects.all()
 
+    def get_queryset(self):
+        return Task.objects.for_listing()
+
 # Task management endpoints
 class TaskViewSet(ModelViewSet):
     queryset = Task.objects.all()
     serializer_class = TaskSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, OrderingFilter]
+    pagination_class = PageNumberOrKeysetPagination
+    filter_backends = [DjangoFilterBackend, TaskSearchFilter, OrderingFilter]
     filterset_fields = ['category', 'status', 'complexity', 'budget_range']
-    search_fields = ['title', 'description']
     ordering_fields = ['created_at', 'deadline', 'budget_range']
 
     def get_queryset(self):
         user = self.request.user
+        queryset = Task.objects.for_listing()
         if user.is_staff:
-            return Task.objects.all()
+            return queryset
         if getattr(user, 'role', None) == 'expert':
-            return Task.objects.filter(
+            return queryset.filter(
                 models.Q(assigned_expert=user)
             )
-        return Task.objects.filter(client=user)
+        return queryset.filter(client=user)
 
     def perform_create(self, serializer):
         serializer.save(client=self.request.user)
@@ -176,4 +188,24 @@ class TaskViewSet(ModelViewSet):
             return Response(
                 {"error": str(e)},
                 status=status.HTTP_400_BAD_REQUEST
-            )
\ No newline at end of file
+            )
+
+
+class TaskMessageViewSet(BulkMessageActionsMixin, ModelViewSet):
+    """Messages on the user's tasks (``?task=<id>`` for one thread), with bulk read/archive/delete"""
+    serializer_class = TaskMessageSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PageNumberOrKeysetPagination
+    bulk_store = bulk.TASK_MESSAGES
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = TaskMessage.objects.filter(models.Q(sender=user) | models.Q(recipient=user))
+        task = self.request.query_params.get('task')
+        if task and task.isdigit():
+            # One task's thread: a range scan of msg_task_thread_idx
+            queryset = queryset.filter(task_id=task)
+        return self.filter_archived(queryset)
+
+    def perform_create(self, serializer):
+        serializer.save(sender=self.request.user)
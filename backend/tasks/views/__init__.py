@@ -1,11 +0,0 @@
-# Import all views from the parent views.py file
-from ..views import *
-
-from ..views import (
-    TaskCreateView,
-    ClientTaskListView,
-    AdminTaskListView,
-    TaskListView,
-    bulk_delete_tasks,
-    TaskViewSet
-)
\ No newline at end of file